@@ -3,36 +3,182 @@ import findspark
 
 findspark.init()
 
+import argparse
 import logging
+import time
 
-from pyspark.sql import SparkSession
+from pyspark.sql import DataFrame, SparkSession
 from pyspark.sql.functions import col, row_number
 from pyspark.sql.window import Window
 
-from utils.helper import extract_data, load_data_to_csv, read_config
+from utils.cache import CacheManager
+from utils.fused import FusedAnalysisPlan
+from utils.helper import read_config
+from utils.incremental import IncrementalAnalysisPlan, IncrementalState
+from utils.ingest import load_input
+from utils.licenses import LICENSE_TABLES, license_index_df, without_unlicensed
+from utils.local import LocalAnalysisPlan, select_backend
+from utils.planner import (
+    PERSON_UNITS_PERSON_COLUMNS,
+    PERSON_UNITS_UNITS_COLUMNS,
+    prune,
+)
+from utils.predicates import (
+    has_liability_insurance,
+    is_alcohol_related,
+    is_damage_above_4,
+    is_female,
+    is_known_body_style,
+    is_known_color,
+    is_known_ethnicity,
+    is_known_make,
+    is_licensed_driver,
+    is_male,
+    is_no_damaged_property,
+    is_speeding_charge,
+    is_state_code,
+    is_two_wheeler,
+)
+from utils.profiling import AnalysisProfiler
+from utils.registry import ALL_ANALYSES, DERIVED_INPUTS, run_analysis
+from utils.results import ResultCache
+from utils.scheduler import AnalysisScheduler
+from utils.server import AnalysisServer
+from utils.skew import SkewHandler
+from utils.streaming import StreamingAnalysis
+from utils.topk import TopK
+from utils.writer import OutputWriter
 
 
 class CarCrashAnalysis:
     """Car Crash Analysis class for analysing US Vehicle Car Crash dataset"""
 
-    def __init__(self, path_to_config_file):
-        """Read All the CSV files in Data folder which has the car crash info"""
-        self.input_file_paths = read_config(path_to_config_file).get("INPUT")
-
-        self.Primary_person_use_df = extract_data(
-            spark, self.input_file_paths.get("Primary_Person")
+    def __init__(self, path_to_config_file, input_file_paths=None, analyses=None):
+        """
+        Read All the CSV files in Data folder which has the car crash info.
+        input_file_paths replaces the INPUT section, e.g. with the files of
+        an incremental batch, which are read once without the ingest stage.
+        Tables are only read when an analysis first uses them, restricted to
+        the columns and rows the analyses (EXECUTION.analyses by default)
+        declare, and cached while more than one of them still needs them.
+        """
+        config = read_config(path_to_config_file)
+        self.spark = spark
+        self.input_file_paths = input_file_paths or config.get("INPUT")
+        self.ingest_config = None if input_file_paths else config.get("INGEST")
+        # Categorical column dictionaries of the tables loaded so far
+        self.dictionaries = {}
+        # Input table -> column -> allowed values, e.g. set per server request
+        self.filters = {}
+        self.writer = OutputWriter(config.get("WRITER"), config.get("OUTPUT"))
+        self.skew = SkewHandler(config.get("SKEW"))
+        profiling_config = config.get("PROFILING") or {}
+        self.profiler = (
+            AnalysisProfiler(spark, profiling_config)
+            if profiling_config.get("enabled", False)
+            else None
+        )
+        self.analyses = list(
+            analyses or (config.get("EXECUTION") or {}).get("analyses") or ALL_ANALYSES
+        )
+        self.cache_manager = CacheManager(spark, config.get("CACHE"), self.writer)
+        self.result_cache = ResultCache(
+            config.get("RESULT_CACHE"), self.input_file_paths
+        )
+        self.top_k = TopK(config.get("TOP_K"))
+        self.validate_licensed_drivers = (config.get("LICENSES") or {}).get(
+            "validate_licensed_drivers", False
+        )
+        self.cache_manager.plan(self.analyses)
+
+    def _load(self, table_name):
+        """Input table with the columns and filters of the analyses pushed
+        into the scan, recording the dictionaries of its categorical columns"""
+        df, dictionaries = load_input(
+            spark,
+            table_name,
+            self.input_file_paths.get(table_name),
+            self.ingest_config,
+        )
+        self.dictionaries.update(dictionaries)
+        return prune(df, table_name, self.analyses, self.dictionaries)
+
+    def _input(self, table_name):
+        """Input table, read on first use and narrowed by the filters"""
+        df = self.cache_manager.get(table_name, lambda: self._load(table_name))
+        for column_name, values in self.filters.get(table_name, {}).items():
+            df = df.filter(col(column_name).isin(values))
+        return df
+
+    def _derived_input(self, name, parents, build):
+        """Input built from other inputs, shared through the cache manager
+        unless the filters narrow one of its parents"""
+        if any(self.filters.get(parent) for parent in parents):
+            return build()
+        return self.cache_manager.get(name, build)
+
+    @property
+    def Primary_person_use_df(self):
+        return self._input("Primary_Person")
+
+    @property
+    def Units_use_df(self):
+        return self._input("Units")
+
+    @property
+    def Damages_use_df(self):
+        return self._input("Damages")
+
+    @property
+    def Charges_use_df(self):
+        return self._input("Charges")
+
+    @property
+    def person_units_use_df(self):
+        """
+        Primary_Person joined with Units on CRASH_ID, narrowed to the columns
+        analyses 5 and 6 read. It is built on first use, materialised once
+        and shared instead of every analysis shuffling its own join.
+        """
+        return self._derived_input(
+            "Person_Units",
+            DERIVED_INPUTS["Person_Units"],
+            lambda: self.skew.join(
+                self.Primary_person_use_df.select(*PERSON_UNITS_PERSON_COLUMNS),
+                self.Units_use_df.select(*PERSON_UNITS_UNITS_COLUMNS),
+                "CRASH_ID",
+                how="inner",
+            ),
         )
-        self.Primary_person_use_df.cache()
-
-        self.Units_use_df = extract_data(spark, self.input_file_paths.get("Units"))
-        self.Units_use_df.cache()
 
-        self.Damages_use_df = extract_data(spark, self.input_file_paths.get("Damages"))
-        self.Damages_use_df.cache()
+    @property
+    def license_index_use_df(self):
+        """
+        Endorse and Restrict pre-aggregated into one licence status row per
+        (CRASH_ID, UNIT_NBR), built on first use
+        """
+        return self._derived_input(
+            "License_Index",
+            LICENSE_TABLES,
+            lambda: license_index_df(self._input("Endorse"), self._input("Restrict")),
+        )
 
-        self.Charges_use_df = extract_data(spark, self.input_file_paths.get("Charges"))
-        # self.df_endorse = extract_data(spark, self.input_file_paths.get("Endorse"))
-        # self.df_restrict = extract_data(spark, self.input_file_paths.get("Restrict"))
+    def licensed_drivers_df(self):
+        """
+        Persons with a driver licence type. With LICENSES.validate_licensed_drivers,
+        persons whose unit Endorse or Restrict records as unlicensed are
+        dropped too, when those tables are part of the inputs.
+        """
+        drivers_df = self.Primary_person_use_df.filter(
+            is_licensed_driver(self.dictionaries)
+        )
+        if self.validate_licensed_drivers and all(
+            self.input_file_paths.get(table_name) for table_name in LICENSE_TABLES
+        ):
+            drivers_df = without_unlicensed(
+                drivers_df, self.license_index_use_df, self.skew
+            )
+        return drivers_df
 
     def male_car_crash_analysis(self, output_path):
         """Method to analyze number of accidents involving males"""
@@ -41,14 +187,14 @@ class CarCrashAnalysis:
 
         # Filtering the DF where gender is Male
         male_car_crash_df = self.Primary_person_use_df.filter(
-            col("PRSN_GNDR_ID") == "MALE"
+            is_male(self.dictionaries)
         )
 
-        # Number of crashes in which person killed is Male
-        male_car_crash_count = male_car_crash_df.count()
-
-        # Load output to CSV output in parquet format
-        load_data_to_csv(male_car_crash_df, output_path)
+        # Number of crashes in which person killed is Male, counted from the
+        # same cached rows that are then written to the output in parquet format
+        male_car_crash_count = self.writer.save(
+            male_car_crash_df, output_path, result=DataFrame.count
+        )
         return male_car_crash_count
 
     def two_wheeler_crash_analysis(self, output_path):
@@ -62,17 +208,14 @@ class CarCrashAnalysis:
 
         # Filtering the DF where vehicle body type is Motorcycle (2 wheeler)
         two_wheeler_crash_df = self.Units_use_df.filter(
-            (
-                col("VEH_BODY_STYL_ID").like("%MOTORCYCLE%")
-                | (col("UNIT_DESC_ID") == "PEDALCYCLIST")
-            )
+            is_two_wheeler(self.dictionaries)
         )
 
-        # Number of two wheelers booked for crashes
-        two_wheeler_crash_count = two_wheeler_crash_df.count()
-
-        # Load output to CSV output in parquet format
-        load_data_to_csv(two_wheeler_crash_df, output_path)
+        # Number of two wheelers booked for crashes, counted from the same
+        # cached rows that are then written to the output in parquet format
+        two_wheeler_crash_count = self.writer.save(
+            two_wheeler_crash_df, output_path, result=DataFrame.count
+        )
         return two_wheeler_crash_count
 
     def female_car_crash_analysis(self, output_path):
@@ -80,20 +223,22 @@ class CarCrashAnalysis:
         Method to analyze state that has the highest number of accidents
         involving females
         """
-        # State wise accidents with gender filtered tp 'female'
-        accident_info_df = (
-            self.Primary_person_use_df.filter(col("PRSN_GNDR_ID") == "FEMALE")
-            .groupBy(col("DRVR_LIC_STATE_ID"))
-            .count()
-            .orderBy(col("count").desc())
+        # State wise accidents with gender filtered tp 'female', ranked by
+        # count
+        accident_info = self.top_k.counts(
+            self.Primary_person_use_df.filter(is_female(self.dictionaries)),
+            "DRVR_LIC_STATE_ID",
         )
         # accident_info_df.show(10)
 
-        # State with highest number of accidents
-        state_with_most_accidents = accident_info_df.first()["DRVR_LIC_STATE_ID"]
-
-        # Load output to CSV output in parquet format
-        load_data_to_csv(accident_info_df, output_path)
+        # State with highest number of accidents, output written in parquet format
+        self.writer.save(
+            self.spark.createDataFrame(
+                accident_info, "DRVR_LIC_STATE_ID string, count long"
+            ),
+            output_path,
+        )
+        state_with_most_accidents = accident_info[0]["DRVR_LIC_STATE_ID"]
         return state_with_most_accidents
 
     def vehicle_make_crash_analysis(self, output_path):
@@ -101,41 +246,44 @@ class CarCrashAnalysis:
         Method to analyze vehicle makes from top5 to 15 that
         contributes to largest number of injuries including death
         """
-        injury_and_vehicle_info_df = (
-            self.Units_use_df.select(
-                col("CRASH_ID"),
-                col("VEH_MAKE_ID"),
-                col("TOT_INJRY_CNT"),
-                col("DEATH_CNT"),
-            )
-            .withColumn(
-                "ALL_INJURIES",
-                self.Units_use_df["TOT_INJRY_CNT"] + self.Units_use_df["DEATH_CNT"],
-            )
-            .orderBy(col("ALL_INJURIES").desc())
+        parameters = self.top_k.parameters("analysis_4")
+        injury_and_vehicle_info_df = self.Units_use_df.select(
+            col("CRASH_ID"),
+            col("VEH_MAKE_ID"),
+            col("TOT_INJRY_CNT"),
+            col("DEATH_CNT"),
+        ).withColumn(
+            "ALL_INJURIES",
+            self.Units_use_df["TOT_INJRY_CNT"] + self.Units_use_df["DEATH_CNT"],
         )
 
         # injury_and_vehicle_info_df.show(10)
 
         vehicle_wise_injuries_df = (
-            injury_and_vehicle_info_df.filter(
-                injury_and_vehicle_info_df["VEH_MAKE_ID"] != "NA"
-            )
+            injury_and_vehicle_info_df.filter(is_known_make(self.dictionaries))
             .groupBy("VEH_MAKE_ID")
             .sum("ALL_INJURIES")
             .withColumnRenamed("sum(ALL_INJURIES)", "total_injuries")
-            .orderBy(col("total_injuries").desc())
-            .limit(15)
+        )
+        # Top 15 makes, from the best rows of every partition
+        vehicle_wise_injuries = self.top_k.rank(
+            vehicle_wise_injuries_df,
+            "total_injuries",
+            parameters["offset"] + parameters["k"],
         )
         # vehicle_wise_injuries_df.show()
+        # Load output to CSV output in parquet format
+        self.writer.save(
+            self.spark.createDataFrame(
+                vehicle_wise_injuries, "VEH_MAKE_ID string, total_injuries long"
+            ),
+            output_path,
+        )
         # Filtering from 5 to 15 rows
-        vehicle_wise_injuries_df_5_to_15 = vehicle_wise_injuries_df.tail(11)
+        vehicle_wise_injuries_df_5_to_15 = vehicle_wise_injuries[parameters["offset"] :]
         vehicles_list = [
             vehicle_info[0] for vehicle_info in vehicle_wise_injuries_df_5_to_15
         ]
-
-        # Load output to CSV output in parquet format
-        load_data_to_csv(vehicle_wise_injuries_df, output_path)
         return vehicles_list
 
     def vehicle_body_style_crash_analysis(self, output_path):
@@ -143,29 +291,21 @@ class CarCrashAnalysis:
         Method to analyze vehicle body style involved in crashes, and the top
         ethnic user group of each unique body style
         """
-        # We need to join units_use_df and Primary_person_use_df
-        vehicle_and_ethnicity_info = self.Primary_person_use_df.join(
-            self.Units_use_df,
-            self.Primary_person_use_df["CRASH_ID"] == self.Units_use_df["CRASH_ID"],
-            how="inner",
-        ).select(
-            self.Units_use_df["VEH_BODY_STYL_ID"],
-            self.Primary_person_use_df["PRSN_ETHNICITY_ID"],
+        # We need the shared join of units_use_df and Primary_person_use_df
+        vehicle_and_ethnicity_info = self.person_units_use_df.select(
+            col("VEH_BODY_STYL_ID"), col("PRSN_ETHNICITY_ID")
         )
         # vehicle_and_ethnicity_info.show(10, truncate=False)
 
-        # Top ethnic user group of each unique body style
-        windowSpec = Window.partitionBy("VEH_BODY_STYL_ID").orderBy(col("count").desc())
+        # Top ethnic user group of each unique body style, ties going to the
+        # first ethnicity in alphabetical order
+        windowSpec = Window.partitionBy("VEH_BODY_STYL_ID").orderBy(
+            col("count").desc(), col("PRSN_ETHNICITY_ID")
+        )
 
         vehicle_and_ethnicity_df = vehicle_and_ethnicity_info.filter(
-            vehicle_and_ethnicity_info["VEH_BODY_STYL_ID"].isin(
-                ["NA", "UNKNOWN", "NOT REPORTED", "OTHER  (EXPLAIN IN NARRATIVE)"]
-            )
-            == False
-        ).filter(
-            vehicle_and_ethnicity_info["PRSN_ETHNICITY_ID"].isin(["NA", "UNKNOWN"])
-            == False
-        )
+            is_known_body_style(self.dictionaries)
+        ).filter(is_known_ethnicity(self.dictionaries))
         # vehicle_and_ethnicity_df.show(10, truncate=False)
 
         vehicle_and_ethnicity_df = (
@@ -178,9 +318,10 @@ class CarCrashAnalysis:
         vehicle_and_ethnicity_df = vehicle_and_ethnicity_df.select(
             col("VEH_BODY_STYL_ID"), col("PRSN_ETHNICITY_ID")
         )
-        vehicle_and_ethnicity_list = vehicle_and_ethnicity_df.collect()
         # Load output to CSV output in parquet format
-        load_data_to_csv(vehicle_and_ethnicity_df, output_path)
+        vehicle_and_ethnicity_list = self.writer.save(
+            vehicle_and_ethnicity_df, output_path, result=DataFrame.collect
+        )
         return vehicle_and_ethnicity_list
 
     def alcohol_related_crash_analysis(self, output_path):
@@ -188,27 +329,24 @@ class CarCrashAnalysis:
         Method to analyze car crashes where alcohol is a contributing
         factor, returning the top 5 zip codes from the analysis
         """
-        crashes_due_to_alcohol_df = (
-            self.Units_use_df.join(
-                self.Primary_person_use_df,
-                self.Units_use_df["CRASH_ID"] == self.Primary_person_use_df["CRASH_ID"],
-                how="inner",
-            )
-            .dropna(subset=["DRVR_ZIP"])
-            .filter(
-                col("CONTRIB_FACTR_1_ID").like("%ALCOHOL%")
-                | col("CONTRIB_FACTR_2_ID").like("%ALCOHOL%")
-                | (col("PRSN_ALC_RSLT_ID") == "Positive")
-            )
-            .groupby("DRVR_ZIP")
-            .count()
-            .orderBy(col("count").desc())
-            .limit(5)
+        parameters = self.top_k.parameters("analysis_6")
+        crashes_due_to_alcohol = self.top_k.counts(
+            self.person_units_use_df.dropna(subset=["DRVR_ZIP"]).filter(
+                is_alcohol_related(self.dictionaries)
+            ),
+            "DRVR_ZIP",
+            parameters["k"],
+            parameters["offset"],
         )
         # crashes_due_to_alcohol_df.show()
         # Load output to CSV output in parquet format
-        load_data_to_csv(crashes_due_to_alcohol_df, output_path)
-        return crashes_due_to_alcohol_df.collect()
+        self.writer.save(
+            self.spark.createDataFrame(
+                crashes_due_to_alcohol, "DRVR_ZIP string, count long"
+            ),
+            output_path,
+        )
+        return crashes_due_to_alcohol
 
     def insurance_related_crash_analysis(self, output_path):
         """
@@ -216,33 +354,23 @@ class CarCrashAnalysis:
         Property was observed and Damage Level (VEH_DMAG_SCL~)
         is above 4 and car avails Insurance
         """
-        damage_insurance_info = self.Damages_use_df.join(
-            self.Units_use_df, on=["CRASH_ID"], how="inner"
-        )
-        # damage_insurance_info.select(col("CRASH_ID"), col("DAMAGED_PROPERTY")).show(10, truncate=False)
-
-        no_damage_insurace_availed_df = (
-            damage_insurance_info.filter(
-                (
-                    (col("VEH_DMAG_SCL_1_ID") > "DAMAGED 4")
-                    & (col("VEH_DMAG_SCL_1_ID").isin(["NA", "NO DAMAGE"]) == False)
-                )
-                | (
-                    (col("VEH_DMAG_SCL_2_ID") > "DAMAGED 4")
-                    & (col("VEH_DMAG_SCL_2_ID").isin(["NA", "NO DAMAGE"]) == False)
-                )
-            )
-            .filter(
-                (col("DAMAGED_PROPERTY") == "NONE")
-                | (col("DAMAGED_PROPERTY").like("NO DAMAGE%"))
-            )
-            .filter(col("FIN_RESP_TYPE_ID").like("%LIABILITY INSURANCE POLICY%"))
+        # Only the Units with a damage level above 4 and insurance are joined
+        insured_damaged_units_df = self.Units_use_df.filter(
+            is_damage_above_4(self.dictionaries)
+        ).filter(has_liability_insurance(self.dictionaries))
+
+        no_damage_insurace_availed_df = self.skew.join(
+            self.Damages_use_df.filter(is_no_damaged_property(self.dictionaries)),
+            insured_damaged_units_df,
+            "CRASH_ID",
+            how="inner",
         )
 
         # Load output to CSV output in parquet format
-        load_data_to_csv(no_damage_insurace_availed_df, output_path)
         # Number of cars
-        return no_damage_insurace_availed_df.count()
+        return self.writer.save(
+            no_damage_insurace_availed_df, output_path, result=DataFrame.count
+        )
 
     def speeding_related_crash_analysis(self, output_path):
         """
@@ -251,45 +379,30 @@ class CarCrashAnalysis:
         uses top 10 used vehicle colours and has car licensed with the
         Top 25 states with highest number of offences
         """
-        # Top 10 used vehicle colors
-        vehicle_colors_df = (
-            self.Units_use_df.groupby(col("VEH_COLOR_ID"))
-            .count()
-            .orderBy(col("count").desc())
-        )
-
-        # top 10
-        top_ten_vehicle_colors = vehicle_colors_df.limit(10)
-        # top_ten_vehicle_colors.show()
-
-        # Filtering null values from top_ten_vehicle_colors
-        vehicle_colors_df = vehicle_colors_df.filter(
-            (col("VEH_COLOR_ID") == "NA") == False
+        parameters = self.top_k.parameters("analysis_8")
+        # Top 10 used vehicle colors, filtering null values
+        top_ten_vehicle_colors = self.top_k.counts(
+            self.Units_use_df.filter(is_known_color(self.dictionaries)),
+            "VEH_COLOR_ID",
+            parameters["colors"],
         )
-        top_ten_vehicle_colors = vehicle_colors_df.limit(10)
         # top_ten_vehicle_colors.show()
 
         # Top 25 states
-        vehicle_state_df = (
-            self.Units_use_df.groupBy(col("VEH_LIC_STATE_ID"))
-            .count()
-            .orderBy(col("count").desc())
-        )
+        vehicle_state_df = self.Units_use_df.groupBy(col("VEH_LIC_STATE_ID")).count()
         # vehicle_state_df.show(25)
 
         # Filter bad records in vehicle_state_df
         # We only need Vehicle state ID
-        vehicle_state_df = vehicle_state_df.filter(
-            col("VEH_LIC_STATE_ID").cast("int").isNull()
-        )
+        vehicle_state_df = vehicle_state_df.filter(is_state_code(self.dictionaries))
 
         speeding_related_offenses_df = self.Charges_use_df.filter(
-            col("CHARGE").like("%SPEED%")
+            is_speeding_charge(self.dictionaries)
         )
 
         # Drivers with license
-        drivers_with_license_df = self.Primary_person_use_df.filter(
-            col("DRVR_LIC_TYPE_ID").isin(["DRIVER LICENSE", "COMMERCIAL DRIVER LIC."])
+        drivers_with_license_df = (
+            self.licensed_drivers_df()
         )  # drivers_with_license_df.show(10)
 
         # uses top 10 used vehicle colours and has car licensed
@@ -301,8 +414,7 @@ class CarCrashAnalysis:
         # print(top_25_states_list)
 
         # Top 10 colors
-        top_10_colors = top_ten_vehicle_colors.collect()
-        top_10_colors_list = [color_info[0] for color_info in top_10_colors]
+        top_10_colors_list = [color_info[0] for color_info in top_ten_vehicle_colors]
         # print(top_10_colors_list)
 
         # Top 5 Vehicle Makes where drivers are charged with speeding related offences,
@@ -310,150 +422,300 @@ class CarCrashAnalysis:
         # has car licensed with the Top 25 states with highest number of offences (to be deduced from the data)
 
         final_df_with_vehicle_make_info_df = (
-            drivers_with_license_df.join(speeding_related_offenses_df, on=["CRASH_ID"])
-            .join(self.Units_use_df, on=["CRASH_ID"])
+            self.skew.join(
+                self.skew.join(
+                    drivers_with_license_df, speeding_related_offenses_df, "CRASH_ID"
+                ),
+                self.Units_use_df,
+                "CRASH_ID",
+            )
             .filter(self.Units_use_df["VEH_COLOR_ID"].isin(top_10_colors_list))
             .filter(self.Units_use_df["VEH_LIC_STATE_ID"].isin(top_25_states_list))
             .groupby("VEH_MAKE_ID")
             .count()
-            .orderBy(col("count").desc())
         )
+        vehicle_make_info = self.top_k.rank(final_df_with_vehicle_make_info_df, "count")
         # Load output to CSV output in parquet format
-        load_data_to_csv(final_df_with_vehicle_make_info_df, output_path)
-        return final_df_with_vehicle_make_info_df.limit(5).collect()
+        self.writer.save(
+            self.spark.createDataFrame(
+                vehicle_make_info, "VEH_MAKE_ID string, count long"
+            ),
+            output_path,
+        )
+        return vehicle_make_info[
+            parameters["offset"] : parameters["offset"] + parameters["k"]
+        ]
 
         final_df_with_vehicle_make_info_df = final_df_with_vehicle_make_info_df.limit(5)
         final_df_with_vehicle_make_info_df.show()
 
 
-if __name__ == "__main__":
-    # Get configurations from config file 'config.yaml'
-    path_to_config_file = "config.yaml"
-
-    output_file_paths = read_config(path_to_config_file).get("OUTPUT")
-    logging_config = read_config(path_to_config_file).get("LOGGING")
-
-    # Initialize logger
-    logger = logging.getLogger(logging_config.get("namespace"))
-    logger.setLevel(logging_config.get("level"))
-
-    formatter = logging.Formatter(logging_config.get("formatter"))
-
-    file_handler = logging.FileHandler(
-        logging_config.get("path"), mode=logging_config.get("mode")
-    )
-    file_handler.setFormatter(formatter)
-
-    logger.addHandler(file_handler)
-
-    # Initialize SparkSession - app name CarCrashAnalysis
-    logger.info("Initializing SparkSession...")
-    spark = SparkSession.builder.appName("CarCrashAnalysis").getOrCreate()
-    logger.info(f"SparkSession now available as 'spark'. {spark._sc}\n")
-
-    spark.sparkContext.setLogLevel("ERROR")
-    # Create an object from CarCrashAnalysis Class
-    car_crash_analysis = CarCrashAnalysis(path_to_config_file)
-
+def log_analysis_result(logger, analysis_name, result):
+    """Log the single line solution of an analysis to car_crash_analysis.log"""
     # Analysis 1: Find the number of crashes (accidents) in which number of persons killed are male?
     # According to data dictionary - Primary_Person_use.csv has the Car crash info with gender details - PRSN_GNDR_ID
-    logger.info(
-        "ANALYSIS 1: Number of crashes in which person killed is Male: "
-        f"{car_crash_analysis.male_car_crash_analysis(output_file_paths.get('analysis_1_output'))}\n"
-    )
+    if analysis_name == "analysis_1":
+        logger.info(
+            f"ANALYSIS 1: Number of crashes in which person killed is Male: {result}\n"
+        )
 
     # Analysis 2: How many two wheelers are booked for crashes?
     # According to data dictionary - Units_use.csv has the vehicle type
     # info - VEH_BODY_STYL_ID
-    logger.info(
-        "ANALYSIS 2: Number of two wheelers booked for crashes: "
-        f"{car_crash_analysis.two_wheeler_crash_analysis(output_file_paths.get('analysis_2_output'))}\n"
-    )
+    elif analysis_name == "analysis_2":
+        logger.info(
+            f"ANALYSIS 2: Number of two wheelers booked for crashes: {result}\n"
+        )
 
     # Analysis 3: Which state has the highest number of accidents in which
     # females are involved?
     # According to data dictionary - Primary_Person_use.csv has the Car
     # crash info with gender and state details - PRSN_GNDR_ID, DRVR_LIC_STATE_ID
-
-    # We already have the DF available as Primary_Person_use_df
-    logger.info(
-        "ANALYSIS 3: State with highest number of accidents "
-        "involving females: "
-        f"{car_crash_analysis.female_car_crash_analysis(output_file_paths.get('analysis_3_output'))}\n"
-    )
+    elif analysis_name == "analysis_3":
+        logger.info(
+            "ANALYSIS 3: State with highest number of accidents "
+            f"involving females: {result}\n"
+        )
 
     # Analysis 4: Which are the Top 5th to 15th VEH_MAKE_IDs that contribute
     # to a largest number of injuries including death
-
     # According to data dictionary - Units_use.csv has the Car crash info
     # with injury count, death and VEH_MAKE_ID info
-
-    # We already have the DF available as Units_use_df
-    logger.info(
-        "ANALYSIS 4: Top5th to 15th Vehicle make involved in accidents"
-        " including death: \n"
-        f"{car_crash_analysis.vehicle_make_crash_analysis(output_file_paths.get('analysis_4_output'))}\n"
-    )
+    elif analysis_name == "analysis_4":
+        logger.info(
+            "ANALYSIS 4: Top5th to 15th Vehicle make involved in accidents"
+            f" including death: \n{result}\n"
+        )
 
     # Analysis 5: For all the body styles involved in crashes, mention the top ethnic user group of each unique body
     # style
-
-    # We have the vehicle body style info in Units_use.csv and ethnicity info in Primary_person_use.csv,
-    # we already have this info in Units_use_df and Primary_person_use_df
-
-    vehicle_and_ethnicity_list = car_crash_analysis.vehicle_body_style_crash_analysis(
-        output_file_paths.get("analysis_5_output")
-    )
-    logger.info("ANALYSIS 5: Top ethnic user group for each vehicle body style: \n")
-    for vehicle_info in vehicle_and_ethnicity_list:
-        logger.info(f"{vehicle_info[0]}:  {vehicle_info[1]}")
-    logger.info("\n")
+    # We have the vehicle body style info in Units_use.csv and ethnicity info in Primary_person_use.csv
+    elif analysis_name == "analysis_5":
+        logger.info("ANALYSIS 5: Top ethnic user group for each vehicle body style: \n")
+        for vehicle_info in result:
+            logger.info(f"{vehicle_info[0]}:  {vehicle_info[1]}")
+        logger.info("\n")
 
     # Analysis 6: Among the crashed cars, what are the Top 5 Zip Codes with highest number crashes with alcohols as
     # the contributing factor to a crash (Use Driver Zip Code)
-
     # According to data dictionary - Primary_person_use.csv has the Car crash info with driver zip code and
-    # alcohol result - DRVR_ZIP and PRSN_ALC_RSLT_ID, contributing factors are available in Units_use.csv  #### We
-    # already have the DFs available as Primary_person_use_df and Units_use_df
-    crashes_due_to_alcohol_list = car_crash_analysis.alcohol_related_crash_analysis(
-        output_file_paths.get("analysis_6_output")
-    )
-    logger.info(
-        "ANALYSIS 6: Top 5 Zip Codes with highest number crashes with alcohols "
-        "as the contributing factor to a crash: \n"
-    )
-    for crash_info in crashes_due_to_alcohol_list:
-        logger.info(f"{crash_info[0]}:  {crash_info[1]}")
-    logger.info("\n")
+    # alcohol result - DRVR_ZIP and PRSN_ALC_RSLT_ID, contributing factors are available in Units_use.csv
+    elif analysis_name == "analysis_6":
+        logger.info(
+            "ANALYSIS 6: Top 5 Zip Codes with highest number crashes with alcohols "
+            "as the contributing factor to a crash: \n"
+        )
+        for crash_info in result:
+            logger.info(f"{crash_info[0]}:  {crash_info[1]}")
+        logger.info("\n")
 
     # Analysis 7: Count of Distinct Crash IDs where No Damaged Property was observed and Damage Level (VEH_DMAG_SCL~)
     # is above 4 and car avails Insurance
-
     # According to data dictionary - Damages_use.csv has the Car crash info with damages, Units_use.csv has info
-    # regarding Damage level - VEH_DMAG_SCL, Insurance  #### We already have the DFs available as
-    # Primary_person_use_df and Units_use_df
-
-    logger.info(
-        f"ANALYSIS 7: Count of Distinct Crash IDs where No Damaged "
-        f"Property was observed and Damage Level (VEH_DMAG_SCL~) "
-        "is above 4 and car avails Insurance: "
-        f"{car_crash_analysis.insurance_related_crash_analysis(output_file_paths.get('analysis_7_output'))}\n"
-    )
+    # regarding Damage level - VEH_DMAG_SCL, Insurance
+    elif analysis_name == "analysis_7":
+        logger.info(
+            f"ANALYSIS 7: Count of Distinct Crash IDs where No Damaged "
+            f"Property was observed and Damage Level (VEH_DMAG_SCL~) "
+            f"is above 4 and car avails Insurance: {result}\n"
+        )
 
     # Analysis 8: Determine the Top 5 Vehicle Makes where drivers are charged with speeding related offences,
     # has licensed Drivers, uses top 10 used vehicle colours and has car licensed with the Top 25 states with highest
     # number of offences (to be deduced from the data)
-
     # According to data dictionary, we have the Vehicle info in Units_use.csv, Driver details in
-    # primary_peron_use.cs  #### We already have the DFs available as Primary_person_use_df and Units_use_df
-    speeding_list = car_crash_analysis.speeding_related_crash_analysis(
-        output_file_paths.get("analysis_8_output")
+    # primary_peron_use.csv
+    elif analysis_name == "analysis_8":
+        logger.info(
+            f"ANALYSIS 8: top 5 Vehicle Makes where drivers are charged "
+            f"with speeding related offences, has licensed Drivers, "
+            f"uses top 10 used vehicle colours and has car licensed with "
+            f"the Top 25 states with highest number of offences: "
+        )
+        for crash_info in result:
+            logger.info(f"{crash_info[0]}:  {crash_info[1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Car crash analysis")
+    parser.add_argument(
+        "--config", default="config.yaml", help="Path to the config file"
     )
-    logger.info(
-        f"ANALYSIS 8: top 5 Vehicle Makes where drivers are charged "
-        f"with speeding related offences, has licensed Drivers, "
-        f"uses top 10 used vehicle colours and has car licensed with "
-        f"the Top 25 states with highest number of offences: "
+    parser.add_argument(
+        "--invalidate-cache",
+        action="store_true",
+        help="Drop the stored analysis results before running",
     )
-    for crash_info in speeding_list:
-        logger.info(f"{crash_info[0]}:  {crash_info[1]}")
+    args = parser.parse_args()
+
+    # Get configurations from config file 'config.yaml'
+    path_to_config_file = args.config
+
+    output_file_paths = read_config(path_to_config_file).get("OUTPUT")
+    logging_config = read_config(path_to_config_file).get("LOGGING")
+    execution_config = read_config(path_to_config_file).get("EXECUTION", {})
+
+    # Initialize logger
+    logger = logging.getLogger(logging_config.get("namespace"))
+    logger.setLevel(logging_config.get("level"))
+
+    formatter = logging.Formatter(logging_config.get("formatter"))
+
+    file_handler = logging.FileHandler(
+        logging_config.get("path"), mode=logging_config.get("mode")
+    )
+    file_handler.setFormatter(formatter)
+
+    logger.addHandler(file_handler)
+
+    # Log the utils modules (ingest, scheduler, ...) to the same file
+    utils_logger = logging.getLogger("utils")
+    utils_logger.setLevel(logging_config.get("level"))
+    utils_logger.addHandler(file_handler)
+
+    if args.invalidate_cache:
+        ResultCache(read_config(path_to_config_file).get("RESULT_CACHE")).clear()
+
+    analyses = execution_config.get("analyses") or ALL_ANALYSES
+    backend = select_backend(
+        execution_config, read_config(path_to_config_file).get("INPUT")
+    )
+    if backend == "local":
+        # Small inputs run in-process on NumPy and Arrow arrays, which is
+        # faster than starting the JVM and the SparkSession
+        logger.info("Running the analyses on the local backend...")
+        results = {}
+        local_analysis_plan = LocalAnalysisPlan(path_to_config_file, analyses)
+        for analysis_name in analyses:
+            start_time = time.perf_counter()
+            results[analysis_name] = run_analysis(
+                local_analysis_plan, analysis_name, output_file_paths
+            )
+            logger.info(f"{analysis_name} took {time.perf_counter() - start_time:.2f}s")
+        writer = profiler = None
+    else:
+        # Initialize SparkSession - app name CarCrashAnalysis
+        logger.info("Initializing SparkSession...")
+        spark_builder = SparkSession.builder.appName("CarCrashAnalysis")
+        if execution_config.get("mode") in ("parallel", "server"):
+            # Concurrent analyses share the executors through FAIR scheduler pools
+            spark_builder = spark_builder.config("spark.scheduler.mode", "FAIR")
+        if (read_config(path_to_config_file).get("SKEW") or {}).get("adaptive", True):
+            # Adaptive execution also splits skewed shuffle partitions at runtime
+            spark_builder = spark_builder.config(
+                "spark.sql.adaptive.enabled", "true"
+            ).config("spark.sql.adaptive.skewJoin.enabled", "true")
+        spark = spark_builder.getOrCreate()
+        logger.info(f"SparkSession now available as 'spark'. {spark._sc}\n")
+
+        spark.sparkContext.setLogLevel("ERROR")
+        if execution_config.get("mode") == "incremental":
+            # Merge only the batches that arrived since the last run into the
+            # aggregate state, then answer every analysis from that state
+            incremental_state = IncrementalState(
+                spark, read_config(path_to_config_file).get("INCREMENTAL")
+            )
+            for batch_id, batch_file_paths in incremental_state.pending_batches(
+                read_config(path_to_config_file).get("INPUT")
+            ):
+                # The state serves every analysis, whichever are run now
+                batch = CarCrashAnalysis(
+                    path_to_config_file, batch_file_paths, ALL_ANALYSES
+                )
+                incremental_state.ingest_batch(batch_id, batch, output_file_paths)
+
+            writer = OutputWriter(
+                read_config(path_to_config_file).get("WRITER"), output_file_paths
+            )
+            profiling_config = read_config(path_to_config_file).get("PROFILING") or {}
+            profiler = (
+                AnalysisProfiler(spark, profiling_config)
+                if profiling_config.get("enabled", False)
+                else None
+            )
+            results = IncrementalAnalysisPlan(
+                incremental_state,
+                writer,
+                analyses,
+                profiler,
+                TopK(read_config(path_to_config_file).get("TOP_K")),
+            ).run(output_file_paths)
+        elif execution_config.get("mode") == "streaming":
+            # Keep the analyses up to date from file streams of the inputs,
+            # logging every refreshed result
+            writer = OutputWriter(
+                read_config(path_to_config_file).get("WRITER"), output_file_paths
+            )
+            profiler = None
+            results = StreamingAnalysis(
+                spark,
+                read_config(path_to_config_file).get("STREAMING") or {},
+                writer,
+                analyses,
+                TopK(read_config(path_to_config_file).get("TOP_K")),
+                on_results=lambda refreshed: [
+                    log_analysis_result(logger, analysis_name, result)
+                    for analysis_name, result in refreshed.items()
+                ],
+                validate_licensed_drivers=(
+                    read_config(path_to_config_file).get("LICENSES") or {}
+                ).get("validate_licensed_drivers", False),
+            ).run(output_file_paths)
+        elif execution_config.get("mode") == "server":
+            # Keep every input table cached and answer analysis requests until
+            # interrupted, logging every result
+            car_crash_analysis = CarCrashAnalysis(
+                path_to_config_file, analyses=ALL_ANALYSES
+            )
+            writer = car_crash_analysis.writer
+            profiler = car_crash_analysis.profiler
+            AnalysisServer(
+                car_crash_analysis,
+                read_config(path_to_config_file).get("SERVER") or {},
+                output_file_paths,
+                on_result=lambda analysis_name, result: log_analysis_result(
+                    logger, analysis_name, result
+                ),
+            ).serve()
+            results = {}
+        else:
+            # Create an object from CarCrashAnalysis Class
+            car_crash_analysis = CarCrashAnalysis(path_to_config_file)
+            writer = car_crash_analysis.writer
+            profiler = car_crash_analysis.profiler
+
+        if execution_config.get("mode") == "fused":
+            # Plan all requested analyses together so they share scans and
+            # pre-aggregations of the inputs
+            results = FusedAnalysisPlan(car_crash_analysis, analyses).run(
+                output_file_paths
+            )
+        elif execution_config.get("mode") == "parallel":
+            # Run independent analyses concurrently along their dependency DAG
+            results = AnalysisScheduler(
+                car_crash_analysis,
+                analyses,
+                max_concurrency=execution_config.get("max_concurrency", 4),
+                dependencies=execution_config.get("dependencies"),
+            ).run(output_file_paths)
+        elif execution_config.get("mode") not in ("incremental", "streaming", "server"):
+            results = {}
+            for analysis_name in analyses:
+                start_time = time.perf_counter()
+                results[analysis_name] = run_analysis(
+                    car_crash_analysis, analysis_name, output_file_paths
+                )
+                logger.info(
+                    f"{analysis_name} took {time.perf_counter() - start_time:.2f}s"
+                )
+
+    for analysis_name, result in results.items():
+        log_analysis_result(logger, analysis_name, result)
+
+    # Outputs are written in the background, wait for the last ones
+    if writer is not None:
+        writer.wait()
+
+    # Profiles include the jobs of the background writes, so they come last
+    if profiler is not None:
+        profiler.write_report()
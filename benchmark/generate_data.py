@@ -0,0 +1,466 @@
+"""Synthetic crash data generator for benchmarking CarCrashAnalysis.
+
+Writes referentially consistent Primary_Person, Units, Damages, Charges,
+Endorse and Restrict CSV files at a chosen scale factor. Scale factor 1 has
+about as many crashes as input/Data. Units, persons, charges, damages,
+endorsements and restrictions hang off each generated CRASH_ID / UNIT_NBR,
+and VEH_MAKE_ID, the licence states, DRVR_ZIP and VEH_BODY_STYL_ID follow
+skewed (Zipf-like) distributions like the real data.
+
+    python -m benchmark.generate_data --scale-factor 10 --output-dir input/benchmark/sf10
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import random
+
+from utils.schemas import SCHEMAS
+
+CRASHES_PER_SCALE_FACTOR = 84000
+
+# Table -> file name, the same names as the INPUT files in config.yaml
+FILE_NAMES = {
+    "Primary_Person": "Primary_Person_use.csv",
+    "Units": "Units_use.csv",
+    "Damages": "Damages_use.csv",
+    "Charges": "Charges_use.csv",
+    "Endorse": "Endorse_use.csv",
+    "Restrict": "Restrict_use.csv",
+}
+
+VEH_MAKES = [
+    "FORD",
+    "CHEVROLET",
+    "TOYOTA",
+    "DODGE",
+    "NISSAN",
+    "HONDA",
+    "GMC",
+    "HYUNDAI",
+    "KIA",
+    "JEEP",
+    "CHRYSLER",
+    "MAZDA",
+    "VOLKSWAGEN",
+    "PONTIAC",
+    "LEXUS",
+    "BMW",
+    "BUICK",
+    "CADILLAC",
+    "MERCEDES-BENZ",
+    "SUBARU",
+    "MITSUBISHI",
+    "ACURA",
+    "INFINITI",
+    "LINCOLN",
+    "AUDI",
+    "HARLEY-DAVIDSON",
+    "FREIGHTLINER",
+    "NA",
+]
+VEH_COLORS = [
+    "WHI",
+    "BLK",
+    "SIL",
+    "GRY",
+    "RED",
+    "BLU",
+    "MAR",
+    "GRN",
+    "TAN",
+    "GLD",
+    "BRO",
+    "BGE",
+    "YEL",
+    "ONG",
+    "PLE",
+    "CPR",
+    "TEA",
+    "NA",
+    "98",
+]
+STATES = [
+    "TX",
+    "NA",
+    "MX",
+    "LA",
+    "OK",
+    "NM",
+    "CA",
+    "FL",
+    "AR",
+    "AZ",
+    "GA",
+    "IL",
+    "CO",
+    "MS",
+    "TN",
+    "NC",
+    "MO",
+    "AL",
+    "KS",
+    "OH",
+    "UN",
+    "VA",
+    "MI",
+    "IN",
+    "WA",
+    "NV",
+    "UT",
+    "SC",
+    "PA",
+    "NY",
+    "98",
+    "99",
+]
+BODY_STYLES = [
+    "PASSENGER CAR, 4-DOOR",
+    "PICKUP",
+    "SPORT UTILITY VEHICLE",
+    "NA",
+    "PASSENGER CAR, 2-DOOR",
+    "VAN",
+    "POLICE CAR/TRUCK",
+    "TRUCK",
+    "TRUCK TRACTOR",
+    "MOTORCYCLE",
+    "UNKNOWN",
+    "OTHER  (EXPLAIN IN NARRATIVE)",
+    "BUS",
+    "POLICE MOTORCYCLE",
+    "FARM EQUIPMENT",
+    "YELLOW SCHOOL BUS",
+    "AMBULANCE",
+    "FIRE TRUCK",
+    "NOT REPORTED",
+    "NEV-NEIGHBORHOOD ELECTRIC VEHICLE",
+]
+ETHNICITIES = [
+    "WHITE",
+    "HISPANIC",
+    "BLACK",
+    "NA",
+    "ASIAN",
+    "OTHER",
+    "UNKNOWN",
+    "AMER. INDIAN/ALASKAN NATIVE",
+]
+GENDERS = ["MALE", "FEMALE", "UNKNOWN", "NA"]
+UNIT_DESCRIPTIONS = [
+    "MOTOR VEHICLE",
+    "PEDALCYCLIST",
+    "PEDESTRIAN",
+    "PARKED CAR",
+    "TRAIN",
+    "OTHER (EXPLAIN IN NARRATIVE)",
+]
+LICENSE_TYPES = [
+    "DRIVER LICENSE",
+    "NA",
+    "UNLICENSED",
+    "COMMERCIAL DRIVER LIC.",
+    "UNKNOWN",
+    "ID CARD",
+    "OCCUPATIONAL",
+    "OTHER",
+]
+CONTRIB_FACTORS = [
+    "NA",
+    "FAILED TO CONTROL SPEED",
+    "DRIVER INATTENTION",
+    "FAILED TO YIELD RIGHT OF WAY - STOP SIGN",
+    "UNSAFE SPEED",
+    "FOLLOWED TOO CLOSELY",
+    "CHANGED LANE WHEN UNSAFE",
+    "UNDER INFLUENCE - ALCOHOL",
+    "HAD BEEN DRINKING",
+    "DISREGARD STOP AND GO SIGNAL",
+    "FATIGUED OR ASLEEP",
+    "DISTRACTION IN VEHICLE",
+]
+ALCOHOL_RESULTS = ["NA", "Negative", "Positive"]
+DAMAGE_SCALES = [
+    "DAMAGED 1 MINIMUM",
+    "DAMAGED 2",
+    "DAMAGED 3",
+    "DAMAGED 4",
+    "NA",
+    "NO DAMAGE",
+    "DAMAGED 5",
+    "DAMAGED 6",
+    "DAMAGED 7 HIGHEST",
+    "INVALID VALUE",
+]
+FIN_RESP_TYPES = [
+    "NA",
+    "PROOF OF LIABILITY INSURANCE",
+    "LIABILITY INSURANCE POLICY",
+    "CERTIFICATE OF SELF-INSURANCE",
+    "SURETY BOND",
+]
+DAMAGED_PROPERTIES = [
+    "FENCE",
+    "NONE",
+    "GUARD RAIL",
+    "LIGHT POLE",
+    "MAILBOX",
+    "NO DAMAGE",
+    "STOP SIGN",
+    "UTILITY POLE",
+    "TREE",
+    "SIGN",
+    "YARD, GRASS",
+    "NO DAMAGE TO PROPERTY",
+]
+CHARGES = [
+    "NO CHARGES",
+    "FAILED TO CONTROL SPEED",
+    "SPEEDING - (OVER LIMIT)",
+    "DRIVING WHILE INTOXICATED",
+    "FAIL TO YIELD RIGHT OF WAY",
+    "NO DRIVERS LICENSE",
+    "FAILURE TO MAINTAIN FINANCIAL RESPONSIBILITY",
+    "UNSAFE SPEED",
+    "RAN RED LIGHT",
+    "FOLLOWING TOO CLOSELY",
+    "DRIVING WHILE LICENSE INVALID",
+]
+ENDORSEMENTS = [
+    "NONE",
+    "UNLICENSED",
+    "OTHER/OUT OF STATE",
+    "UNKNOWN",
+    "TANK VEHICLE",
+    "DOUBLE/TRIPLE TRAILER",
+    "PASSENGER",
+]
+RESTRICTIONS = [
+    "NONE",
+    "WITH CORRECTIVE LENSES",
+    "UNLICENSED",
+    "OTHER/OUT OF STATE",
+    "UNKNOWN",
+    "OUTSIDE MIRROR OR HEARING AID",
+]
+
+
+class SkewedChoice:
+    """Pick from a list of values with Zipf-like weights 1 / (rank + 1) ** skew,
+    the first value being the most frequent"""
+
+    def __init__(self, rng, values, skew=1.0):
+        self.rng = rng
+        self.values = values
+        self.cum_weights = list(
+            itertools.accumulate(1 / (rank + 1) ** skew for rank in range(len(values)))
+        )
+
+    def __call__(self):
+        return self.rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+class CrashDataGenerator:
+    """Generate the rows of every table, one crash at a time"""
+
+    def __init__(self, seed=42, first_crash_id=10000000, num_zips=5000):
+        """
+        :param seed: Random seed, the same seed gives the same files
+        :param first_crash_id: CRASH_ID of the first generated crash, so that
+            batches for the incremental mode do not overlap
+        :param num_zips: Number of distinct driver zip codes
+        """
+        self.rng = random.Random(seed)
+        self.next_crash_id = first_crash_id
+        rng = self.rng
+        self.make = SkewedChoice(rng, VEH_MAKES, skew=1.1)
+        self.color = SkewedChoice(rng, VEH_COLORS, skew=1.0)
+        self.state = SkewedChoice(rng, STATES, skew=2.0)
+        self.body_style = SkewedChoice(rng, BODY_STYLES, skew=1.4)
+        self.ethnicity = SkewedChoice(rng, ETHNICITIES, skew=1.2)
+        self.gender = SkewedChoice(rng, GENDERS, skew=1.5)
+        self.unit_description = SkewedChoice(rng, UNIT_DESCRIPTIONS, skew=3.0)
+        self.license_type = SkewedChoice(rng, LICENSE_TYPES, skew=1.3)
+        self.contrib_factor = SkewedChoice(rng, CONTRIB_FACTORS, skew=0.8)
+        self.alcohol_result = SkewedChoice(rng, ALCOHOL_RESULTS, skew=2.5)
+        self.damage_scale = SkewedChoice(rng, DAMAGE_SCALES, skew=0.7)
+        self.fin_resp_type = SkewedChoice(rng, FIN_RESP_TYPES, skew=1.2)
+        self.damaged_property = SkewedChoice(rng, DAMAGED_PROPERTIES, skew=1.0)
+        self.charge = SkewedChoice(rng, CHARGES, skew=0.9)
+        self.endorsement = SkewedChoice(rng, ENDORSEMENTS, skew=2.0)
+        self.restriction = SkewedChoice(rng, RESTRICTIONS, skew=1.5)
+        self.zip_code = SkewedChoice(
+            rng, [str(75000 + number) for number in range(num_zips)], skew=0.9
+        )
+        self.units_per_crash = SkewedChoice(rng, [1, 2, 3, 4, 5, 6, 8, 12], skew=2.2)
+
+    def _injuries(self):
+        injuries = {
+            "INCAP_INJRY_CNT": self.rng.choices([0, 1, 2], weights=[90, 8, 2])[0],
+            "NONINCAP_INJRY_CNT": self.rng.choices([0, 1, 2], weights=[85, 12, 3])[0],
+            "POSS_INJRY_CNT": self.rng.choices([0, 1, 2], weights=[80, 15, 5])[0],
+            "NON_INJRY_CNT": self.rng.choices([0, 1, 2, 3], weights=[30, 50, 15, 5])[0],
+            "UNKN_INJRY_CNT": self.rng.choices([0, 1], weights=[97, 3])[0],
+            "DEATH_CNT": self.rng.choices([0, 1], weights=[99, 1])[0],
+        }
+        injuries["TOT_INJRY_CNT"] = (
+            injuries["INCAP_INJRY_CNT"]
+            + injuries["NONINCAP_INJRY_CNT"]
+            + injuries["POSS_INJRY_CNT"]
+        )
+        return injuries
+
+    def crash(self):
+        """Rows of one crash.
+        :return: dictionary of table -> list of row dictionaries
+        """
+        rng = self.rng
+        crash_id = self.next_crash_id
+        self.next_crash_id += 1
+        rows = {table_name: [] for table_name in FILE_NAMES}
+
+        for unit_nbr in range(1, self.units_per_crash() + 1):
+            unit_description = self.unit_description()
+            body_style = self.body_style()
+            rows["Units"].append(
+                {
+                    "CRASH_ID": crash_id,
+                    "UNIT_NBR": unit_nbr,
+                    "UNIT_DESC_ID": unit_description,
+                    "VEH_LIC_STATE_ID": self.state(),
+                    "VEH_MOD_YEAR": str(rng.randint(1990, 2022)),
+                    "VEH_COLOR_ID": self.color(),
+                    "VEH_MAKE_ID": self.make(),
+                    "VEH_BODY_STYL_ID": body_style,
+                    "OWNR_ZIP": self.zip_code(),
+                    "FIN_RESP_TYPE_ID": self.fin_resp_type(),
+                    "VEH_DMAG_SCL_1_ID": self.damage_scale(),
+                    "VEH_DMAG_SCL_2_ID": self.damage_scale(),
+                    "CONTRIB_FACTR_1_ID": self.contrib_factor(),
+                    "CONTRIB_FACTR_2_ID": self.contrib_factor(),
+                    **self._injuries(),
+                }
+            )
+
+            license_type = self.license_type()
+            rows["Primary_Person"].append(
+                {
+                    "CRASH_ID": crash_id,
+                    "UNIT_NBR": unit_nbr,
+                    "PRSN_NBR": 1,
+                    "PRSN_TYPE_ID": "DRIVER",
+                    "PRSN_AGE": str(rng.randint(16, 90)),
+                    "PRSN_ETHNICITY_ID": self.ethnicity(),
+                    "PRSN_GNDR_ID": self.gender(),
+                    "PRSN_HELMET_ID": "NOT APPLICABLE",
+                    "PRSN_ALC_RSLT_ID": self.alcohol_result(),
+                    "DRVR_LIC_TYPE_ID": license_type,
+                    "DRVR_LIC_STATE_ID": self.state(),
+                    "DRVR_LIC_CLS_ID": "CLASS C",
+                    "DRVR_ZIP": self.zip_code() if rng.random() < 0.9 else None,
+                    **self._injuries(),
+                }
+            )
+
+            if rng.random() < 0.64:
+                rows["Charges"].append(
+                    {
+                        "CRASH_ID": crash_id,
+                        "UNIT_NBR": unit_nbr,
+                        "PRSN_NBR": 1,
+                        "CHARGE": self.charge(),
+                        "CITATION_NBR": f"{crash_id}{unit_nbr:02d}",
+                    }
+                )
+            if unit_description == "MOTOR VEHICLE":
+                rows["Endorse"].append(
+                    {
+                        "CRASH_ID": crash_id,
+                        "UNIT_NBR": unit_nbr,
+                        "DRVR_LIC_ENDORS_ID": (
+                            "UNLICENSED"
+                            if license_type == "UNLICENSED"
+                            else self.endorsement()
+                        ),
+                    }
+                )
+                rows["Restrict"].append(
+                    {
+                        "CRASH_ID": crash_id,
+                        "UNIT_NBR": unit_nbr,
+                        "DRVR_LIC_RESTRIC_ID": (
+                            "UNLICENSED"
+                            if license_type == "UNLICENSED"
+                            else self.restriction()
+                        ),
+                    }
+                )
+
+        if rng.random() < 0.25:
+            for _ in range(rng.choices([1, 2, 3], weights=[85, 12, 3])[0]):
+                rows["Damages"].append(
+                    {"CRASH_ID": crash_id, "DAMAGED_PROPERTY": self.damaged_property()}
+                )
+        return rows
+
+
+def _default_value(data_type_name):
+    """Value of a column the generator does not model"""
+    return None if data_type_name in ("integer", "timestamp") else "NA"
+
+
+def generate(output_dir, scale_factor=1.0, seed=42, first_crash_id=10000000):
+    """Write the six CSV files of one synthetic data set.
+    :param output_dir: Directory to write the CSV files to
+    :param scale_factor: Number of crashes relative to input/Data
+    :param seed: Random seed
+    :param first_crash_id: CRASH_ID of the first generated crash
+    :return: dictionary of table -> number of rows written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    generator = CrashDataGenerator(seed=seed, first_crash_id=first_crash_id)
+    num_crashes = max(1, round(CRASHES_PER_SCALE_FACTOR * scale_factor))
+
+    files, writers, defaults = {}, {}, {}
+    row_counts = dict.fromkeys(FILE_NAMES, 0)
+    try:
+        for table_name, file_name in FILE_NAMES.items():
+            schema = SCHEMAS[table_name]
+            files[table_name] = open(
+                os.path.join(output_dir, file_name), "w", newline=""
+            )
+            # Minimal quoting keeps None an unquoted empty field, read as null
+            writers[table_name] = csv.DictWriter(
+                files[table_name], fieldnames=schema.fieldNames()
+            )
+            writers[table_name].writeheader()
+            defaults[table_name] = {
+                field.name: _default_value(field.dataType.typeName())
+                for field in schema.fields
+            }
+
+        for _ in range(num_crashes):
+            for table_name, rows in generator.crash().items():
+                for row in rows:
+                    writers[table_name].writerow({**defaults[table_name], **row})
+                row_counts[table_name] += len(rows)
+    finally:
+        for file in files.values():
+            file.close()
+    return row_counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--scale-factor", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--first-crash-id", type=int, default=10000000)
+    args = parser.parse_args()
+
+    row_counts = generate(
+        args.output_dir, args.scale_factor, args.seed, args.first_crash_id
+    )
+    for table_name, row_count in row_counts.items():
+        print(f"{FILE_NAMES[table_name]}: {row_count} rows")
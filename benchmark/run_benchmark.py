@@ -0,0 +1,237 @@
+"""Benchmark harness for CarCrashAnalysis.
+
+Generates synthetic data at every requested scale factor (see
+benchmark/generate_data.py), runs analysis.py through spark-submit for every
+scale factor, executor count and execution mode, and appends the total and
+per-analysis timings of each run to a JSON lines results file. With
+--baseline the timings are compared to an earlier results file and the
+harness exits non-zero when an analysis got slower than the tolerance.
+
+    python -m benchmark.run_benchmark --scale-factors 1 10 --executors 2 4
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import yaml
+
+from benchmark.generate_data import FILE_NAMES, generate
+from utils.helper import read_config
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _scale_factor_name(scale_factor):
+    return f"sf{scale_factor:g}".replace(".", "_")
+
+
+def prepare_data(data_root, scale_factor, seed):
+    """Generate the data of one scale factor unless it already exists.
+    :param data_root: Directory holding one sub-directory per scale factor
+    :param scale_factor: Number of crashes relative to input/Data
+    :param seed: Random seed
+    :return: dictionary of table -> CSV file path, the INPUT section
+    """
+    data_dir = os.path.join(data_root, f"{_scale_factor_name(scale_factor)}_seed{seed}")
+    input_file_paths = {
+        table_name: os.path.join(data_dir, file_name)
+        for table_name, file_name in FILE_NAMES.items()
+    }
+    if not all(os.path.isfile(path) for path in input_file_paths.values()):
+        print(f"Generating scale factor {scale_factor:g} data in {data_dir}")
+        generate(data_dir, scale_factor, seed)
+    return input_file_paths
+
+
+def write_run_config(base_config, run_dir, input_file_paths, mode):
+    """Write the config.yaml of one benchmark run on the Spark backend.
+    Inputs, outputs, the Parquet cache, the profile and the log all live
+    under run_dir.
+    :return: Path of the written config file
+    """
+    config = json.loads(json.dumps(base_config))
+    config["INPUT"] = input_file_paths
+    config["OUTPUT"] = {
+        output_key: os.path.join(run_dir, "output", os.path.basename(path))
+        for output_key, path in base_config["OUTPUT"].items()
+    }
+    config.setdefault("INGEST", {})["cache_dir"] = os.path.join(
+        run_dir, "cache", "parquet"
+    )
+    config.setdefault("EXECUTION", {})["mode"] = mode
+    # Runs compare Spark executor counts, so small scale factors must not
+    # fall back to the local backend
+    config["EXECUTION"]["backend"] = "spark"
+    config["PROFILING"] = {
+        "enabled": True,
+        "path": os.path.join(run_dir, "profile.jsonl"),
+    }
+    config.setdefault("LOGGING", {})["path"] = os.path.join(
+        run_dir, "car_crash_analysis.log"
+    )
+    config_path = os.path.join(run_dir, "config.yaml")
+    with open(config_path, "w") as file:
+        yaml.safe_dump(config, file, sort_keys=False)
+    return config_path
+
+
+def run_once(args, base_config, input_file_paths, scale_factor, executors, mode):
+    """Run analysis.py once and collect its timings.
+    :return: benchmark record dictionary
+    """
+    run_dir = os.path.join(
+        args.work_dir, f"{_scale_factor_name(scale_factor)}_x{executors}_{mode}"
+    )
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    config_path = write_run_config(base_config, run_dir, input_file_paths, mode)
+
+    command = [
+        args.spark_submit,
+        "--master",
+        args.master.format(executors=executors),
+        *args.spark_submit_args,
+        "analysis.py",
+        "--config",
+        config_path,
+    ]
+    start_time = time.perf_counter()
+    completed = subprocess.run(command)
+    wall_time = time.perf_counter() - start_time
+
+    analyses = {}
+    profile_path = os.path.join(run_dir, "profile.jsonl")
+    if os.path.isfile(profile_path):
+        with open(profile_path, "r") as file:
+            for line in file:
+                profile = json.loads(line)
+                analyses[profile.pop("analysis")] = {
+                    key: value
+                    for key, value in profile.items()
+                    if key not in ("job_group", "started_at")
+                }
+    return {
+        "timestamp": time.time(),
+        "git_commit": _git_commit(),
+        "scale_factor": scale_factor,
+        "seed": args.seed,
+        "executors": executors,
+        "mode": mode,
+        "returncode": completed.returncode,
+        "wall_time_s": round(wall_time, 3),
+        "analyses": analyses,
+    }
+
+
+def _run_key(record):
+    return record["scale_factor"], record["executors"], record["mode"]
+
+
+def find_regressions(records, baseline_path, tolerance):
+    """Compare the wall times of records with the latest matching baseline
+    records.
+    :param records: Benchmark records of this run
+    :param baseline_path: Results file of an earlier run
+    :param tolerance: Allowed relative slowdown, e.g. 0.2 for 20 %
+    :return: list of regression messages
+    """
+    baseline = {}
+    with open(baseline_path, "r") as file:
+        for line in file:
+            record = json.loads(line)
+            if record["returncode"] == 0:
+                baseline[_run_key(record)] = record
+
+    regressions = []
+    for record in records:
+        if record["returncode"] != 0:
+            regressions.append(f"{_run_key(record)} failed")
+            continue
+        expected = baseline.get(_run_key(record))
+        if expected is None:
+            continue
+        timings = {"total": (record["wall_time_s"], expected["wall_time_s"])}
+        for analysis_name, profile in record["analyses"].items():
+            if analysis_name in expected["analyses"]:
+                timings[analysis_name] = (
+                    profile["wall_time_s"],
+                    expected["analyses"][analysis_name]["wall_time_s"],
+                )
+        for name, (wall_time, expected_wall_time) in timings.items():
+            if wall_time > expected_wall_time * (1 + tolerance):
+                regressions.append(
+                    f"{_run_key(record)} {name}: {wall_time:.2f}s, "
+                    f"baseline {expected_wall_time:.2f}s"
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--scale-factors", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--executors", type=int, nargs="+", default=[1, 4])
+    parser.add_argument(
+        "--modes", nargs="+", default=["sequential", "fused", "parallel"]
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default="input/benchmark")
+    parser.add_argument("--work-dir", default="benchmark/runs")
+    parser.add_argument("--results", default="benchmark/results.jsonl")
+    parser.add_argument("--spark-submit", default="spark-submit")
+    parser.add_argument(
+        "--master",
+        default="local[{executors}]",
+        help="Spark master, {executors} is replaced by the executor count",
+    )
+    parser.add_argument(
+        "--spark-submit-args",
+        nargs=argparse.REMAINDER,
+        default=[],
+        help="Extra spark-submit arguments, e.g. --py-files packages.zip",
+    )
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    base_config = read_config(args.config)
+    records = []
+    for scale_factor in args.scale_factors:
+        input_file_paths = prepare_data(args.data_dir, scale_factor, args.seed)
+        for executors in args.executors:
+            for mode in args.modes:
+                record = run_once(
+                    args, base_config, input_file_paths, scale_factor, executors, mode
+                )
+                print(
+                    f"sf={scale_factor:g} executors={executors} mode={mode}: "
+                    f"{record['wall_time_s']:.2f}s (exit {record['returncode']})"
+                )
+                records.append(record)
+
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    with open(args.results, "a") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+    print(f"Wrote {len(records)} benchmark records to {args.results}")
+
+    if args.baseline:
+        regressions = find_regressions(records, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,101 @@
+"""The local backend must return the same results as the Spark path, on the
+generated data, for every analysis."""
+
+import os
+import shutil
+
+import pytest
+import yaml
+
+from benchmark.generate_data import FILE_NAMES, generate
+from utils.registry import ALL_ANALYSES, run_analysis
+
+pytestmark = pytest.mark.skipif(
+    not (shutil.which("java") or os.environ.get("JAVA_HOME")),
+    reason="the Spark path needs a Java runtime",
+)
+
+SCALE_FACTOR = 0.02
+SEED = 7
+
+
+def _normalise(analysis_name, result):
+    """Comparable form of a result: Rows become tuples, and the rows of
+    analysis 5, which has no ranking, are sorted"""
+    if isinstance(result, list):
+        result = [tuple(row) if isinstance(row, tuple) else row for row in result]
+        if analysis_name == "analysis_5":
+            result = sorted(result)
+    return result
+
+
+@pytest.fixture(scope="module")
+def config_path(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp("backends")
+    data_dir = os.path.join(work_dir, "data")
+    generate(data_dir, SCALE_FACTOR, SEED)
+    config = {
+        "INPUT": {
+            table_name: os.path.join(data_dir, file_name)
+            for table_name, file_name in FILE_NAMES.items()
+        },
+        "OUTPUT": {
+            f"{analysis_name}_output": os.path.join(work_dir, "output", analysis_name)
+            for analysis_name in ALL_ANALYSES
+        },
+        "INGEST": {"cache_dir": os.path.join(work_dir, "cache")},
+        "RESULT_CACHE": {"enabled": False},
+        "WRITER": {"async": False},
+        "LICENSES": {"validate_licensed_drivers": True},
+    }
+    path = os.path.join(work_dir, "config.yaml")
+    with open(path, "w") as file:
+        yaml.safe_dump(config, file)
+    return path
+
+
+@pytest.fixture(scope="module")
+def local_results(config_path):
+    from utils.local import LocalAnalysisPlan
+
+    output_file_paths = yaml.safe_load(open(config_path))["OUTPUT"]
+    return LocalAnalysisPlan(config_path).run(output_file_paths)
+
+
+@pytest.fixture(scope="module")
+def spark():
+    from pyspark.sql import SparkSession
+
+    session = (
+        SparkSession.builder.master("local[2]")
+        .appName("test_backends")
+        .config("spark.sql.shuffle.partitions", "4")
+        .getOrCreate()
+    )
+    yield session
+    session.stop()
+
+
+@pytest.mark.parametrize("mode", ["sequential", "fused"])
+def test_local_backend_matches_spark(spark, config_path, local_results, mode):
+    import analysis
+    from utils.fused import FusedAnalysisPlan
+
+    # CarCrashAnalysis reads the session of the analysis.py script
+    analysis.spark = spark
+    output_file_paths = yaml.safe_load(open(config_path))["OUTPUT"]
+    car_crash_analysis = analysis.CarCrashAnalysis(config_path)
+    if mode == "fused":
+        spark_results = FusedAnalysisPlan(car_crash_analysis).run(output_file_paths)
+    else:
+        spark_results = {
+            analysis_name: run_analysis(
+                car_crash_analysis, analysis_name, output_file_paths
+            )
+            for analysis_name in ALL_ANALYSES
+        }
+
+    for analysis_name in ALL_ANALYSES:
+        assert _normalise(analysis_name, spark_results[analysis_name]) == _normalise(
+            analysis_name, local_results[analysis_name]
+        ), analysis_name
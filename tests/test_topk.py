@@ -0,0 +1,69 @@
+"""Space-Saving sketches of utils/topk.py against exact counts. The sketch
+functions are plain Python, so these tests need no SparkSession."""
+
+import random
+from collections import Counter
+
+from utils.topk import merge_sketches, space_saving
+
+CAPACITY = 50
+
+
+def _skewed_values(num_rows, num_values, seed):
+    """Zipf-like values: value i is drawn with weight 1 / (i + 1)"""
+    rng = random.Random(seed)
+    return rng.choices(
+        range(num_values), weights=[1 / (i + 1) for i in range(num_values)], k=num_rows
+    )
+
+
+def _sketch(values, capacity=CAPACITY):
+    return next(space_saving(capacity)(iter(values)))
+
+
+def _assert_within_bound(merged, exact, num_rows, capacity=CAPACITY):
+    """Every sketched count over-estimates its true count by at most
+    num_rows / capacity, and by no more than its recorded error"""
+    assert len(merged) <= capacity
+    for value, (count, error) in merged.items():
+        assert exact[value] <= count <= exact[value] + num_rows / capacity
+        assert count - error <= exact[value]
+
+
+def test_single_sketch_is_within_the_bound():
+    values = _skewed_values(20000, 500, seed=1)
+    _assert_within_bound(
+        merge_sketches([_sketch(values)], CAPACITY), Counter(values), len(values)
+    )
+
+
+def test_merge_of_full_and_partial_sketches_is_within_the_bound():
+    # Two partitions with more distinct values than counters, one with fewer
+    partitions = [
+        _skewed_values(15000, 500, seed=2),
+        _skewed_values(5000, 2000, seed=3),
+        _skewed_values(3000, 20, seed=4),
+    ]
+    sketches = [_sketch(values) for values in partitions]
+    assert [len(sketch) for sketch in sketches] == [CAPACITY, CAPACITY, 20]
+
+    values = [value for partition in partitions for value in partition]
+    _assert_within_bound(
+        merge_sketches(sketches, CAPACITY), Counter(values), len(values)
+    )
+
+
+def test_sketches_are_exact_without_more_values_than_counters():
+    partitions = [_skewed_values(4000, 30, seed=seed) for seed in range(3)]
+    merged = merge_sketches([_sketch(values) for values in partitions], CAPACITY)
+    exact = Counter(value for partition in partitions for value in partition)
+    assert {value: count for value, (count, _) in merged.items()} == dict(exact)
+    assert all(error == 0 for _, error in merged.values())
+
+
+def test_heaviest_values_keep_their_rank():
+    values = _skewed_values(30000, 1000, seed=5)
+    partitions = [values[start::4] for start in range(4)]
+    merged = merge_sketches([_sketch(partition) for partition in partitions], CAPACITY)
+    top_sketched = sorted(merged, key=lambda value: -merged[value][0])[:3]
+    assert top_sketched == [value for value, _ in Counter(values).most_common(3)]
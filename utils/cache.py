@@ -0,0 +1,188 @@
+"""Lazy input tables and their cache lifecycle.
+
+Input tables are only read when an analysis first asks for them. A table is
+cached when at least min_uses of the scheduled analyses read it, at a
+storage level chosen from its estimated size and the free storage memory of
+the executors. Every finished analysis releases its inputs, and a table is
+unpersisted as soon as no remaining analysis reads it.
+"""
+
+import logging
+import threading
+
+from pyspark import StorageLevel
+
+from utils.registry import ALL_ANALYSES, ANALYSIS_INPUTS, DERIVED_INPUTS
+from utils.writer import estimate_size_in_bytes
+
+logger = logging.getLogger(__name__)
+
+STORAGE_LEVELS = {
+    "MEMORY_ONLY": StorageLevel.MEMORY_ONLY,
+    "MEMORY_AND_DISK_DESER": StorageLevel.MEMORY_AND_DISK_DESER,
+    # Serialized in-memory blocks, spilled to disk when memory runs out
+    "MEMORY_AND_DISK_SER": StorageLevel(True, True, False, False),
+    "DISK_ONLY": StorageLevel.DISK_ONLY,
+}
+
+
+def storage_memory_remaining(spark):
+    """Free storage memory summed over the executors (and the driver in
+    local mode).
+    :param spark: Spark session object.
+    :return: Bytes, or None if Spark does not expose the information.
+    """
+    try:
+        statuses = (
+            spark.sparkContext._jsc.sc().getExecutorMemoryStatus().values().iterator()
+        )
+        remaining = 0
+        while statuses.hasNext():
+            remaining += statuses.next()._2()
+        return remaining
+    except Exception:
+        return None
+
+
+class CacheManager:
+    """Load input tables on first use and cache them only while a scheduled
+    analysis still needs them"""
+
+    def __init__(self, spark, cache_config=None, writer=None):
+        """
+        :param spark: Spark session object.
+        :param cache_config: CACHE section of config.yaml
+        :param writer: Optional OutputWriter; tables are unpersisted only once
+            the writes already submitted have finished, as they may read them
+        """
+        cache_config = cache_config or {}
+        self.spark = spark
+        self.storage_level = cache_config.get("storage_level", "auto")
+        self.memory_fraction = cache_config.get("memory_fraction", 0.5)
+        self.min_uses = cache_config.get("min_uses", 2)
+        self.writer = writer
+        self._tables = {}
+        self._cached = set()
+        self._uses = {}
+        self._pinned = False
+        self._lock = threading.RLock()
+        # Table name -> lock held while that table loads
+        self._load_locks = {}
+        self.plan(ALL_ANALYSES)
+
+    def pin(self):
+        """Cache every table on first use and keep it cached, whatever the
+        scheduled analyses, e.g. for the requests of the analysis server.
+        :return: None
+        """
+        with self._lock:
+            self._pinned = True
+
+    def plan(self, analyses):
+        """Count how many of the scheduled analyses read every table. Derived
+        tables (the Person-Units join) count as one use of their parents.
+        :param analyses: Names of the scheduled analyses
+        :return: None
+        """
+        with self._lock:
+            self._uses = {}
+            for analysis_name in analyses:
+                for table_name in ANALYSIS_INPUTS.get(analysis_name, []):
+                    self._uses[table_name] = self._uses.get(table_name, 0) + 1
+            for table_name, parents in DERIVED_INPUTS.items():
+                if self._uses.get(table_name):
+                    for parent in parents:
+                        self._uses[parent] = self._uses.get(parent, 0) + 1
+
+    def will_cache(self, table_name):
+        """Whether a table is read by enough scheduled analyses to be cached"""
+        return self._pinned or self._uses.get(table_name, 0) >= self.min_uses
+
+    def choose_storage_level(self, df):
+        """Storage level of a table about to be cached: the configured one,
+        or with 'auto' deserialized unless the table's estimated size exceeds
+        memory_fraction of the free storage memory.
+        :param df: Spark DataFrame.
+        :return: StorageLevel
+        """
+        if self.storage_level != "auto":
+            return STORAGE_LEVELS[self.storage_level]
+        size_in_bytes = estimate_size_in_bytes(df)
+        remaining = storage_memory_remaining(self.spark)
+        if (
+            size_in_bytes is not None
+            and remaining is not None
+            and size_in_bytes > remaining * self.memory_fraction
+        ):
+            return STORAGE_LEVELS["MEMORY_AND_DISK_SER"]
+        return STORAGE_LEVELS["MEMORY_AND_DISK_DESER"]
+
+    def get(self, table_name, load):
+        """DataFrame of a table, loaded on first use. The same DataFrame is
+        returned on every call. A table is loaded under its own lock, so
+        other tables load concurrently.
+        :param table_name: Name of the table, e.g. 'Units' or 'Person_Units'
+        :param load: Function returning the DataFrame when first needed
+        :return: Spark DataFrame
+        """
+        with self._lock:
+            if table_name in self._tables:
+                return self._tables[table_name]
+            load_lock = self._load_locks.setdefault(table_name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                if table_name in self._tables:
+                    return self._tables[table_name]
+            df = load()
+            with self._lock:
+                if self.will_cache(table_name):
+                    storage_level = self.choose_storage_level(df)
+                    df.persist(storage_level)
+                    self._cached.add(table_name)
+                    logger.info(f"Caching {table_name} with {storage_level}")
+                self._tables[table_name] = df
+            return df
+
+    def release(self, analysis_name):
+        """Drop the uses of a finished analysis, unpersisting every table no
+        remaining analysis reads.
+        :param analysis_name: Name of the analysis
+        :return: None
+        """
+        with self._lock:
+            if self._pinned:
+                return
+            for table_name in ANALYSIS_INPUTS.get(analysis_name, []):
+                self._release_table(table_name)
+
+    def _release_table(self, table_name):
+        if not self._uses.get(table_name):
+            return
+        self._uses[table_name] -= 1
+        if self._uses[table_name]:
+            return
+        for parent in DERIVED_INPUTS.get(table_name, []):
+            self._release_table(parent)
+        if table_name in self._cached:
+            self._cached.discard(table_name)
+            self._unpersist(table_name, self._tables[table_name])
+
+    def _unpersist(self, table_name, df):
+        def unpersist():
+            df.unpersist()
+            logger.info(f"Unpersisted {table_name}")
+
+        if self.writer is None:
+            unpersist()
+        else:
+            self.writer.when_written(unpersist)
+
+    def unpersist_all(self):
+        """Unpersist every cached table, e.g. at the end of an incremental
+        batch.
+        :return: None
+        """
+        with self._lock:
+            for table_name in list(self._cached):
+                self._unpersist(table_name, self._tables[table_name])
+            self._cached.clear()
@@ -0,0 +1,426 @@
+"""Fused execution plan for the CarCrashAnalysis analyses.
+
+Instead of every analysis method starting its own Spark jobs, the requested
+analyses are planned together: each input is scanned once into a small
+pre-aggregated profile (per-VEH_MAKE_ID, per-VEH_COLOR_ID, per-state counts
+and so on), every scalar or ranked answer is derived from those profiles on
+the driver, and only the output writes go back to the full tables.
+"""
+
+from pyspark.sql import DataFrame, Row
+from pyspark.sql.functions import (
+    array,
+    col,
+    count,
+    explode,
+    lit,
+    struct,
+    sum as sum_,
+    when,
+)
+
+from utils.predicates import (
+    has_liability_insurance,
+    is_alcohol_related,
+    is_damage_above_4,
+    is_known_body_style,
+    is_known_ethnicity,
+    is_male,
+    is_no_damaged_property,
+    is_speeding_charge,
+    is_state_code,
+    is_two_wheeler,
+)
+from utils.registry import ALL_ANALYSES, run_analysis
+from utils.topk import top_k
+
+
+def sort_desc(items, key, tie_key):
+    """Sort descending the way TopK.rank does: nulls last, ties ascending
+    by tie_key."""
+    return top_k(items, key, tie_key=tie_key)
+
+
+def group_by_dimension(rows):
+    """Group profile Rows by their 'dimension' column.
+    :param rows: Rows of a stacked profile
+    :return: dictionary of dimension -> list of Rows
+    """
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row["dimension"], []).append(row)
+    return grouped
+
+
+def person_profile_df(car_crash_analysis):
+    """Crash count per gender and licence state of Primary_Person.
+    :param car_crash_analysis: CarCrashAnalysis holding the input DataFrames
+    :return: DataFrame (PRSN_GNDR_ID, DRVR_LIC_STATE_ID, count)
+    """
+    return car_crash_analysis.Primary_person_use_df.groupBy(
+        "PRSN_GNDR_ID", "DRVR_LIC_STATE_ID"
+    ).count()
+
+
+def units_profile_df(car_crash_analysis):
+    """Every per-key Units count the analyses need. Each unit is stacked once
+    per dimension so a single groupBy yields the per-VEH_MAKE_ID injuries,
+    the per-VEH_COLOR_ID and per-VEH_LIC_STATE_ID counts and the two wheeler
+    count.
+    :param car_crash_analysis: CarCrashAnalysis holding the input DataFrames
+    :return: DataFrame (dimension, key, count, total_injuries, state_code_rows)
+    """
+    dictionaries = car_crash_analysis.dictionaries
+    injuries = col("TOT_INJRY_CNT") + col("DEATH_CNT")
+
+    def dimension(name, value):
+        return struct(lit(name).alias("dimension"), value.cast("string").alias("key"))
+
+    return (
+        car_crash_analysis.Units_use_df.select(
+            injuries.alias("ALL_INJURIES"),
+            is_state_code(dictionaries).alias("IS_STATE_CODE"),
+            explode(
+                array(
+                    dimension("VEH_MAKE_ID", col("VEH_MAKE_ID")),
+                    dimension("VEH_COLOR_ID", col("VEH_COLOR_ID")),
+                    dimension("VEH_LIC_STATE_ID", col("VEH_LIC_STATE_ID")),
+                    dimension("TWO_WHEELER", is_two_wheeler(dictionaries)),
+                )
+            ).alias("stacked"),
+        )
+        .groupBy("stacked.dimension", "stacked.key")
+        .agg(
+            count(lit(1)).alias("count"),
+            sum_("ALL_INJURIES").alias("total_injuries"),
+            sum_(when(col("IS_STATE_CODE"), 1).otherwise(0)).alias("state_code_rows"),
+        )
+    )
+
+
+def person_units_profile_df(car_crash_analysis):
+    """(body style, ethnicity) and alcohol zip counts of the shared
+    Primary_Person join Units view, used by analyses 5 and 6.
+    :param car_crash_analysis: CarCrashAnalysis holding the input DataFrames
+    :return: DataFrame (dimension, key_1, key_2, count)
+    """
+    dictionaries = car_crash_analysis.dictionaries
+    return (
+        car_crash_analysis.person_units_use_df.select(
+            explode(
+                array(
+                    struct(
+                        lit("BODY_STYLE_ETHNICITY").alias("dimension"),
+                        col("VEH_BODY_STYL_ID").alias("key_1"),
+                        col("PRSN_ETHNICITY_ID").alias("key_2"),
+                        (
+                            is_known_body_style(dictionaries)
+                            & is_known_ethnicity(dictionaries)
+                        ).alias("keep"),
+                    ),
+                    struct(
+                        lit("ALCOHOL_ZIP").alias("dimension"),
+                        col("DRVR_ZIP").alias("key_1"),
+                        lit(None).cast("string").alias("key_2"),
+                        (
+                            col("DRVR_ZIP").isNotNull()
+                            & is_alcohol_related(dictionaries)
+                        ).alias("keep"),
+                    ),
+                )
+            ).alias("stacked")
+        )
+        .filter(col("stacked.keep"))
+        .groupBy("stacked.dimension", "stacked.key_1", "stacked.key_2")
+        .count()
+    )
+
+
+def insurance_crashes_df(car_crash_analysis):
+    """Rows of analysis 7: Units with damage level above 4 and liability
+    insurance, filtered before the join with the Damages showing no damaged
+    property.
+    :param car_crash_analysis: CarCrashAnalysis holding the input DataFrames
+    :return: DataFrame
+    """
+    dictionaries = car_crash_analysis.dictionaries
+    units = car_crash_analysis.Units_use_df.filter(
+        is_damage_above_4(dictionaries) & has_liability_insurance(dictionaries)
+    )
+    return car_crash_analysis.skew.join(
+        car_crash_analysis.Damages_use_df.filter(is_no_damaged_property(dictionaries)),
+        units,
+        "CRASH_ID",
+        how="inner",
+    )
+
+
+def speeding_units_df(car_crash_analysis, colors=None, states=None):
+    """Units of the crashes in which a licensed driver was charged with
+    speeding (analysis 8), one row per matching person, charge and unit.
+    :param car_crash_analysis: CarCrashAnalysis holding the input DataFrames
+    :param colors: Optional VEH_COLOR_IDs to keep
+    :param states: Optional VEH_LIC_STATE_IDs to keep
+    :return: DataFrame (CRASH_ID, VEH_MAKE_ID, VEH_COLOR_ID, VEH_LIC_STATE_ID)
+    """
+    dictionaries = car_crash_analysis.dictionaries
+    units = car_crash_analysis.Units_use_df.select(
+        "CRASH_ID", "VEH_MAKE_ID", "VEH_COLOR_ID", "VEH_LIC_STATE_ID"
+    )
+    if colors is not None:
+        units = units.filter(col("VEH_COLOR_ID").isin(colors))
+    if states is not None:
+        units = units.filter(col("VEH_LIC_STATE_ID").isin(states))
+    skew = car_crash_analysis.skew
+    return skew.join(
+        skew.join(
+            car_crash_analysis.licensed_drivers_df().select("CRASH_ID"),
+            car_crash_analysis.Charges_use_df.filter(
+                is_speeding_charge(dictionaries)
+            ).select("CRASH_ID"),
+            "CRASH_ID",
+        ),
+        units,
+        "CRASH_ID",
+    )
+
+
+def male_count(person_profile):
+    """Number of male persons, from a Primary_Person profile"""
+    return sum(row["count"] for row in person_profile if row["PRSN_GNDR_ID"] == "MALE")
+
+
+def two_wheeler_count(units_profile):
+    """Number of two wheeler units, from a Units profile"""
+    return sum(
+        row["count"]
+        for row in units_profile.get("TWO_WHEELER", [])
+        if row["key"] == "true"
+    )
+
+
+def top_colors(units_profile, k=10):
+    """Most used vehicle colours, NA excluded, from a Units profile
+    :param units_profile: dictionary of dimension -> list of Rows
+    :param k: Number of colours
+    :return: list of VEH_COLOR_IDs
+    """
+    return [
+        row["key"]
+        for row in top_k(
+            [
+                row
+                for row in units_profile.get("VEH_COLOR_ID", [])
+                if row["key"] is not None and row["key"] != "NA"
+            ],
+            key=lambda row: row["count"],
+            k=k,
+            tie_key=lambda row: row["key"],
+        )
+    ]
+
+
+def vehicle_license_states(units_profile):
+    """Vehicle licence states that are not numeric bad records, from a
+    Units profile"""
+    return [
+        row["key"]
+        for row in units_profile.get("VEH_LIC_STATE_ID", [])
+        if row["state_code_rows"] == row["count"]
+    ]
+
+
+class FusedAnalysisPlan:
+    """Compute several CarCrashAnalysis results from shared passes"""
+
+    def __init__(self, car_crash_analysis, analyses=None):
+        """
+        :param car_crash_analysis: CarCrashAnalysis holding the input DataFrames
+        :param analyses: Names of the analyses to run, all eight by default
+        """
+        self.analysis = car_crash_analysis
+        self.analyses = list(analyses or ALL_ANALYSES)
+        self.spark = car_crash_analysis.spark
+        self.writer = car_crash_analysis.writer
+        self.profiler = car_crash_analysis.profiler
+        self.top_k = car_crash_analysis.top_k
+        self._person_profile = None
+        self._units_profile = None
+        self._person_units_profile = None
+
+    def person_profile(self):
+        """Gender and licence state profile, computed in one pass over
+        Primary_Person and collected to the driver.
+        :return: list of Rows (PRSN_GNDR_ID, DRVR_LIC_STATE_ID, count)
+        """
+        if self._person_profile is None:
+            self._person_profile = person_profile_df(self.analysis).collect()
+        return self._person_profile
+
+    def units_profile(self):
+        """Per-key Units counts, computed in one pass over Units.
+        :return: dictionary of dimension -> list of Rows
+        """
+        if self._units_profile is None:
+            self._units_profile = group_by_dimension(
+                units_profile_df(self.analysis).collect()
+            )
+        return self._units_profile
+
+    def person_units_profile(self):
+        """Body style, ethnicity and alcohol zip counts, computed in one pass
+        over the shared Primary_Person join Units view.
+        :return: dictionary of dimension -> list of Rows
+        """
+        if self._person_units_profile is None:
+            self._person_units_profile = group_by_dimension(
+                person_units_profile_df(self.analysis).collect()
+            )
+        return self._person_units_profile
+
+    def male_car_crash_analysis(self, output_path):
+        """Analysis 1 from the gender profile"""
+        self.writer.save(
+            self.analysis.Primary_person_use_df.filter(
+                is_male(self.analysis.dictionaries)
+            ),
+            output_path,
+        )
+        return male_count(self.person_profile())
+
+    def two_wheeler_crash_analysis(self, output_path):
+        """Analysis 2 from the two wheeler dimension of the Units profile"""
+        self.writer.save(
+            self.analysis.Units_use_df.filter(
+                is_two_wheeler(self.analysis.dictionaries)
+            ),
+            output_path,
+        )
+        return two_wheeler_count(self.units_profile())
+
+    def female_car_crash_analysis(self, output_path):
+        """Analysis 3 from the gender and licence state profile"""
+        female_states = sort_desc(
+            [
+                Row(DRVR_LIC_STATE_ID=row["DRVR_LIC_STATE_ID"], count=row["count"])
+                for row in self.person_profile()
+                if row["PRSN_GNDR_ID"] == "FEMALE"
+            ],
+            key=lambda row: row["count"],
+            tie_key=lambda row: row["DRVR_LIC_STATE_ID"],
+        )
+        self.writer.save(
+            self.spark.createDataFrame(
+                female_states, "DRVR_LIC_STATE_ID string, count long"
+            ),
+            output_path,
+        )
+        return female_states[0]["DRVR_LIC_STATE_ID"]
+
+    def vehicle_make_crash_analysis(self, output_path):
+        """Analysis 4 from the per-VEH_MAKE_ID injuries"""
+        parameters = self.top_k.parameters("analysis_4")
+        top_15_makes = top_k(
+            [
+                Row(VEH_MAKE_ID=row["key"], total_injuries=row["total_injuries"])
+                for row in self.units_profile().get("VEH_MAKE_ID", [])
+                if row["key"] is not None and row["key"] != "NA"
+            ],
+            key=lambda row: row["total_injuries"],
+            k=parameters["offset"] + parameters["k"],
+            tie_key=lambda row: row["VEH_MAKE_ID"],
+        )
+        self.writer.save(
+            self.spark.createDataFrame(
+                top_15_makes, "VEH_MAKE_ID string, total_injuries long"
+            ),
+            output_path,
+        )
+        return [row["VEH_MAKE_ID"] for row in top_15_makes[parameters["offset"] :]]
+
+    def vehicle_body_style_crash_analysis(self, output_path):
+        """Analysis 5 from the shared Person join Units profile"""
+        top_ethnicity = {}
+        for row in self.person_units_profile().get("BODY_STYLE_ETHNICITY", []):
+            best = top_ethnicity.get(row["key_1"])
+            # Ties go to the first ethnicity, like the Spark window's order
+            if best is None or (-row["count"], row["key_2"]) < (
+                -best["count"],
+                best["key_2"],
+            ):
+                top_ethnicity[row["key_1"]] = row
+        vehicle_and_ethnicity_list = [
+            Row(VEH_BODY_STYL_ID=row["key_1"], PRSN_ETHNICITY_ID=row["key_2"])
+            for row in top_ethnicity.values()
+        ]
+        self.writer.save(
+            self.spark.createDataFrame(
+                vehicle_and_ethnicity_list,
+                "VEH_BODY_STYL_ID string, PRSN_ETHNICITY_ID string",
+            ),
+            output_path,
+        )
+        return vehicle_and_ethnicity_list
+
+    def alcohol_related_crash_analysis(self, output_path):
+        """Analysis 6 from the shared Person join Units profile"""
+        parameters = self.top_k.parameters("analysis_6")
+        top_5_zips = top_k(
+            [
+                Row(DRVR_ZIP=row["key_1"], count=row["count"])
+                for row in self.person_units_profile().get("ALCOHOL_ZIP", [])
+            ],
+            key=lambda row: row["count"],
+            k=parameters["k"],
+            offset=parameters["offset"],
+            tie_key=lambda row: row["DRVR_ZIP"],
+        )
+        self.writer.save(
+            self.spark.createDataFrame(top_5_zips, "DRVR_ZIP string, count long"),
+            output_path,
+        )
+        return top_5_zips
+
+    def insurance_related_crash_analysis(self, output_path):
+        """Analysis 7, filtering Units before the join with Damages"""
+        return self.writer.save(
+            insurance_crashes_df(self.analysis), output_path, result=DataFrame.count
+        )
+
+    def speeding_related_crash_analysis(self, output_path):
+        """Analysis 8, taking the top colours and states from the Units
+        profile instead of two extra group-by jobs"""
+        parameters = self.top_k.parameters("analysis_8")
+        speeding_makes = (
+            speeding_units_df(
+                self.analysis,
+                top_colors(self.units_profile(), parameters["colors"]),
+                vehicle_license_states(self.units_profile()),
+            )
+            .groupby("VEH_MAKE_ID")
+            .count()
+            .collect()
+        )
+        speeding_makes = sort_desc(
+            speeding_makes,
+            key=lambda row: row["count"],
+            tie_key=lambda row: row["VEH_MAKE_ID"],
+        )
+        self.writer.save(
+            self.spark.createDataFrame(
+                speeding_makes, "VEH_MAKE_ID string, count long"
+            ),
+            output_path,
+        )
+        return speeding_makes[
+            parameters["offset"] : parameters["offset"] + parameters["k"]
+        ]
+
+    def run(self, output_file_paths):
+        """Run every planned analysis, sharing the profiles between them.
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: dictionary of analysis name -> result
+        """
+        return {
+            name: run_analysis(self, name, output_file_paths) for name in self.analyses
+        }
@@ -1,28 +1,46 @@
 import yaml
 
 
-def extract_data(spark, file_path):
+def extract_data(spark, file_path, schema=None):
     """Load data from CSV file format.
     :param spark: Spark session object.
     :param file_path: CSV File path
+    :param schema: Optional StructType; when omitted the schema is inferred,
+        which costs an extra pass over the file.
     :return: Spark DataFrame.
     """
-    df = (
-        spark
-        .read
-        .csv(file_path, header=True, inferSchema=True)
-        )
+    if schema is not None:
+        return spark.read.csv(file_path, header=True, schema=schema)
+
+    df = spark.read.csv(file_path, header=True, inferSchema=True)
 
     return df
 
 
-def load_data_to_csv(df, file_path):
+def load_data_to_csv(
+    df, file_path, num_partitions=1, partition_by=None, compression=None
+):
     """Collect data locally and write to file.
     :param df: DataFrame to print.
     :param file_path: Output path to write DF.
+    :param num_partitions: Number of output files, None keeps the DF's partitions.
+    :param partition_by: Optional list of columns to partition the output by.
+    :param compression: Optional Parquet compression codec, e.g. 'snappy'.
     :return: None
     """
-    df.coalesce(1).write.mode('overwrite').format("parquet").option("header", "true").save(file_path)
+    if num_partitions is not None:
+        # Coalesce only shrinks a cached result; on anything else it would also
+        # run the upstream scan in num_partitions tasks, so shuffle instead
+        if df.is_cached and num_partitions <= df.rdd.getNumPartitions():
+            df = df.coalesce(num_partitions)
+        else:
+            df = df.repartition(num_partitions)
+    writer = df.write.mode("overwrite").format("parquet").option("header", "true")
+    if partition_by:
+        writer = writer.partitionBy(*partition_by)
+    if compression:
+        writer = writer.option("compression", compression)
+    writer.save(file_path)
     return None
 
 
@@ -34,4 +52,4 @@ def read_config(config_file_path):
     """
     with open(config_file_path, "r") as file:
         data = yaml.safe_load(file)
-    return data
\ No newline at end of file
+    return data
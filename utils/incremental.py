@@ -0,0 +1,321 @@
+"""Incremental processing of newly arrived crash batches.
+
+The intermediate aggregates behind analyses 1-8 (counts per gender and
+state, per VEH_MAKE_ID, per DRVR_ZIP, per body style and ethnicity, ...) are
+kept as Parquet under INCREMENTAL.state_dir. A run only reads the batch
+directories it has not processed yet, aggregates them and merges the result
+into that state, then derives every answer from the state.
+
+Every batch must hold complete, new crashes: the crash-keyed joins are
+evaluated inside a batch, which is only exact when no CRASH_ID is split
+across batches.
+"""
+
+import json
+import logging
+import os
+import shutil
+
+from pyspark.sql import Row
+from pyspark.sql.functions import col, count, lit, sum as sum_
+
+from utils.fused import (
+    FusedAnalysisPlan,
+    group_by_dimension,
+    insurance_crashes_df,
+    male_count,
+    person_profile_df,
+    person_units_profile_df,
+    sort_desc,
+    speeding_units_df,
+    top_colors,
+    two_wheeler_count,
+    units_profile_df,
+    vehicle_license_states,
+)
+from utils.helper import load_data_to_csv
+from utils.licenses import LICENSE_TABLES
+from utils.predicates import is_male, is_two_wheeler
+from utils.registry import ALL_ANALYSES, output_path_for
+from utils.topk import TopK
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE_NAME = "_STATE.json"
+INITIAL_BATCH_ID = "initial"
+BATCH_TABLES = ["Primary_Person", "Units", "Damages", "Charges"]
+
+
+def _insurance_count_df(car_crash_analysis):
+    return insurance_crashes_df(car_crash_analysis).agg(count(lit(1)).alias("count"))
+
+
+def _speeding_units_count_df(car_crash_analysis):
+    return (
+        speeding_units_df(car_crash_analysis)
+        .groupBy("VEH_MAKE_ID", "VEH_COLOR_ID", "VEH_LIC_STATE_ID")
+        .count()
+    )
+
+
+# State table -> (builder over a CarCrashAnalysis, group keys, additive measures)
+STATE_AGGREGATES = {
+    "person_profile": (
+        person_profile_df,
+        ["PRSN_GNDR_ID", "DRVR_LIC_STATE_ID"],
+        ["count"],
+    ),
+    "units_profile": (
+        units_profile_df,
+        ["dimension", "key"],
+        ["count", "total_injuries", "state_code_rows"],
+    ),
+    "person_units_profile": (
+        person_units_profile_df,
+        ["dimension", "key_1", "key_2"],
+        ["count"],
+    ),
+    "insurance_crashes": (_insurance_count_df, [], ["count"]),
+    "speeding_units": (
+        _speeding_units_count_df,
+        ["VEH_MAKE_ID", "VEH_COLOR_ID", "VEH_LIC_STATE_ID"],
+        ["count"],
+    ),
+}
+
+# Row level outputs are written once per batch, under <output>/batch_id=<id>
+BATCH_ROW_OUTPUTS = {
+    "analysis_1": lambda batch: batch.Primary_person_use_df.filter(
+        is_male(batch.dictionaries)
+    ),
+    "analysis_2": lambda batch: batch.Units_use_df.filter(
+        is_two_wheeler(batch.dictionaries)
+    ),
+    "analysis_7": insurance_crashes_df,
+}
+
+
+class IncrementalState:
+    """Versioned aggregate state of every batch processed so far"""
+
+    def __init__(self, spark, incremental_config):
+        """
+        :param spark: Spark session object.
+        :param incremental_config: INCREMENTAL section of config.yaml
+        """
+        self.spark = spark
+        self.state_dir = incremental_config.get("state_dir")
+        self.batch_root = incremental_config.get("batch_root")
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.state_dir, STATE_FILE_NAME)
+        if not os.path.isfile(manifest_path):
+            return {"version": 0, "batches": []}
+        with open(manifest_path, "r") as file:
+            return json.load(file)
+
+    def _write_manifest(self, manifest):
+        """Atomically replace the manifest, committing a new state version"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        manifest_path = os.path.join(self.state_dir, STATE_FILE_NAME)
+        with open(f"{manifest_path}.tmp", "w") as file:
+            json.dump(manifest, file)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        self.manifest = manifest
+
+    def _version_path(self, version, table_name):
+        return os.path.join(self.state_dir, f"v{version:06d}", table_name)
+
+    @property
+    def is_empty(self):
+        return self.manifest["version"] == 0
+
+    def table(self, table_name):
+        """Current state of one aggregate.
+        :param table_name: Key of STATE_AGGREGATES
+        :return: Spark DataFrame
+        """
+        return self.spark.read.parquet(
+            self._version_path(self.manifest["version"], table_name)
+        )
+
+    def pending_batches(self, input_file_paths):
+        """Batches not merged into the state yet. While the state is empty the
+        INPUT files themselves are the first batch; afterwards every
+        sub-directory of batch_root is a batch holding files named like the
+        INPUT files. Endorse and Restrict files are optional in a batch.
+        :param input_file_paths: INPUT section of config.yaml
+        :return: list of (batch id, dictionary of table -> file path)
+        """
+        if self.is_empty:
+            return [(INITIAL_BATCH_ID, dict(input_file_paths))]
+        if not self.batch_root or not os.path.isdir(self.batch_root):
+            return []
+
+        batches = []
+        for batch_id in sorted(os.listdir(self.batch_root)):
+            batch_dir = os.path.join(self.batch_root, batch_id)
+            if batch_id in self.manifest["batches"] or not os.path.isdir(batch_dir):
+                continue
+            batch_file_paths = {
+                table_name: os.path.join(
+                    batch_dir, os.path.basename(input_file_paths.get(table_name))
+                )
+                for table_name in BATCH_TABLES
+            }
+            missing = [
+                path for path in batch_file_paths.values() if not os.path.isfile(path)
+            ]
+            if missing:
+                raise ValueError(f"Batch {batch_id} is incomplete, missing {missing}")
+            for table_name in LICENSE_TABLES:
+                license_file_path = os.path.join(
+                    batch_dir, os.path.basename(input_file_paths.get(table_name, ""))
+                )
+                if input_file_paths.get(table_name) and os.path.isfile(
+                    license_file_path
+                ):
+                    batch_file_paths[table_name] = license_file_path
+            batches.append((batch_id, batch_file_paths))
+        return batches
+
+    def ingest_batch(self, batch_id, batch, output_file_paths):
+        """Merge one batch into the state and write its row level outputs.
+        :param batch_id: Name of the batch directory
+        :param batch: CarCrashAnalysis over the batch files only
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: None
+        """
+        logger.info(f"Merging batch {batch_id} into {self.state_dir}")
+        if batch_id == INITIAL_BATCH_ID:
+            # Outputs of earlier full runs are replaced by per-batch outputs
+            for analysis_name in BATCH_ROW_OUTPUTS:
+                shutil.rmtree(
+                    output_path_for(output_file_paths, analysis_name),
+                    ignore_errors=True,
+                )
+        for analysis_name, rows in BATCH_ROW_OUTPUTS.items():
+            batch.writer.save(
+                rows(batch),
+                os.path.join(
+                    output_path_for(output_file_paths, analysis_name),
+                    f"batch_id={batch_id}",
+                ),
+            )
+
+        version = self.manifest["version"] + 1
+        for table_name, (builder, keys, measures) in STATE_AGGREGATES.items():
+            merged = builder(batch)
+            if not self.is_empty:
+                merged = (
+                    self.table(table_name)
+                    .unionByName(merged)
+                    .groupBy(*keys)
+                    .agg(*[sum_(col(measure)).alias(measure) for measure in measures])
+                )
+            load_data_to_csv(merged, self._version_path(version, table_name))
+        batch.writer.wait()
+        batch.cache_manager.unpersist_all()
+
+        previous_version = self.manifest["version"]
+        self._write_manifest(
+            {"version": version, "batches": self.manifest["batches"] + [batch_id]}
+        )
+        if previous_version:
+            shutil.rmtree(
+                os.path.join(self.state_dir, f"v{previous_version:06d}"),
+                ignore_errors=True,
+            )
+
+
+class IncrementalAnalysisPlan(FusedAnalysisPlan):
+    """Derive the results of analyses 1-8 from the incremental state. The
+    ranked outputs are rewritten from the state, the row level outputs of
+    analyses 1, 2 and 7 were already written per batch."""
+
+    def __init__(self, state, writer, analyses=None, profiler=None, top_k=None):
+        """
+        :param state: IncrementalState with every pending batch merged
+        :param writer: OutputWriter for the outputs derived from the state
+        :param analyses: Names of the analyses to run, all eight by default
+        :param profiler: Optional AnalysisProfiler
+        :param top_k: Optional TopK holding the ranking parameters
+        """
+        self.state = state
+        self.analyses = list(analyses or ALL_ANALYSES)
+        self.spark = state.spark
+        self.writer = writer
+        self.profiler = profiler
+        self.top_k = top_k or TopK()
+        self._person_profile = None
+        self._units_profile = None
+        self._person_units_profile = None
+
+    def person_profile(self):
+        if self._person_profile is None:
+            self._person_profile = self.state.table("person_profile").collect()
+        return self._person_profile
+
+    def units_profile(self):
+        if self._units_profile is None:
+            self._units_profile = group_by_dimension(
+                self.state.table("units_profile").collect()
+            )
+        return self._units_profile
+
+    def person_units_profile(self):
+        if self._person_units_profile is None:
+            self._person_units_profile = group_by_dimension(
+                self.state.table("person_units_profile").collect()
+            )
+        return self._person_units_profile
+
+    def male_car_crash_analysis(self, output_path):
+        """Analysis 1 from the merged gender profile"""
+        return male_count(self.person_profile())
+
+    def two_wheeler_crash_analysis(self, output_path):
+        """Analysis 2 from the merged Units profile"""
+        return two_wheeler_count(self.units_profile())
+
+    def insurance_related_crash_analysis(self, output_path):
+        """Analysis 7 from the merged count of qualifying rows"""
+        return sum(
+            row["count"] for row in self.state.table("insurance_crashes").collect()
+        )
+
+    def speeding_related_crash_analysis(self, output_path):
+        """Analysis 8 from the merged speeding counts per make, colour and
+        state, restricted to the current top colours and states"""
+        parameters = self.top_k.parameters("analysis_8")
+        colors = set(top_colors(self.units_profile(), parameters["colors"]))
+        states = set(vehicle_license_states(self.units_profile()))
+        make_counts = {}
+        for row in self.state.table("speeding_units").collect():
+            # isin never matches a null colour or state
+            if (
+                row["VEH_COLOR_ID"] in colors
+                and row["VEH_LIC_STATE_ID"] is not None
+                and row["VEH_LIC_STATE_ID"] in states
+            ):
+                make_counts[row["VEH_MAKE_ID"]] = (
+                    make_counts.get(row["VEH_MAKE_ID"], 0) + row["count"]
+                )
+        speeding_makes = sort_desc(
+            [
+                Row(VEH_MAKE_ID=make, count=make_count)
+                for make, make_count in make_counts.items()
+            ],
+            key=lambda row: row["count"],
+            tie_key=lambda row: row["VEH_MAKE_ID"],
+        )
+        self.writer.save(
+            self.spark.createDataFrame(
+                speeding_makes, "VEH_MAKE_ID string, count long"
+            ),
+            output_path,
+        )
+        return speeding_makes[
+            parameters["offset"] : parameters["offset"] + parameters["k"]
+        ]
@@ -0,0 +1,290 @@
+"""Ingest stage: convert the INPUT CSV files into a reusable Parquet copy.
+
+Next to the copy, the distinct values of every categorical column are stored
+as that column's dictionary, which the predicates resolve their conditions
+against. A column with more than INGEST.max_dictionary_size distinct values
+gets no dictionary. Derived columns such as the integer ordinals of the
+damage scales are stored alongside the source columns, so Parquet keeps
+min/max statistics for them and range filters on them skip row groups.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from pyspark.sql.functions import col, collect_set
+from pyspark.sql.types import IntegerType, StructField, StructType
+
+from utils.helper import extract_data
+from utils.predicates import DAMAGE_SCALE_ORDINALS, damage_scale_ordinal
+from utils.schemas import CATEGORICAL_COLUMNS, get_schema
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = "_SOURCE_MANIFEST.json"
+DICTIONARIES_FILE_NAME = "_DICTIONARIES.json"
+
+# Table -> derived integer column -> (source column, Column function deriving it)
+DERIVED_COLUMNS = {
+    "Units": {
+        ordinal: (source, damage_scale_ordinal)
+        for source, ordinal in DAMAGE_SCALE_ORDINALS.items()
+    }
+}
+
+
+def with_derived_columns(df, table_name):
+    """Add the derived columns of a table to a DataFrame of its source
+    columns.
+    :param df: Spark DataFrame with the declared schema of the table.
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :return: Spark DataFrame.
+    """
+    for name, (source, derive) in DERIVED_COLUMNS.get(table_name, {}).items():
+        df = df.withColumn(name, derive(col(source)))
+    return df
+
+
+def _stored_schema(table_name):
+    """Schema of the Parquet copy: the declared schema plus derived columns"""
+    return StructType(
+        get_schema(table_name).fields
+        + [
+            StructField(name, IntegerType(), True)
+            for name in DERIVED_COLUMNS.get(table_name, {})
+        ]
+    )
+
+
+def _source_signature(file_path):
+    """Size and modification time of a local source file.
+    :param file_path: CSV File path
+    :return: dictionary with the file size and mtime, or None if the file
+        is not on the local file system.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    stat = os.stat(file_path)
+    return {
+        "path": os.path.abspath(file_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+
+
+def _read_manifest(parquet_path):
+    """Read the manifest stored next to a Parquet copy.
+    :param parquet_path: Directory of the Parquet copy.
+    :return: dictionary with the manifest, or None if missing.
+    """
+    manifest_path = os.path.join(parquet_path, MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+
+def _write_manifest(parquet_path, manifest):
+    """Record the manifest once the Parquet copy is fully written.
+    :param parquet_path: Directory of the Parquet copy.
+    :param manifest: Manifest from _expected_manifest.
+    :return: None
+    """
+    with open(os.path.join(parquet_path, MANIFEST_FILE_NAME), "w") as file:
+        json.dump(manifest, file)
+
+
+def _expected_manifest(file_path, ingest_config, table_name=None):
+    """Manifest a Parquet copy must carry to be reused: the source signature,
+    a hash of the schema it was read with and the storage layout it was
+    written with.
+    :param file_path: CSV File path
+    :param ingest_config: INGEST section of config.yaml
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :return: dictionary, or None if the source is not a local file.
+    """
+    signature = _source_signature(file_path)
+    if signature is None:
+        return None
+    return {
+        "source": signature,
+        "schema": (
+            None
+            if table_name is None
+            else hashlib.sha256(_stored_schema(table_name).json().encode()).hexdigest()
+        ),
+        "num_partitions": ingest_config.get("num_partitions", 8),
+        "num_buckets": ingest_config.get("num_buckets", 0),
+        "max_dictionary_size": ingest_config.get("max_dictionary_size", 1000),
+        "derived_columns": list(DERIVED_COLUMNS.get(table_name, {})),
+    }
+
+
+def is_parquet_copy_fresh(file_path, parquet_path, ingest_config, table_name=None):
+    """Check whether the Parquet copy still matches its CSV source.
+    :param file_path: CSV File path
+    :param parquet_path: Directory of the Parquet copy.
+    :param ingest_config: INGEST section of config.yaml
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :return: True when the source size, mtime, schema and layout are unchanged.
+    """
+    manifest = _expected_manifest(file_path, ingest_config, table_name)
+    return manifest is not None and _read_manifest(parquet_path) == manifest
+
+
+def bucketed_table_name(table_name):
+    """Catalog name of the CRASH_ID bucketed copy of an INPUT table"""
+    return f"crash_keyed_{table_name.lower()}"
+
+
+def _write_bucketed(spark, df, table_name, parquet_path, num_buckets):
+    """Write a DataFrame bucketed and sorted by CRASH_ID, so that joins
+    between tables with the same bucket count need no shuffle.
+    :param spark: Spark session object.
+    :param df: DataFrame to write.
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :param parquet_path: Directory of the bucketed copy.
+    :param num_buckets: Number of CRASH_ID buckets, the same for every table.
+    :return: None
+    """
+    spark.sql(f"DROP TABLE IF EXISTS {bucketed_table_name(table_name)}")
+    shutil.rmtree(parquet_path, ignore_errors=True)
+    (
+        df.write.bucketBy(num_buckets, "CRASH_ID")
+        .sortBy("CRASH_ID")
+        .mode("overwrite")
+        .format("parquet")
+        .option("path", os.path.abspath(parquet_path))
+        .saveAsTable(bucketed_table_name(table_name))
+    )
+
+
+def _read_bucketed(spark, table_name, parquet_path, num_buckets, schema):
+    """Register an existing bucketed copy in the session catalog, which does
+    not outlive the SparkSession, and return it as a DataFrame.
+    :param spark: Spark session object.
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :param parquet_path: Directory of the bucketed copy.
+    :param num_buckets: Number of CRASH_ID buckets it was written with.
+    :param schema: StructType of the table.
+    :return: Spark DataFrame.
+    """
+    columns = ", ".join(
+        f"`{field.name}` {field.dataType.simpleString()}" for field in schema.fields
+    )
+    spark.sql(
+        f"CREATE TABLE IF NOT EXISTS {bucketed_table_name(table_name)} ({columns}) "
+        f"USING PARQUET CLUSTERED BY (CRASH_ID) SORTED BY (CRASH_ID) "
+        f"INTO {num_buckets} BUCKETS LOCATION '{os.path.abspath(parquet_path)}'"
+    )
+    return spark.table(bucketed_table_name(table_name))
+
+
+def _write_dictionaries(df, parquet_path, columns, max_dictionary_size):
+    """Collect the distinct values of categorical columns in one pass and
+    store them next to the Parquet copy.
+    :param df: DataFrame reading the Parquet copy.
+    :param parquet_path: Directory of the Parquet copy.
+    :param columns: Names of the categorical columns of the table.
+    :param max_dictionary_size: Largest number of distinct values kept.
+    :return: dictionary of column name -> sorted distinct values
+    """
+    dictionaries = {}
+    if columns and max_dictionary_size:
+        row = df.select(*[collect_set(column).alias(column) for column in columns])
+        for column, values in row.first().asDict().items():
+            if len(values) <= max_dictionary_size:
+                dictionaries[column] = sorted(values)
+    with open(os.path.join(parquet_path, DICTIONARIES_FILE_NAME), "w") as file:
+        json.dump(dictionaries, file)
+    return dictionaries
+
+
+def _read_dictionaries(parquet_path):
+    """Dictionaries stored next to an up to date Parquet copy.
+    :param parquet_path: Directory of the Parquet copy.
+    :return: dictionary of column name -> sorted distinct values, empty if
+        the copy has none.
+    """
+    dictionaries_path = os.path.join(parquet_path, DICTIONARIES_FILE_NAME)
+    if not os.path.isfile(dictionaries_path):
+        return {}
+    with open(dictionaries_path, "r") as file:
+        return json.load(file)
+
+
+def ingest_table(spark, table_name, file_path, ingest_config):
+    """Convert one INPUT CSV into a partitioned Parquet copy, unless an up to
+    date copy already exists, and return a DataFrame reading that copy.
+    With INGEST.num_buckets set the copy is bucketed by CRASH_ID instead, so
+    every crash-keyed join between the inputs runs without a shuffle.
+    :param spark: Spark session object.
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :param file_path: CSV File path
+    :param ingest_config: INGEST section of config.yaml
+    :return: (Spark DataFrame, dictionaries of the copy it reads, empty when
+        it reads the CSV source)
+    """
+    schema = get_schema(table_name)
+    manifest = _expected_manifest(file_path, ingest_config, table_name)
+    if manifest is None:
+        # Remote or missing source: there is nothing to compare a copy against
+        return (
+            with_derived_columns(extract_data(spark, file_path, schema), table_name),
+            {},
+        )
+
+    parquet_path = os.path.join(ingest_config.get("cache_dir"), table_name)
+    num_buckets = manifest["num_buckets"]
+    if is_parquet_copy_fresh(file_path, parquet_path, ingest_config, table_name):
+        dictionaries = _read_dictionaries(parquet_path)
+    else:
+        logger.info(f"Ingesting {file_path} into {parquet_path}")
+        df = with_derived_columns(extract_data(spark, file_path, schema), table_name)
+        if num_buckets:
+            _write_bucketed(spark, df, table_name, parquet_path, num_buckets)
+        else:
+            df = df.repartition(manifest["num_partitions"], "CRASH_ID")
+            if manifest["derived_columns"]:
+                # Sorted rows give row groups narrow min/max ranges of them.
+                # The bucketed copy is sorted by CRASH_ID for the joins instead
+                df = df.sortWithinPartitions(*manifest["derived_columns"])
+            df.write.mode("overwrite").parquet(parquet_path)
+        dictionaries = _write_dictionaries(
+            spark.read.parquet(parquet_path),
+            parquet_path,
+            CATEGORICAL_COLUMNS.get(table_name),
+            manifest["max_dictionary_size"],
+        )
+        _write_manifest(parquet_path, manifest)
+
+    if num_buckets:
+        df = _read_bucketed(
+            spark, table_name, parquet_path, num_buckets, _stored_schema(table_name)
+        )
+    else:
+        df = spark.read.parquet(parquet_path)
+    return df, dictionaries
+
+
+def load_input(spark, table_name, file_path, ingest_config=None):
+    """Load an INPUT table through the Parquet ingest stage when it is
+    enabled, otherwise straight from CSV with its declared schema. Either
+    way the table carries its derived columns.
+    :param spark: Spark session object.
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :param file_path: CSV File path
+    :param ingest_config: INGEST section of config.yaml
+    :return: (Spark DataFrame, dictionaries of its categorical columns, empty
+        unless it reads an up to date Parquet copy)
+    """
+    if ingest_config and ingest_config.get("enabled", False):
+        return ingest_table(spark, table_name, file_path, ingest_config)
+    return (
+        with_derived_columns(
+            extract_data(spark, file_path, get_schema(table_name)), table_name
+        ),
+        {},
+    )
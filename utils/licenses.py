@@ -0,0 +1,50 @@
+"""License index built from the Endorse and Restrict tables.
+
+Both tables hold one or more rows per (CRASH_ID, UNIT_NBR). They are
+pre-aggregated into one compact row per unit flagging whether its driver is
+recorded as unlicensed. The index is a few bytes per unit and is broadcast
+into the joins reading it while it fits under SKEW.broadcast_threshold_mb,
+so filtering by licence status adds no shuffle of the large tables.
+"""
+
+from pyspark.sql.functions import broadcast, coalesce, col, lit, max as max_
+
+# Licence tables -> column holding their entry
+LICENSE_COLUMNS = {"Endorse": "DRVR_LIC_ENDORS_ID", "Restrict": "DRVR_LIC_RESTRIC_ID"}
+LICENSE_TABLES = list(LICENSE_COLUMNS)
+LICENSE_KEYS = ["CRASH_ID", "UNIT_NBR"]
+
+
+def _flag(condition):
+    """Whether any row of a unit meets a condition, False when none does"""
+    return coalesce(max_(condition), lit(False))
+
+
+def license_index_df(endorse_df, restrict_df):
+    """One row per (CRASH_ID, UNIT_NBR) of Endorse and Restrict.
+    :param endorse_df: Spark DataFrame of Endorse
+    :param restrict_df: Spark DataFrame of Restrict
+    :return: DataFrame (CRASH_ID, UNIT_NBR, IS_UNLICENSED)
+    """
+    entries = endorse_df.select(
+        *LICENSE_KEYS, col("DRVR_LIC_ENDORS_ID").alias("ENTRY")
+    ).unionByName(
+        restrict_df.select(*LICENSE_KEYS, col("DRVR_LIC_RESTRIC_ID").alias("ENTRY"))
+    )
+    return entries.groupBy(*LICENSE_KEYS).agg(
+        _flag(col("ENTRY") == "UNLICENSED").alias("IS_UNLICENSED")
+    )
+
+
+def without_unlicensed(df, license_index, skew):
+    """Drop the rows whose unit the license index marks as unlicensed.
+    :param df: Spark DataFrame with CRASH_ID and UNIT_NBR, e.g. Primary_Person
+    :param license_index: DataFrame from license_index_df
+    :param skew: SkewHandler deciding whether the unlicensed units are
+        broadcast
+    :return: Spark DataFrame
+    """
+    unlicensed = license_index.filter(col("IS_UNLICENSED")).select(*LICENSE_KEYS)
+    if skew.enabled and skew.is_broadcastable(unlicensed):
+        unlicensed = broadcast(unlicensed)
+    return df.join(unlicensed, on=LICENSE_KEYS, how="left_anti")
@@ -0,0 +1,630 @@
+"""Local execution backend for small inputs.
+
+Starting the JVM and the SparkSession takes longer than the analyses
+themselves on data the size of input/Data. LocalAnalysisPlan runs the same
+eight analyses in-process: the CSV files are read into Arrow tables with the
+declared schemas, string columns are dictionary-encoded into NumPy code
+arrays, filters are evaluated once per distinct value, group-bys count by
+code with np.bincount and the CRASH_ID joins match sorted key arrays.
+Results are the same Rows, lists and counts the Spark path returns, and
+outputs are written as Parquet directories like Spark's.
+
+The backend needs numpy and pyarrow. select_backend falls back to Spark
+when they are missing or the inputs are larger than the threshold.
+"""
+
+import logging
+import os
+import shutil
+
+from pyspark.sql import Row
+
+from utils.fused import (
+    male_count,
+    sort_desc,
+    top_colors,
+    two_wheeler_count,
+    vehicle_license_states,
+)
+from utils.helper import read_config
+from utils.predicates import (
+    LICENSED_DRIVER_TYPES,
+    UNKNOWN_BODY_STYLES,
+    UNKNOWN_ETHNICITIES,
+    damage_scale_level,
+)
+from utils.licenses import LICENSE_COLUMNS
+from utils.registry import ALL_ANALYSES, run_analysis
+from utils.results import ResultCache
+from utils.schemas import get_schema
+from utils.topk import TopK, top_k
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Inputs read by the eight analyses
+LOCAL_TABLES = ["Primary_Person", "Units", "Damages", "Charges"]
+
+INT32_MIN, INT32_MAX = -(2**31), 2**31 - 1
+
+
+def is_available():
+    """Whether numpy and pyarrow are installed"""
+    return np is not None
+
+
+def input_size_in_bytes(input_file_paths):
+    """Total size of the local input files the analyses read.
+    :param input_file_paths: INPUT section of config.yaml
+    :return: Size in bytes, or None if an input is not a local file
+    """
+    total = 0
+    for table_name in LOCAL_TABLES:
+        file_path = input_file_paths.get(table_name)
+        if not file_path or not os.path.isfile(file_path):
+            return None
+        total += os.path.getsize(file_path)
+    return total
+
+
+def select_backend(execution_config, input_file_paths):
+    """Choose between the Spark and the local backend. EXECUTION.backend
+    'spark' or 'local' forces one; 'auto' picks local when numpy and pyarrow
+    are installed and the inputs are below local_threshold_mb.
+    :param execution_config: EXECUTION section of config.yaml
+    :param input_file_paths: INPUT section of config.yaml
+    :return: 'spark' or 'local'
+    """
+    backend = execution_config.get("backend", "auto")
+    if backend != "auto":
+        return backend
+    if execution_config.get("mode") in ("incremental", "streaming", "server"):
+        return "spark"
+    if not is_available():
+        return "spark"
+    size_in_bytes = input_size_in_bytes(input_file_paths)
+    threshold = execution_config.get("local_threshold_mb", 64) * 2**20
+    if size_in_bytes is None or size_in_bytes > threshold:
+        return "spark"
+    logger.info(f"Inputs take {size_in_bytes / 2**20:.1f} MB, using the local backend")
+    return "local"
+
+
+# Spark type name -> Arrow type of the columns read from the CSV files
+def _arrow_type(data_type):
+    return {
+        "integer": pa.int32(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us"),
+    }[data_type.typeName()]
+
+
+def read_table(table_name, file_path):
+    """Read an input CSV with its declared schema. Like Spark, only empty
+    fields are null, so 'NA' stays a string.
+    :param table_name: Name of the table in the INPUT section
+    :param file_path: CSV File path
+    :return: pyarrow Table
+    """
+    schema = get_schema(table_name)
+    return pa_csv.read_csv(
+        file_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types={field.name: _arrow_type(field.dataType) for field in schema},
+            null_values=[""],
+            strings_can_be_null=True,
+            include_columns=schema.fieldNames(),
+            include_missing_columns=True,
+        ),
+    )
+
+
+class EncodedColumn:
+    """Dictionary-encoded string column: one code per row, -1 for null"""
+
+    def __init__(self, array):
+        encoded = pc.dictionary_encode(array.combine_chunks())
+        self.codes = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False)
+        self.dictionary = encoded.dictionary.to_pylist()
+
+    def mask(self, predicate, null=False):
+        """Rows whose value satisfies a predicate, evaluated once per
+        distinct value.
+        :param predicate: Function of a non-null string
+        :param null: Result for null values
+        :return: Boolean NumPy array
+        """
+        lookup = np.array(
+            [bool(predicate(value)) for value in self.dictionary] + [null], dtype=bool
+        )
+        return lookup[self.codes]
+
+
+def _int_column(table, name):
+    """Values of an integer column and the mask of its non-null rows"""
+    array = table.column(name).combine_chunks()
+    return (
+        pc.fill_null(array, 0).to_numpy(zero_copy_only=False).astype(np.int64),
+        pc.is_valid(array).to_numpy(zero_copy_only=False),
+    )
+
+
+def _unit_keys(crash_ids, unit_nbrs):
+    """One integer key per (CRASH_ID, UNIT_NBR) pair"""
+    return (crash_ids << 32) | (unit_nbrs & 0xFFFFFFFF)
+
+
+def join_indices(left_keys, right_keys):
+    """Row pairs of an inner equi-join. The right keys are sorted once and
+    every left key finds its run of matches with a binary search.
+    :param left_keys: Integer NumPy array
+    :param right_keys: Integer NumPy array
+    :return: (left row indices, right row indices)
+    """
+    order = np.argsort(right_keys, kind="stable")
+    sorted_right_keys = right_keys[order]
+    low = np.searchsorted(sorted_right_keys, left_keys, side="left")
+    high = np.searchsorted(sorted_right_keys, left_keys, side="right")
+    matches = high - low
+    left_index = np.repeat(np.arange(len(left_keys)), matches)
+    offsets = np.arange(matches.sum()) - np.repeat(
+        np.cumsum(matches) - matches, matches
+    )
+    return left_index, order[np.repeat(low, matches) + offsets]
+
+
+def group_count(columns, codes, weights=None):
+    """Count (or sum weights) per group of dictionary codes, nulls forming
+    their own group as in Spark.
+    :param columns: EncodedColumns of the group keys
+    :param codes: Code arrays of the selected rows, one per column
+    :param weights: Optional NumPy array to sum instead of counting rows
+    :return: dictionary of key tuple -> count or sum
+    """
+    group_ids = np.zeros(len(codes[0]), dtype=np.int64)
+    for column, column_codes in zip(columns, codes):
+        group_ids = group_ids * (len(column.dictionary) + 1) + column_codes + 1
+    totals = np.bincount(group_ids, weights=weights)
+    grouped = {}
+    for group_id in np.flatnonzero(np.bincount(group_ids)):
+        key, remainder = [], int(group_id)
+        for column in reversed(columns):
+            remainder, code = divmod(remainder, len(column.dictionary) + 1)
+            key.append(None if code == 0 else column.dictionary[code - 1])
+        grouped[tuple(reversed(key))] = int(totals[group_id])
+    return grouped
+
+
+def _casts_to_int(value):
+    """Whether Spark's cast('int') of a string gives a number: optional
+    sign, digits, optional fraction, within the int range"""
+    number = value.strip()
+    sign = number[:1] in ("+", "-")
+    integer_part, _, fraction = number[sign:].partition(".")
+    if not integer_part.isdigit() or (fraction and not fraction.isdigit()):
+        return False
+    return INT32_MIN <= int(number.partition(".")[0]) <= INT32_MAX
+
+
+def _is_damage_above_4(value):
+    return (damage_scale_level(value) or 0) > 4
+
+
+class LocalAnalysisPlan:
+    """Run the CarCrashAnalysis analyses on NumPy and Arrow arrays, without
+    a SparkSession"""
+
+    def __init__(self, path_to_config_file, analyses=None):
+        """
+        :param path_to_config_file: Path of config.yaml
+        :param analyses: Names of the analyses to run, all eight by default
+        """
+        config = read_config(path_to_config_file)
+        self.input_file_paths = config.get("INPUT")
+        self.analyses = list(analyses or ALL_ANALYSES)
+        writer_config = config.get("WRITER") or {}
+        self.compression = writer_config.get("compression", "snappy")
+        output_file_paths = config.get("OUTPUT") or {}
+        self.partition_by = {
+            output_file_paths.get(output_name): columns
+            for output_name, columns in (
+                writer_config.get("partition_by") or {}
+            ).items()
+            if output_name in output_file_paths
+        }
+        self.profiler = None
+        self.result_cache = ResultCache(
+            config.get("RESULT_CACHE"), self.input_file_paths
+        )
+        self.top_k = TopK(config.get("TOP_K"))
+        self.validate_licensed_drivers = (config.get("LICENSES") or {}).get(
+            "validate_licensed_drivers", False
+        )
+        self._tables = {}
+        self._columns = {}
+
+    def table(self, table_name):
+        """Arrow table of an input, read on first use"""
+        if table_name not in self._tables:
+            self._tables[table_name] = read_table(
+                table_name, self.input_file_paths.get(table_name)
+            )
+        return self._tables[table_name]
+
+    def column(self, table_name, column_name):
+        """Dictionary-encoded string column of an input, encoded on first use"""
+        if (table_name, column_name) not in self._columns:
+            self._columns[(table_name, column_name)] = EncodedColumn(
+                self.table(table_name).column(column_name)
+            )
+        return self._columns[(table_name, column_name)]
+
+    def crash_ids(self, table_name, mask=None):
+        """Row indices and CRASH_IDs of the rows with a non-null CRASH_ID"""
+        crash_ids, is_valid = _int_column(self.table(table_name), "CRASH_ID")
+        rows = np.flatnonzero(is_valid if mask is None else is_valid & mask)
+        return rows, crash_ids[rows]
+
+    def unlicensed_units(self):
+        """Sorted (CRASH_ID, UNIT_NBR) keys of the units Endorse or Restrict
+        record as unlicensed"""
+        keys = []
+        for table_name, column_name in LICENSE_COLUMNS.items():
+            table = self.table(table_name)
+            crash_ids, crash_id_is_valid = _int_column(table, "CRASH_ID")
+            unit_nbrs, unit_nbr_is_valid = _int_column(table, "UNIT_NBR")
+            rows = (
+                crash_id_is_valid
+                & unit_nbr_is_valid
+                & self.column(table_name, column_name).mask(
+                    lambda value: value == "UNLICENSED"
+                )
+            )
+            keys.append(_unit_keys(crash_ids[rows], unit_nbrs[rows]))
+        return np.unique(np.concatenate(keys))
+
+    def licensed_drivers(self):
+        """Mask of the Primary_Person rows with a driver licence type, without
+        the units recorded as unlicensed when validate_licensed_drivers is set"""
+        is_licensed = self.column("Primary_Person", "DRVR_LIC_TYPE_ID").mask(
+            lambda value: value in LICENSED_DRIVER_TYPES
+        )
+        if not self.validate_licensed_drivers or not all(
+            self.input_file_paths.get(table_name) for table_name in LICENSE_COLUMNS
+        ):
+            return is_licensed
+        person = self.table("Primary_Person")
+        crash_ids, _ = _int_column(person, "CRASH_ID")
+        unit_nbrs, unit_nbr_is_valid = _int_column(person, "UNIT_NBR")
+        # Like the anti join, a null UNIT_NBR never matches the index
+        return is_licensed & ~(
+            unit_nbr_is_valid
+            & np.isin(_unit_keys(crash_ids, unit_nbrs), self.unlicensed_units())
+        )
+
+    def save(self, table, output_path):
+        """Write an Arrow table as a Parquet directory, replacing it like
+        Spark's mode('overwrite')"""
+        shutil.rmtree(output_path, ignore_errors=True)
+        partition_by = self.partition_by.get(output_path)
+        if partition_by:
+            pq.write_to_dataset(
+                table,
+                output_path,
+                partition_cols=list(partition_by),
+                compression=self.compression,
+            )
+        else:
+            os.makedirs(output_path)
+            pq.write_table(
+                table,
+                os.path.join(output_path, f"part-00000.{self.compression}.parquet"),
+                compression=self.compression,
+            )
+        open(os.path.join(output_path, "_SUCCESS"), "w").close()
+
+    def _rows_table(self, rows, schema):
+        return pa.Table.from_pylist([row.asDict() for row in rows], schema=schema)
+
+    def person_profile(self):
+        """Crash count per gender and licence state of Primary_Person"""
+        gender = self.column("Primary_Person", "PRSN_GNDR_ID")
+        state = self.column("Primary_Person", "DRVR_LIC_STATE_ID")
+        return [
+            Row(PRSN_GNDR_ID=gender_id, DRVR_LIC_STATE_ID=state_id, count=count)
+            for (gender_id, state_id), count in group_count(
+                [gender, state], [gender.codes, state.codes]
+            ).items()
+        ]
+
+    def units_profile(self):
+        """VEH_COLOR_ID and VEH_LIC_STATE_ID counts, shaped like the Units
+        profile of the fused plan"""
+        profile = {}
+        for dimension in ("VEH_COLOR_ID", "VEH_LIC_STATE_ID"):
+            column = self.column("Units", dimension)
+            state_code_rows = group_count(
+                [column],
+                [column.codes],
+                weights=self.column("Units", "VEH_LIC_STATE_ID")
+                .mask(lambda value: not _casts_to_int(value), null=True)
+                .astype(np.int64),
+            )
+            profile[dimension] = [
+                Row(
+                    dimension=dimension,
+                    key=key,
+                    count=count,
+                    state_code_rows=state_code_rows[(key,)],
+                )
+                for (key,), count in group_count([column], [column.codes]).items()
+            ]
+        profile["TWO_WHEELER"] = [
+            Row(
+                dimension="TWO_WHEELER",
+                key="true",
+                count=int(self.two_wheelers().sum()),
+            )
+        ]
+        return profile
+
+    def two_wheelers(self):
+        """Mask of the two wheeler Units"""
+        return self.column("Units", "VEH_BODY_STYL_ID").mask(
+            lambda value: "MOTORCYCLE" in value
+        ) | self.column("Units", "UNIT_DESC_ID").mask(
+            lambda value: value == "PEDALCYCLIST"
+        )
+
+    def male_car_crash_analysis(self, output_path):
+        """Analysis 1 on the gender column"""
+        is_male = self.column("Primary_Person", "PRSN_GNDR_ID").mask(
+            lambda value: value == "MALE"
+        )
+        self.save(self.table("Primary_Person").filter(pa.array(is_male)), output_path)
+        return male_count(self.person_profile())
+
+    def two_wheeler_crash_analysis(self, output_path):
+        """Analysis 2 on the body style and unit description columns"""
+        two_wheelers = self.two_wheelers()
+        self.save(self.table("Units").filter(pa.array(two_wheelers)), output_path)
+        return two_wheeler_count(self.units_profile())
+
+    def female_car_crash_analysis(self, output_path):
+        """Analysis 3, grouping the female rows by licence state"""
+        female_states = sort_desc(
+            [
+                Row(DRVR_LIC_STATE_ID=row["DRVR_LIC_STATE_ID"], count=row["count"])
+                for row in self.person_profile()
+                if row["PRSN_GNDR_ID"] == "FEMALE"
+            ],
+            key=lambda row: row["count"],
+            tie_key=lambda row: row["DRVR_LIC_STATE_ID"],
+        )
+        self.save(
+            self._rows_table(
+                female_states,
+                pa.schema([("DRVR_LIC_STATE_ID", pa.string()), ("count", pa.int64())]),
+            ),
+            output_path,
+        )
+        return female_states[0]["DRVR_LIC_STATE_ID"]
+
+    def vehicle_make_crash_analysis(self, output_path):
+        """Analysis 4, summing TOT_INJRY_CNT + DEATH_CNT per VEH_MAKE_ID.
+        Like Spark's sum, null injuries are skipped and a make without any
+        non-null value sums to null."""
+        units = self.table("Units")
+        make = self.column("Units", "VEH_MAKE_ID")
+        total_injuries, total_is_valid = _int_column(units, "TOT_INJRY_CNT")
+        deaths, deaths_is_valid = _int_column(units, "DEATH_CNT")
+        is_valid = total_is_valid & deaths_is_valid
+
+        rows = np.flatnonzero(make.mask(lambda value: value != "NA"))
+        injury_sums = group_count(
+            [make],
+            [make.codes[rows]],
+            weights=np.where(is_valid, total_injuries + deaths, 0)[rows],
+        )
+        non_null_counts = group_count(
+            [make], [make.codes[rows]], weights=is_valid[rows].astype(np.int64)
+        )
+        parameters = self.top_k.parameters("analysis_4")
+        top_15_makes = top_k(
+            [
+                Row(
+                    VEH_MAKE_ID=make_id,
+                    total_injuries=(
+                        injury_sums[(make_id,)] if non_null_counts[(make_id,)] else None
+                    ),
+                )
+                for (make_id,) in injury_sums
+            ],
+            key=lambda row: row["total_injuries"],
+            k=parameters["offset"] + parameters["k"],
+            tie_key=lambda row: row["VEH_MAKE_ID"],
+        )
+        self.save(
+            self._rows_table(
+                top_15_makes,
+                pa.schema(
+                    [("VEH_MAKE_ID", pa.string()), ("total_injuries", pa.int64())]
+                ),
+            ),
+            output_path,
+        )
+        return [row["VEH_MAKE_ID"] for row in top_15_makes[parameters["offset"] :]]
+
+    def vehicle_body_style_crash_analysis(self, output_path):
+        """Analysis 5, counting (body style, ethnicity) over the crash-keyed
+        Primary_Person join Units pairs"""
+        ethnicity = self.column("Primary_Person", "PRSN_ETHNICITY_ID")
+        body_style = self.column("Units", "VEH_BODY_STYL_ID")
+        person_rows, person_crash_ids = self.crash_ids(
+            "Primary_Person",
+            ethnicity.mask(lambda value: value not in UNKNOWN_ETHNICITIES),
+        )
+        unit_rows, unit_crash_ids = self.crash_ids(
+            "Units", body_style.mask(lambda value: value not in UNKNOWN_BODY_STYLES)
+        )
+        person_index, unit_index = join_indices(person_crash_ids, unit_crash_ids)
+        counts = group_count(
+            [body_style, ethnicity],
+            [
+                body_style.codes[unit_rows[unit_index]],
+                ethnicity.codes[person_rows[person_index]],
+            ],
+        )
+
+        top_ethnicity = {}
+        for (body_style_id, ethnicity_id), count in counts.items():
+            best = top_ethnicity.get(body_style_id)
+            # Ties go to the first ethnicity, like the Spark window's order
+            if best is None or (-count, ethnicity_id) < (-best[1], best[0]):
+                top_ethnicity[body_style_id] = (ethnicity_id, count)
+        vehicle_and_ethnicity_list = [
+            Row(VEH_BODY_STYL_ID=body_style_id, PRSN_ETHNICITY_ID=ethnicity_id)
+            for body_style_id, (ethnicity_id, _) in sorted(top_ethnicity.items())
+        ]
+        self.save(
+            self._rows_table(
+                vehicle_and_ethnicity_list,
+                pa.schema(
+                    [
+                        ("VEH_BODY_STYL_ID", pa.string()),
+                        ("PRSN_ETHNICITY_ID", pa.string()),
+                    ]
+                ),
+            ),
+            output_path,
+        )
+        return vehicle_and_ethnicity_list
+
+    def alcohol_related_crash_analysis(self, output_path):
+        """Analysis 6, counting DRVR_ZIP over the joined pairs in which the
+        person or the unit is alcohol related"""
+        zip_code = self.column("Primary_Person", "DRVR_ZIP")
+        person_rows, person_crash_ids = self.crash_ids(
+            "Primary_Person", zip_code.codes >= 0
+        )
+        unit_rows, unit_crash_ids = self.crash_ids("Units")
+        person_index, unit_index = join_indices(person_crash_ids, unit_crash_ids)
+
+        is_alcohol_related = self.column("Primary_Person", "PRSN_ALC_RSLT_ID").mask(
+            lambda value: value == "Positive"
+        )[person_rows[person_index]]
+        for contributing_factor in ("CONTRIB_FACTR_1_ID", "CONTRIB_FACTR_2_ID"):
+            is_alcohol_related |= self.column("Units", contributing_factor).mask(
+                lambda value: "ALCOHOL" in value
+            )[unit_rows[unit_index]]
+
+        counts = group_count(
+            [zip_code], [zip_code.codes[person_rows[person_index[is_alcohol_related]]]]
+        )
+        parameters = self.top_k.parameters("analysis_6")
+        top_5_zips = top_k(
+            [Row(DRVR_ZIP=zip_id, count=count) for (zip_id,), count in counts.items()],
+            key=lambda row: row["count"],
+            k=parameters["k"],
+            offset=parameters["offset"],
+            tie_key=lambda row: row["DRVR_ZIP"],
+        )
+        self.save(
+            self._rows_table(
+                top_5_zips,
+                pa.schema([("DRVR_ZIP", pa.string()), ("count", pa.int64())]),
+            ),
+            output_path,
+        )
+        return top_5_zips
+
+    def insurance_related_crash_analysis(self, output_path):
+        """Analysis 7, filtering Damages and Units before joining them"""
+        is_no_damaged_property = self.column("Damages", "DAMAGED_PROPERTY").mask(
+            lambda value: value == "NONE" or value.startswith("NO DAMAGE")
+        )
+        is_damage_above_4 = self.column("Units", "VEH_DMAG_SCL_1_ID").mask(
+            _is_damage_above_4
+        ) | self.column("Units", "VEH_DMAG_SCL_2_ID").mask(_is_damage_above_4)
+        has_liability_insurance = self.column("Units", "FIN_RESP_TYPE_ID").mask(
+            lambda value: "LIABILITY INSURANCE POLICY" in value
+        )
+        damage_rows, damage_crash_ids = self.crash_ids(
+            "Damages", is_no_damaged_property
+        )
+        unit_rows, unit_crash_ids = self.crash_ids(
+            "Units", is_damage_above_4 & has_liability_insurance
+        )
+        damage_index, unit_index = join_indices(damage_crash_ids, unit_crash_ids)
+
+        damages = self.table("Damages").take(pa.array(damage_rows[damage_index]))
+        units = self.table("Units").take(pa.array(unit_rows[unit_index]))
+        joined = damages
+        for name in units.column_names:
+            if name != "CRASH_ID":
+                joined = joined.append_column(units.field(name), units.column(name))
+        self.save(joined, output_path)
+        return joined.num_rows
+
+    def speeding_related_crash_analysis(self, output_path):
+        """Analysis 8, joining licensed drivers, speeding charges and the
+        Units with a top colour and a valid licence state"""
+        parameters = self.top_k.parameters("analysis_8")
+        units_profile = self.units_profile()
+        colors = set(top_colors(units_profile, parameters["colors"]))
+        states = set(vehicle_license_states(units_profile))
+
+        person_rows, person_crash_ids = self.crash_ids(
+            "Primary_Person", self.licensed_drivers()
+        )
+        _, charge_crash_ids = self.crash_ids(
+            "Charges",
+            self.column("Charges", "CHARGE").mask(lambda value: "SPEED" in value),
+        )
+        make = self.column("Units", "VEH_MAKE_ID")
+        unit_rows, unit_crash_ids = self.crash_ids(
+            "Units",
+            self.column("Units", "VEH_COLOR_ID").mask(lambda value: value in colors)
+            & self.column("Units", "VEH_LIC_STATE_ID").mask(
+                lambda value: value in states
+            ),
+        )
+
+        person_index, charge_index = join_indices(person_crash_ids, charge_crash_ids)
+        _, unit_index = join_indices(person_crash_ids[person_index], unit_crash_ids)
+        counts = group_count([make], [make.codes[unit_rows[unit_index]]])
+        speeding_makes = sort_desc(
+            [
+                Row(VEH_MAKE_ID=make_id, count=count)
+                for (make_id,), count in counts.items()
+            ],
+            key=lambda row: row["count"],
+            tie_key=lambda row: row["VEH_MAKE_ID"],
+        )
+        self.save(
+            self._rows_table(
+                speeding_makes,
+                pa.schema([("VEH_MAKE_ID", pa.string()), ("count", pa.int64())]),
+            ),
+            output_path,
+        )
+        return speeding_makes[
+            parameters["offset"] : parameters["offset"] + parameters["k"]
+        ]
+
+    def run(self, output_file_paths):
+        """Run every planned analysis.
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: dictionary of analysis name -> result
+        """
+        return {
+            name: run_analysis(self, name, output_file_paths) for name in self.analyses
+        }
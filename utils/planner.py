@@ -0,0 +1,148 @@
+"""Column pruning and filter pushdown for the input scans.
+
+Every analysis declares, per input table, the columns it reads in any
+execution mode and the filter all of its rows pass. A table is then loaded
+with the union of the columns and the OR of the filters of the scheduled
+analyses reading it. The filter and projection sit directly on top of the
+scan, so Spark pushes them into the Parquet (or CSV) reader, and a cached
+table only holds the rows and columns some analysis uses.
+"""
+
+from functools import reduce
+
+from pyspark.sql.functions import col
+
+from utils.predicates import (
+    has_damage_level_above_4,
+    has_liability_insurance,
+    is_female,
+    is_known_body_style,
+    is_known_ethnicity,
+    is_licensed_driver,
+    is_male,
+    is_no_damaged_property,
+    is_speeding_charge,
+    is_two_wheeler,
+)
+from utils.schemas import get_schema
+
+# Columns of the shared Primary_Person join Units view, CRASH_ID being the key
+PERSON_UNITS_PERSON_COLUMNS = [
+    "CRASH_ID",
+    "PRSN_ETHNICITY_ID",
+    "PRSN_ALC_RSLT_ID",
+    "DRVR_ZIP",
+]
+PERSON_UNITS_UNITS_COLUMNS = [
+    "CRASH_ID",
+    "VEH_BODY_STYL_ID",
+    "CONTRIB_FACTR_1_ID",
+    "CONTRIB_FACTR_2_ID",
+]
+
+# Units columns of the fused plan's Units profile, shared by analyses 2, 4 and 8
+UNITS_PROFILE_COLUMNS = [
+    "UNIT_DESC_ID",
+    "VEH_LIC_STATE_ID",
+    "VEH_COLOR_ID",
+    "VEH_MAKE_ID",
+    "VEH_BODY_STYL_ID",
+    "TOT_INJRY_CNT",
+    "DEATH_CNT",
+]
+
+# Analysis -> input table -> (columns, None for all; filter, None for all rows).
+# Analyses 1, 2 and 7 write whole rows and so read every column of them
+ANALYSIS_SCANS = {
+    "analysis_1": {"Primary_Person": (None, is_male)},
+    "analysis_2": {"Units": (None, is_two_wheeler)},
+    "analysis_3": {
+        "Primary_Person": (["PRSN_GNDR_ID", "DRVR_LIC_STATE_ID"], is_female)
+    },
+    "analysis_4": {"Units": (["CRASH_ID"] + UNITS_PROFILE_COLUMNS, None)},
+    "analysis_5": {
+        "Primary_Person": (PERSON_UNITS_PERSON_COLUMNS, is_known_ethnicity),
+        "Units": (PERSON_UNITS_UNITS_COLUMNS, is_known_body_style),
+    },
+    "analysis_6": {
+        "Primary_Person": (
+            PERSON_UNITS_PERSON_COLUMNS,
+            lambda dictionaries=None: col("DRVR_ZIP").isNotNull(),
+        ),
+        "Units": (PERSON_UNITS_UNITS_COLUMNS, None),
+    },
+    "analysis_7": {
+        "Damages": (["CRASH_ID", "DAMAGED_PROPERTY"], is_no_damaged_property),
+        # Damage levels compared on the ordinals, skipping Parquet row groups
+        "Units": (
+            None,
+            lambda dictionaries=None: has_damage_level_above_4(dictionaries)
+            & has_liability_insurance(dictionaries),
+        ),
+    },
+    "analysis_8": {
+        "Primary_Person": (
+            ["CRASH_ID", "UNIT_NBR", "DRVR_LIC_TYPE_ID"],
+            is_licensed_driver,
+        ),
+        "Charges": (["CRASH_ID", "CHARGE"], is_speeding_charge),
+        "Units": (["CRASH_ID"] + UNITS_PROFILE_COLUMNS, None),
+        # Licence index of LICENSES.validate_licensed_drivers
+        "Endorse": (None, None),
+        "Restrict": (None, None),
+    },
+}
+
+
+def _scans(table_name, analyses):
+    return [
+        ANALYSIS_SCANS[analysis_name][table_name]
+        for analysis_name in analyses
+        if table_name in ANALYSIS_SCANS.get(analysis_name, {})
+    ]
+
+
+def scan_columns(table_name, analyses):
+    """Union of the columns the analyses read from a table, in schema order.
+    :param table_name: Name of the table in the INPUT section
+    :param analyses: Names of the scheduled analyses
+    :return: list of column names, or None to read every column
+    """
+    scans = _scans(table_name, analyses)
+    if not scans or any(columns is None for columns, _ in scans):
+        return None
+    needed = {column for columns, _ in scans for column in columns}
+    return [name for name in get_schema(table_name).fieldNames() if name in needed]
+
+
+def scan_filter(table_name, analyses, dictionaries=None):
+    """OR of the filters the analyses apply to a table.
+    :param table_name: Name of the table in the INPUT section
+    :param analyses: Names of the scheduled analyses
+    :param dictionaries: Optional dictionaries of the table's categorical columns
+    :return: Column, or None to read every row
+    """
+    scans = _scans(table_name, analyses)
+    if not scans or any(predicate is None for _, predicate in scans):
+        return None
+    return reduce(
+        lambda left, right: left | right,
+        [predicate(dictionaries) for _, predicate in scans],
+    )
+
+
+def prune(df, table_name, analyses, dictionaries=None):
+    """Restrict a freshly loaded table to what the analyses read. The
+    filter may read derived columns of the ingest stage, which the
+    projection then drops.
+    :param df: Spark DataFrame of the whole table, with its derived columns
+    :param table_name: Name of the table in the INPUT section
+    :param analyses: Names of the scheduled analyses
+    :param dictionaries: Optional dictionaries of the table's categorical columns
+    :return: Spark DataFrame
+    """
+    condition = scan_filter(table_name, analyses, dictionaries)
+    if condition is not None:
+        df = df.filter(condition)
+    columns = scan_columns(table_name, analyses)
+    return df.select(*(columns or get_schema(table_name).fieldNames()))
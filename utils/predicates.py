@@ -0,0 +1,171 @@
+"""Filter expressions shared by the CarCrashAnalysis methods and the fused
+execution plan, so both paths select exactly the same rows.
+
+Every predicate takes the optional dictionaries of the ingest stage, column
+name -> every distinct value of that column in the tables read. A condition
+on a dictionary-encoded categorical column is then evaluated once per
+distinct value and becomes membership of the matching values: a hash set
+lookup instead of a LIKE pattern match per row, and an IN filter Parquet can
+check against the dictionary pages of its row groups.
+"""
+
+import re
+
+from pyspark.sql.functions import col, substring, when
+
+UNKNOWN_BODY_STYLES = ["NA", "UNKNOWN", "NOT REPORTED", "OTHER  (EXPLAIN IN NARRATIVE)"]
+UNKNOWN_ETHNICITIES = ["NA", "UNKNOWN"]
+LICENSED_DRIVER_TYPES = ["DRIVER LICENSE", "COMMERCIAL DRIVER LIC."]
+# Damage scale column -> integer ordinal column derived from it at ingest
+DAMAGE_SCALE_ORDINALS = {
+    "VEH_DMAG_SCL_1_ID": "VEH_DMAG_SCL_1_ORD",
+    "VEH_DMAG_SCL_2_ID": "VEH_DMAG_SCL_2_ORD",
+}
+DAMAGE_SCALE_PATTERN = "^DAMAGED [0-9]"
+
+
+def _categorical(column_name, condition, matches, dictionaries=None):
+    """Condition on a categorical column, resolved against its dictionary
+    when there is one. Like the Column condition, the membership test is
+    null for a null value.
+    :param column_name: Name of the column
+    :param condition: Function Column -> condition on the column values
+    :param matches: The same condition as a function of a non-null value
+    :param dictionaries: Optional dictionary of column name -> distinct values
+    :return: Column
+    """
+    values = (dictionaries or {}).get(column_name)
+    if values is None:
+        return condition(col(column_name))
+    return col(column_name).isin([value for value in values if matches(value)])
+
+
+def is_male(dictionaries=None):
+    return col("PRSN_GNDR_ID") == "MALE"
+
+
+def is_female(dictionaries=None):
+    return col("PRSN_GNDR_ID") == "FEMALE"
+
+
+def is_two_wheeler(dictionaries=None):
+    return _categorical(
+        "VEH_BODY_STYL_ID",
+        lambda column: column.like("%MOTORCYCLE%"),
+        lambda value: "MOTORCYCLE" in value,
+        dictionaries,
+    ) | (col("UNIT_DESC_ID") == "PEDALCYCLIST")
+
+
+def is_known_body_style(dictionaries=None):
+    return _categorical(
+        "VEH_BODY_STYL_ID",
+        lambda column: column.isin(UNKNOWN_BODY_STYLES) == False,
+        lambda value: value not in UNKNOWN_BODY_STYLES,
+        dictionaries,
+    )
+
+
+def is_known_ethnicity(dictionaries=None):
+    return _categorical(
+        "PRSN_ETHNICITY_ID",
+        lambda column: column.isin(UNKNOWN_ETHNICITIES) == False,
+        lambda value: value not in UNKNOWN_ETHNICITIES,
+        dictionaries,
+    )
+
+
+def _is_alcohol_factor(column_name, dictionaries=None):
+    return _categorical(
+        column_name,
+        lambda column: column.like("%ALCOHOL%"),
+        lambda value: "ALCOHOL" in value,
+        dictionaries,
+    )
+
+
+def is_alcohol_related(dictionaries=None):
+    return (
+        _is_alcohol_factor("CONTRIB_FACTR_1_ID", dictionaries)
+        | _is_alcohol_factor("CONTRIB_FACTR_2_ID", dictionaries)
+        | (col("PRSN_ALC_RSLT_ID") == "Positive")
+    )
+
+
+def damage_scale_level(value):
+    """Ordinal of a damage scale value: n for 'DAMAGED n ...', 0 for
+    NO DAMAGE and None for NA, INVALID VALUE or any other value"""
+    if value == "NO DAMAGE":
+        return 0
+    if re.match(DAMAGE_SCALE_PATTERN, value):
+        return int(value[8])
+    return None
+
+
+def damage_scale_ordinal(column):
+    """Column expression of damage_scale_level, null for a null value"""
+    return when(column == "NO DAMAGE", 0).when(
+        column.rlike(DAMAGE_SCALE_PATTERN), substring(column, 9, 1).cast("int")
+    )
+
+
+def _is_damage_scale_above_4(column_name, dictionaries=None):
+    return _categorical(
+        column_name,
+        lambda column: damage_scale_ordinal(column) > 4,
+        lambda value: (damage_scale_level(value) or 0) > 4,
+        dictionaries,
+    )
+
+
+def is_damage_above_4(dictionaries=None):
+    return _is_damage_scale_above_4(
+        "VEH_DMAG_SCL_1_ID", dictionaries
+    ) | _is_damage_scale_above_4("VEH_DMAG_SCL_2_ID", dictionaries)
+
+
+def has_damage_level_above_4(dictionaries=None):
+    """is_damage_above_4 on the ordinal columns of the ingest stage, whose
+    Parquet min/max statistics let the scan skip whole row groups"""
+    return (col("VEH_DMAG_SCL_1_ORD") > 4) | (col("VEH_DMAG_SCL_2_ORD") > 4)
+
+
+def is_no_damaged_property(dictionaries=None):
+    return (col("DAMAGED_PROPERTY") == "NONE") | (
+        col("DAMAGED_PROPERTY").like("NO DAMAGE%")
+    )
+
+
+def has_liability_insurance(dictionaries=None):
+    return _categorical(
+        "FIN_RESP_TYPE_ID",
+        lambda column: column.like("%LIABILITY INSURANCE POLICY%"),
+        lambda value: "LIABILITY INSURANCE POLICY" in value,
+        dictionaries,
+    )
+
+
+def is_known_make(dictionaries=None):
+    return col("VEH_MAKE_ID") != "NA"
+
+
+def is_known_color(dictionaries=None):
+    return (col("VEH_COLOR_ID") == "NA") == False
+
+
+def is_state_code(dictionaries=None):
+    """Vehicle licence states recorded as numbers are bad records"""
+    return col("VEH_LIC_STATE_ID").cast("int").isNull()
+
+
+def is_speeding_charge(dictionaries=None):
+    return col("CHARGE").like("%SPEED%")
+
+
+def is_licensed_driver(dictionaries=None):
+    return _categorical(
+        "DRVR_LIC_TYPE_ID",
+        lambda column: column.isin(LICENSED_DRIVER_TYPES),
+        lambda value: value in LICENSED_DRIVER_TYPES,
+        dictionaries,
+    )
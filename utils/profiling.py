@@ -0,0 +1,192 @@
+"""Per-analysis profiling.
+
+Every analysis runs under its own Spark job group. Once the run is over, the
+jobs of each group are looked up with the status tracker, and the metrics of
+their stages (input rows, shuffle read and write bytes, spill) are read from
+the Spark UI REST API. One JSON line per analysis is then written next to
+the outputs.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+JOB_GROUP_PROPERTY = "spark.jobGroup.id"
+
+# Stage metric in the REST API -> field of the profiling record
+STAGE_METRICS = {
+    "inputRecords": "input_rows",
+    "inputBytes": "input_bytes",
+    "shuffleReadBytes": "shuffle_read_bytes",
+    "shuffleWriteBytes": "shuffle_write_bytes",
+    "memoryBytesSpilled": "memory_spilled_bytes",
+    "diskBytesSpilled": "disk_spilled_bytes",
+}
+
+
+def is_cache_loaded(df):
+    """Whether a cached DataFrame has already been materialised.
+    :param df: Spark DataFrame.
+    :return: True or False, or None if it is not cached or Spark does not
+        expose the information.
+    """
+    try:
+        spark = df.sparkSession
+        cached_data = (
+            spark._jsparkSession.sharedState().cacheManager().lookupCachedData(df._jdf)
+        )
+        if cached_data.isEmpty():
+            return None
+        return bool(
+            cached_data.get()
+            .cachedRepresentation()
+            .cacheBuilder()
+            .isCachedColumnBuffersLoaded()
+        )
+    except Exception:
+        return None
+
+
+class AnalysisProfiler:
+    """Collect wall time, Spark job, stage, shuffle, spill and cache
+    metrics for every analysis method"""
+
+    def __init__(self, spark, profiling_config=None):
+        """
+        :param spark: Spark session object.
+        :param profiling_config: PROFILING section of config.yaml
+        """
+        profiling_config = profiling_config or {}
+        self.spark = spark
+        self.path = profiling_config.get("path", "output/profile.jsonl")
+        # (thread ident, record) of every profiled analysis not reported yet
+        self._records = []
+        self._lock = threading.Lock()
+
+    def profile(self, analysis_name, method, output_path, cached_inputs=None):
+        """Run one analysis method under its own job group.
+        :param analysis_name: Name of the analysis, e.g. 'analysis_3'
+        :param method: Analysis method taking the output path
+        :param output_path: Output path passed to the method
+        :param cached_inputs: Optional function returning a dictionary of
+            input name -> cached DataFrame the analysis reads, to report cache
+            hits and misses. It is called under the job group, since it may
+            load the inputs
+        :return: Result of the method
+        """
+        sc = self.spark.sparkContext
+        job_group = f"{analysis_name}-{time.time_ns()}"
+        cache = {}
+        previous_job_group = sc.getLocalProperty(JOB_GROUP_PROPERTY)
+        sc.setJobGroup(job_group, analysis_name)
+        start_time = time.perf_counter()
+        try:
+            if cached_inputs is not None:
+                cache = {
+                    input_name: is_cache_loaded(df)
+                    for input_name, df in cached_inputs().items()
+                }
+            return method(output_path)
+        finally:
+            wall_time = time.perf_counter() - start_time
+            sc.setLocalProperty(JOB_GROUP_PROPERTY, previous_job_group)
+            with self._lock:
+                self._records.append(
+                    (
+                        threading.get_ident(),
+                        {
+                            "analysis": analysis_name,
+                            "job_group": job_group,
+                            "started_at": time.time() - wall_time,
+                            "wall_time_s": round(wall_time, 3),
+                            "cache": {
+                                input_name: (
+                                    None
+                                    if loaded is None
+                                    else "hit" if loaded else "miss"
+                                )
+                                for input_name, loaded in cache.items()
+                            },
+                        },
+                    )
+                )
+
+    def _stage_metrics(self, stage_id):
+        """Metrics of every attempt of a stage from the Spark UI REST API.
+        :param stage_id: Spark stage id
+        :return: list of stage attempt dictionaries, empty if unavailable
+        """
+        sc = self.spark.sparkContext
+        if not sc.uiWebUrl:
+            return []
+        url = f"{sc.uiWebUrl}/api/v1/applications/{sc.applicationId}/stages/{stage_id}"
+        try:
+            with urlopen(url, timeout=10) as response:
+                return json.load(response)
+        except Exception as error:
+            logger.warning(f"No metrics for stage {stage_id}: {error}")
+            return []
+
+    def _complete(self, record):
+        """Add the job, stage and shuffle metrics of a record's job group"""
+        tracker = self.spark.sparkContext.statusTracker()
+        job_ids = tracker.getJobIdsForGroup(record["job_group"])
+        stage_ids = set()
+        for job_id in job_ids:
+            job_info = tracker.getJobInfo(job_id)
+            if job_info is not None:
+                stage_ids.update(job_info.stageIds)
+
+        totals = dict.fromkeys(STAGE_METRICS.values(), 0)
+        stages_run = stages_skipped = 0
+        for stage_id in sorted(stage_ids):
+            for attempt in self._stage_metrics(stage_id):
+                if attempt.get("status") == "SKIPPED":
+                    stages_skipped += 1
+                    continue
+                stages_run += 1
+                for metric, field in STAGE_METRICS.items():
+                    totals[field] += attempt.get(metric, 0)
+
+        return {
+            **record,
+            "num_jobs": len(job_ids),
+            "num_stages": stages_run,
+            "num_skipped_stages": stages_skipped,
+            **totals,
+        }
+
+    def write_report(self, thread_only=False):
+        """Append one JSON line per profiled analysis to the profiling path.
+        Call it after the pending output writes have finished so that their
+        jobs are attributed to the analysis that started them.
+        :param thread_only: Only report the analyses profiled on the calling
+            thread, e.g. the one of a server request
+        :return: list of the profiling records written
+        """
+        with self._lock:
+            ident = threading.get_ident()
+            records = [
+                record
+                for thread, record in self._records
+                if not thread_only or thread == ident
+            ]
+            self._records = [
+                (thread, record)
+                for thread, record in self._records
+                if thread_only and thread != ident
+            ]
+        records = [self._complete(record) for record in records]
+        if not records:
+            return records
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        logger.info(f"Wrote profiles of {len(records)} analyses to {self.path}")
+        return records
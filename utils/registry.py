@@ -0,0 +1,110 @@
+"""Registry of the CarCrashAnalysis analyses, keyed by the names used in the
+OUTPUT section of config.yaml (analysis_N -> analysis_N_output)"""
+
+ANALYSIS_METHODS = {
+    "analysis_1": "male_car_crash_analysis",
+    "analysis_2": "two_wheeler_crash_analysis",
+    "analysis_3": "female_car_crash_analysis",
+    "analysis_4": "vehicle_make_crash_analysis",
+    "analysis_5": "vehicle_body_style_crash_analysis",
+    "analysis_6": "alcohol_related_crash_analysis",
+    "analysis_7": "insurance_related_crash_analysis",
+    "analysis_8": "speeding_related_crash_analysis",
+}
+
+ALL_ANALYSES = list(ANALYSIS_METHODS)
+
+# Cached inputs -> CarCrashAnalysis attribute holding the DataFrame
+CACHED_INPUTS = {
+    "Primary_Person": "Primary_person_use_df",
+    "Units": "Units_use_df",
+    "Damages": "Damages_use_df",
+    "Person_Units": "person_units_use_df",
+}
+
+# Inputs derived from other inputs -> the inputs they are built from
+DERIVED_INPUTS = {"Person_Units": ["Primary_Person", "Units"]}
+
+# Cached inputs each analysis reads
+ANALYSIS_INPUTS = {
+    "analysis_1": ["Primary_Person"],
+    "analysis_2": ["Units"],
+    "analysis_3": ["Primary_Person"],
+    "analysis_4": ["Units"],
+    "analysis_5": ["Person_Units"],
+    "analysis_6": ["Person_Units"],
+    "analysis_7": ["Damages", "Units"],
+    "analysis_8": ["Primary_Person", "Units"],
+}
+
+
+def output_path_for(output_file_paths, analysis_name):
+    """Output path of an analysis from the OUTPUT section of config.yaml"""
+    return output_file_paths.get(f"{analysis_name}_output")
+
+
+def analysis_parameters(runner, output_file_paths, analysis_name):
+    """Parameters of an analysis run that its result depends on, besides its
+    inputs and code: the output path, the runner's ranking parameters and
+    the filters narrowing its inputs. Part of the result cache key"""
+    parameters = {"output_path": output_path_for(output_file_paths, analysis_name)}
+    top_k = getattr(runner, "top_k", None)
+    if top_k is not None:
+        parameters.update(top_k.parameters(analysis_name))
+    validate_licensed_drivers = getattr(
+        getattr(runner, "analysis", runner), "validate_licensed_drivers", None
+    )
+    if analysis_name == "analysis_8" and validate_licensed_drivers is not None:
+        parameters["validate_licensed_drivers"] = validate_licensed_drivers
+    filters = getattr(getattr(runner, "analysis", runner), "filters", None)
+    if filters:
+        parameters["filters"] = filters
+    return parameters
+
+
+def run_analysis(runner, analysis_name, output_file_paths):
+    """Call the method implementing an analysis on a CarCrashAnalysis (or
+    any object exposing the same methods), through the runner's profiler
+    when it has one. A result found in the runner's result cache is returned
+    without running the method.
+    :param runner: Object with the analysis methods
+    :param analysis_name: Key of ANALYSIS_METHODS, e.g. 'analysis_3'
+    :param output_file_paths: OUTPUT section of config.yaml
+    :return: Result of the analysis method
+    """
+    method = getattr(runner, ANALYSIS_METHODS[analysis_name])
+    output_path = output_path_for(output_file_paths, analysis_name)
+    profiler = getattr(runner, "profiler", None)
+    # Plans keep the CarCrashAnalysis holding the cached inputs as .analysis
+    tables = getattr(runner, "analysis", runner)
+    cache_manager = getattr(tables, "cache_manager", None)
+    result_cache = getattr(tables, "result_cache", None)
+    parameters = analysis_parameters(runner, output_file_paths, analysis_name)
+
+    def cached_inputs():
+        # Reading the inputs loads them, so the profiler calls this under the
+        # analysis' job group
+        return {
+            input_name: getattr(tables, CACHED_INPUTS[input_name])
+            for input_name in ANALYSIS_INPUTS.get(analysis_name, [])
+            if hasattr(tables, CACHED_INPUTS[input_name])
+        }
+
+    try:
+        if result_cache is not None:
+            is_hit, result = result_cache.get(analysis_name, parameters, output_path)
+            if is_hit:
+                return result
+
+        if profiler is None:
+            result = method(output_path)
+        else:
+            result = profiler.profile(analysis_name, method, output_path, cached_inputs)
+
+        if result_cache is not None:
+            result_cache.put(analysis_name, parameters, result)
+        return result
+    finally:
+        # Unpersist the inputs no remaining analysis reads
+        if cache_manager is not None:
+            cache_manager.release(analysis_name)
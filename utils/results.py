@@ -0,0 +1,210 @@
+"""Persistent cache of analysis results.
+
+The key of a result combines the content hashes of the input files the
+analysis reads, the analysis name, its parameters (the output path among
+them) and a hash of the analysis code. On a hit the stored result is
+returned and neither the Spark jobs nor the output write run again. Entries
+are JSON files under RESULT_CACHE.dir; once they take more than max_size_mb
+the least recently used ones are evicted.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from pyspark.sql import Row
+
+from utils.planner import ANALYSIS_SCANS
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTS_FILE_NAME = "_FINGERPRINTS.json"
+
+
+def _code_files():
+    """Source files of the analyses: analysis.py and the utils modules. They
+    are found next to this module rather than through __main__, which has no
+    file under -c, stdin or an interactive session"""
+    utils_dir = os.path.dirname(os.path.abspath(__file__))
+    analysis_file = os.path.join(os.path.dirname(utils_dir), "analysis.py")
+    return sorted(glob.glob(os.path.join(utils_dir, "*.py"))) + (
+        [analysis_file] if os.path.isfile(analysis_file) else []
+    )
+
+
+def code_version():
+    """Hash of the source of the analysis code.
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    for file_path in _code_files():
+        with open(file_path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _encode(value):
+    """JSON-compatible form of a result, keeping Rows and their field order"""
+    if isinstance(value, Row):
+        return {
+            "__row__": [[key, _encode(item)] for key, item in value.asDict().items()]
+        }
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and "__row__" in value:
+        return Row(**{key: _decode(item) for key, item in value["__row__"]})
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class ResultCache:
+    """Store and look up analysis results by input fingerprint, parameters
+    and code version"""
+
+    def __init__(self, result_cache_config=None, input_file_paths=None):
+        """
+        :param result_cache_config: RESULT_CACHE section of config.yaml
+        :param input_file_paths: INPUT section of config.yaml
+        """
+        result_cache_config = result_cache_config or {}
+        self.enabled = result_cache_config.get("enabled", False)
+        self.cache_dir = result_cache_config.get("dir", "cache/results")
+        self.max_size = result_cache_config.get("max_size_mb", 64) * 2**20
+        self.input_file_paths = input_file_paths or {}
+        self._code_version = None
+        self._fingerprints = None
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def fingerprint(self, file_path):
+        """Content hash of an input file. Hashes are remembered per path,
+        size and mtime so unchanged files are only read once.
+        :param file_path: Input file path
+        :return: Hex digest, or None if the file does not exist
+        """
+        if not os.path.isfile(file_path):
+            return None
+        fingerprints_path = os.path.join(self.cache_dir, FINGERPRINTS_FILE_NAME)
+        if self._fingerprints is None:
+            self._fingerprints = {}
+            if os.path.isfile(fingerprints_path):
+                with open(fingerprints_path, "r") as file:
+                    self._fingerprints = json.load(file)
+
+        stat = os.stat(file_path)
+        signature = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime}"
+        if signature not in self._fingerprints:
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as file:
+                for chunk in iter(lambda: file.read(2**20), b""):
+                    digest.update(chunk)
+            self._fingerprints[signature] = digest.hexdigest()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(f"{fingerprints_path}.tmp", "w") as file:
+                json.dump(self._fingerprints, file)
+            os.replace(f"{fingerprints_path}.tmp", fingerprints_path)
+        return self._fingerprints[signature]
+
+    def key(self, analysis_name, parameters):
+        """Cache key of an analysis run.
+        :param analysis_name: Name of the analysis, e.g. 'analysis_3'
+        :param parameters: Dictionary of the analysis parameters
+        :return: Hex digest, or None if an input cannot be fingerprinted
+        """
+        if self._code_version is None:
+            self._code_version = code_version()
+        inputs = {}
+        for table_name in sorted(ANALYSIS_SCANS.get(analysis_name, {})):
+            inputs[table_name] = self.fingerprint(
+                self.input_file_paths.get(table_name, "")
+            )
+            if inputs[table_name] is None:
+                return None
+        return hashlib.sha256(
+            json.dumps(
+                {
+                    "analysis": analysis_name,
+                    "inputs": inputs,
+                    "parameters": parameters,
+                    "code_version": self._code_version,
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+
+    def get(self, analysis_name, parameters, output_path=None):
+        """Stored result of an analysis, if its output still exists.
+        :param analysis_name: Name of the analysis
+        :param parameters: Dictionary of the analysis parameters
+        :param output_path: Output the analysis writes, which must be intact
+        :return: (True, result) on a hit, (False, None) on a miss
+        """
+        if not self.enabled:
+            return False, None
+        with self._lock:
+            key = self.key(analysis_name, parameters)
+            if key is None or not os.path.isfile(self._entry_path(key)):
+                return False, None
+            if output_path and not os.path.exists(
+                os.path.join(output_path, "_SUCCESS")
+            ):
+                return False, None
+            with open(self._entry_path(key), "r") as file:
+                result = _decode(json.load(file)["result"])
+            # The mtime orders the entries for the LRU eviction
+            os.utime(self._entry_path(key))
+        logger.info(f"{analysis_name} result cache hit")
+        return True, result
+
+    def put(self, analysis_name, parameters, result):
+        """Store the result of an analysis and evict the least recently used
+        entries beyond max_size_mb.
+        :param analysis_name: Name of the analysis
+        :param parameters: Dictionary of the analysis parameters
+        :param result: Result returned by the analysis method
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            key = self.key(analysis_name, parameters)
+            if key is None:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(f"{self._entry_path(key)}.tmp", "w") as file:
+                json.dump({"analysis": analysis_name, "result": _encode(result)}, file)
+            os.replace(f"{self._entry_path(key)}.tmp", self._entry_path(key))
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (os.stat(path).st_mtime, os.path.getsize(path), path)
+            for path in glob.glob(os.path.join(self.cache_dir, "*.json"))
+            if os.path.basename(path) != FINGERPRINTS_FILE_NAME
+        )
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+            logger.info(f"Evicted {path} from the result cache")
+
+    def clear(self):
+        """Drop every stored result.
+        :return: None
+        """
+        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
+            if os.path.basename(path) != FINGERPRINTS_FILE_NAME:
+                os.remove(path)
+        logger.info(f"Invalidated the result cache in {self.cache_dir}")
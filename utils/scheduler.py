@@ -0,0 +1,184 @@
+"""Parallel analysis scheduler.
+
+Analyses are nodes of a dependency DAG and run from a thread pool as soon as
+everything they depend on has finished, each in its own Spark FAIR scheduler
+pool. Every cached input an analysis reads is a node of its own, so it is
+materialised exactly once before the analyses sharing it start, instead of
+being computed concurrently by each of them.
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.registry import (
+    ANALYSIS_INPUTS,
+    CACHED_INPUTS,
+    analysis_parameters,
+    output_path_for,
+    run_analysis,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisScheduler:
+    """Run CarCrashAnalysis analyses concurrently along a dependency DAG"""
+
+    def __init__(
+        self, car_crash_analysis, analyses, max_concurrency=4, dependencies=None
+    ):
+        """
+        :param car_crash_analysis: CarCrashAnalysis holding the input DataFrames
+        :param analyses: Names of the analyses to run
+        :param max_concurrency: Number of analyses running at the same time
+        :param dependencies: Optional analysis name -> analyses it must wait for
+        """
+        self.analysis = car_crash_analysis
+        self.analyses = list(analyses)
+        self.max_concurrency = max_concurrency
+        self.spark = car_crash_analysis.spark
+        self.dependencies = self._build_dag(dependencies or {})
+        self.timings = {}
+
+    def _build_dag(self, dependencies):
+        """Node name -> set of node names it waits for. Inputs the cache
+        manager caches are nodes named 'cache:<input>'.
+        :param dependencies: Analysis name -> analyses it must wait for
+        :return: dictionary of node -> set of nodes
+        """
+        dag = {}
+        for analysis_name in self.analyses:
+            cache_nodes = {
+                f"cache:{input_name}"
+                for input_name in ANALYSIS_INPUTS.get(analysis_name, [])
+                if self.analysis.cache_manager.will_cache(input_name)
+            }
+            for cache_node in cache_nodes:
+                dag.setdefault(cache_node, set())
+            dag[analysis_name] = cache_nodes | {
+                upstream
+                for upstream in dependencies.get(analysis_name, [])
+                if upstream in self.analyses
+            }
+        self._check_acyclic(dag)
+        return dag
+
+    @staticmethod
+    def _check_acyclic(dag):
+        """Raise ValueError if the declared dependencies contain a cycle"""
+        remaining = {node: set(upstream) for node, upstream in dag.items()}
+        while remaining:
+            ready = [node for node, upstream in remaining.items() if not upstream]
+            if not ready:
+                raise ValueError(
+                    f"Cyclic analysis dependencies between {sorted(remaining)}"
+                )
+            for node in ready:
+                del remaining[node]
+            for upstream in remaining.values():
+                upstream.difference_update(ready)
+
+    def _run_node(self, node, output_file_paths):
+        """Run one node inside its own FAIR scheduler pool.
+        :param node: Analysis name or 'cache:<input>'
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: Result of the analysis, or the row count of a cached input
+        """
+        self.spark.sparkContext.setLocalProperty(
+            "spark.scheduler.pool", node.replace(":", "_")
+        )
+        start_time = time.perf_counter()
+        try:
+            if node.startswith("cache:"):
+                # Materialise the cached DataFrame once for every analysis reading it
+                input_name = node.split(":", 1)[1]
+                if self._all_results_cached(input_name, output_file_paths):
+                    return None
+                return getattr(self.analysis, CACHED_INPUTS[input_name]).count()
+            return run_analysis(self.analysis, node, output_file_paths)
+        finally:
+            self.timings[node] = (start_time, time.perf_counter())
+            self.spark.sparkContext.setLocalProperty("spark.scheduler.pool", None)
+
+    def _all_results_cached(self, input_name, output_file_paths):
+        """Whether every analysis reading a cached input has a stored result,
+        in which case the input need not be materialised"""
+        result_cache = getattr(self.analysis, "result_cache", None)
+        if result_cache is None or not result_cache.enabled:
+            return False
+        return all(
+            result_cache.get(
+                analysis_name,
+                analysis_parameters(self.analysis, output_file_paths, analysis_name),
+                output_path_for(output_file_paths, analysis_name),
+            )[0]
+            for analysis_name in self.analyses
+            if input_name in ANALYSIS_INPUTS.get(analysis_name, [])
+        )
+
+    def run(self, output_file_paths):
+        """Run every node of the DAG, at most max_concurrency at a time.
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: dictionary of analysis name -> result
+        """
+        results, errors = {}, {}
+        done, skipped = set(), set()
+        pending = dict(self.dependencies)
+        running = {}
+        run_start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while pending or running:
+                for node, upstream in list(pending.items()):
+                    if upstream & (skipped | set(errors)):
+                        skipped.add(node)
+                        del pending[node]
+                    elif upstream <= done:
+                        running[
+                            executor.submit(self._run_node, node, output_file_paths)
+                        ] = node
+                        del pending[node]
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        logger.error(f"{node} failed: {error}")
+                        errors[node] = error
+                        continue
+                    done.add(node)
+                    if not node.startswith("cache:"):
+                        results[node] = result
+
+        self.log_timing_report(time.perf_counter() - run_start, errors, skipped)
+        if errors:
+            raise next(iter(errors.values()))
+        return {name: results[name] for name in self.analyses if name in results}
+
+    def log_timing_report(self, wall_time, errors=(), skipped=()):
+        """Log when each node started and how long it ran.
+        :param wall_time: End-to-end wall time of the run in seconds
+        :param errors: Nodes that failed
+        :param skipped: Nodes skipped because something upstream failed
+        :return: None
+        """
+        if not self.timings:
+            return
+        run_start = min(start for start, _ in self.timings.values())
+        logger.info(f"Scheduler timing report (max_concurrency={self.max_concurrency})")
+        for node, (start, end) in sorted(
+            self.timings.items(), key=lambda item: item[1]
+        ):
+            status = "FAILED" if node in errors else "OK"
+            logger.info(
+                f"{node:<22} start +{start - run_start:7.2f}s "
+                f"duration {end - start:7.2f}s {status}"
+            )
+        for node in sorted(skipped):
+            logger.info(f"{node:<22} SKIPPED")
+        busy_time = sum(end - start for start, end in self.timings.values())
+        logger.info(f"Wall time {wall_time:.2f}s for {busy_time:.2f}s of analysis time")
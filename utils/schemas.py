@@ -0,0 +1,151 @@
+"""Explicit Spark schemas for every INPUT table declared in config.yaml"""
+from pyspark.sql.types import (
+    IntegerType,
+    StringType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+
+
+def _schema(*fields):
+    """Build a nullable StructType from (column name, data type) pairs.
+    :param fields: Tuples of column name and Spark data type.
+    :return: StructType.
+    """
+    return StructType(
+        [StructField(name, data_type, True) for name, data_type in fields]
+    )
+
+
+PRIMARY_PERSON_SCHEMA = _schema(
+    ("CRASH_ID", IntegerType()),
+    ("UNIT_NBR", IntegerType()),
+    ("PRSN_NBR", IntegerType()),
+    ("PRSN_TYPE_ID", StringType()),
+    ("PRSN_OCCPNT_POS_ID", StringType()),
+    ("PRSN_INJRY_SEV_ID", StringType()),
+    ("PRSN_AGE", StringType()),
+    ("PRSN_ETHNICITY_ID", StringType()),
+    ("PRSN_GNDR_ID", StringType()),
+    ("PRSN_EJCT_ID", StringType()),
+    ("PRSN_REST_ID", StringType()),
+    ("PRSN_AIRBAG_ID", StringType()),
+    ("PRSN_HELMET_ID", StringType()),
+    ("PRSN_SOL_FL", StringType()),
+    ("PRSN_ALC_SPEC_TYPE_ID", StringType()),
+    ("PRSN_ALC_RSLT_ID", StringType()),
+    ("PRSN_BAC_TEST_RSLT", StringType()),
+    ("PRSN_DRG_SPEC_TYPE_ID", StringType()),
+    ("PRSN_DRG_RSLT_ID", StringType()),
+    ("DRVR_DRG_CAT_1_ID", StringType()),
+    ("PRSN_DEATH_TIME", TimestampType()),
+    ("INCAP_INJRY_CNT", IntegerType()),
+    ("NONINCAP_INJRY_CNT", IntegerType()),
+    ("POSS_INJRY_CNT", IntegerType()),
+    ("NON_INJRY_CNT", IntegerType()),
+    ("UNKN_INJRY_CNT", IntegerType()),
+    ("TOT_INJRY_CNT", IntegerType()),
+    ("DEATH_CNT", IntegerType()),
+    ("DRVR_LIC_TYPE_ID", StringType()),
+    ("DRVR_LIC_STATE_ID", StringType()),
+    ("DRVR_LIC_CLS_ID", StringType()),
+    ("DRVR_ZIP", StringType()),
+)
+
+UNITS_SCHEMA = _schema(
+    ("CRASH_ID", IntegerType()),
+    ("UNIT_NBR", IntegerType()),
+    ("UNIT_DESC_ID", StringType()),
+    ("VEH_PARKED_FL", StringType()),
+    ("VEH_HNR_FL", StringType()),
+    ("VEH_LIC_STATE_ID", StringType()),
+    ("VIN", StringType()),
+    ("VEH_MOD_YEAR", StringType()),
+    ("VEH_COLOR_ID", StringType()),
+    ("VEH_MAKE_ID", StringType()),
+    ("VEH_MOD_ID", StringType()),
+    ("VEH_BODY_STYL_ID", StringType()),
+    ("EMER_RESPNDR_FL", StringType()),
+    ("OWNR_ZIP", StringType()),
+    ("FIN_RESP_PROOF_ID", StringType()),
+    ("FIN_RESP_TYPE_ID", StringType()),
+    ("VEH_DMAG_AREA_1_ID", StringType()),
+    ("VEH_DMAG_SCL_1_ID", StringType()),
+    ("FORCE_DIR_1_ID", StringType()),
+    ("VEH_DMAG_AREA_2_ID", StringType()),
+    ("VEH_DMAG_SCL_2_ID", StringType()),
+    ("FORCE_DIR_2_ID", StringType()),
+    ("VEH_INVENTORIED_FL", StringType()),
+    ("VEH_TRANSP_NAME", StringType()),
+    ("VEH_TRANSP_DEST", StringType()),
+    ("CONTRIB_FACTR_1_ID", StringType()),
+    ("CONTRIB_FACTR_2_ID", StringType()),
+    ("CONTRIB_FACTR_P1_ID", StringType()),
+    ("VEH_TRVL_DIR_ID", StringType()),
+    ("FIRST_HARM_EVT_INV_ID", StringType()),
+    ("INCAP_INJRY_CNT", IntegerType()),
+    ("NONINCAP_INJRY_CNT", IntegerType()),
+    ("POSS_INJRY_CNT", IntegerType()),
+    ("NON_INJRY_CNT", IntegerType()),
+    ("UNKN_INJRY_CNT", IntegerType()),
+    ("TOT_INJRY_CNT", IntegerType()),
+    ("DEATH_CNT", IntegerType()),
+)
+
+DAMAGES_SCHEMA = _schema(
+    ("CRASH_ID", IntegerType()),
+    ("DAMAGED_PROPERTY", StringType()),
+)
+
+CHARGES_SCHEMA = _schema(
+    ("CRASH_ID", IntegerType()),
+    ("UNIT_NBR", IntegerType()),
+    ("PRSN_NBR", IntegerType()),
+    ("CHARGE", StringType()),
+    ("CITATION_NBR", StringType()),
+)
+
+ENDORSE_SCHEMA = _schema(
+    ("CRASH_ID", IntegerType()),
+    ("UNIT_NBR", IntegerType()),
+    ("DRVR_LIC_ENDORS_ID", StringType()),
+)
+
+RESTRICT_SCHEMA = _schema(
+    ("CRASH_ID", IntegerType()),
+    ("UNIT_NBR", IntegerType()),
+    ("DRVR_LIC_RESTRIC_ID", StringType()),
+)
+
+# Keyed by the table names used in the INPUT section of config.yaml
+SCHEMAS = {
+    "Primary_Person": PRIMARY_PERSON_SCHEMA,
+    "Units": UNITS_SCHEMA,
+    "Damages": DAMAGES_SCHEMA,
+    "Charges": CHARGES_SCHEMA,
+    "Endorse": ENDORSE_SCHEMA,
+    "Restrict": RESTRICT_SCHEMA,
+}
+
+# Low-cardinality string columns the ingest stage keeps a dictionary of, for
+# the predicates filtering on them
+CATEGORICAL_COLUMNS = {
+    "Primary_Person": ["PRSN_ETHNICITY_ID", "DRVR_LIC_TYPE_ID"],
+    "Units": [
+        "VEH_BODY_STYL_ID",
+        "FIN_RESP_TYPE_ID",
+        "VEH_DMAG_SCL_1_ID",
+        "VEH_DMAG_SCL_2_ID",
+        "CONTRIB_FACTR_1_ID",
+        "CONTRIB_FACTR_2_ID",
+    ],
+}
+
+
+def get_schema(table_name):
+    """Look up the declared schema of an INPUT table.
+    :param table_name: Key of the table in the INPUT section of config.yaml
+    :return: StructType, or None when the table has no declared schema.
+    """
+    return SCHEMAS.get(table_name)
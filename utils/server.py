@@ -0,0 +1,326 @@
+"""Resident analysis service over a warm SparkSession.
+
+The service keeps one CarCrashAnalysis, whose input tables are loaded,
+pruned and cached once at start-up and then stay cached, and answers
+analysis requests over HTTP on SERVER.host:port, or on the Unix socket
+SERVER.socket_path when it is set:
+
+    GET  /health                  -> {"status": "ok"}
+    GET  /analyses                -> analysis name -> default parameters
+    POST /analyses/<analysis_N>   -> {"analysis", "parameters", "result", "seconds"}
+
+The optional JSON body of a POST (Content-Type application/json) overrides
+the ranking parameters of the analysis (k, offset, colors), its output_path,
+which must lie under the directory of the configured OUTPUT paths,
+validate_licensed_drivers of analysis 8, and narrows the inputs with filters
+of the form {"Units": {"VEH_LIC_STATE_ID": ["TX", "CA"]}}. Every request
+runs on its own thread and Spark FAIR scheduler pool, so requests run
+concurrently, except that requests writing the same output path take
+turns. Results go through the result cache like those of a batch run. The
+reply is sent once the request's outputs are written.
+"""
+
+import copy
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pyspark.sql import Row
+
+from utils.planner import scan_columns
+from utils.registry import (
+    ALL_ANALYSES,
+    ANALYSIS_METHODS,
+    analysis_parameters,
+    output_path_for,
+    run_analysis,
+)
+from utils.schemas import SCHEMAS, get_schema
+
+logger = logging.getLogger(__name__)
+
+ANALYSES_PATH = "/analyses"
+RANKING_PARAMETERS = ["k", "offset", "colors"]
+# CarCrashAnalysis attributes loaded and cached before the first request
+WARM_INPUTS = [
+    "Primary_person_use_df",
+    "Units_use_df",
+    "Damages_use_df",
+    "Charges_use_df",
+    "person_units_use_df",
+]
+
+
+def _to_json(value):
+    """JSON-compatible form of an analysis result, Rows becoming objects"""
+    if isinstance(value, Row):
+        return {key: _to_json(item) for key, item in value.asDict().items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Route the HTTP requests to the AnalysisServer set as server.service"""
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"status": "ok"})
+        elif self.path == ANALYSES_PATH:
+            self._reply(200, self.server.service.defaults())
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        analysis_name = self.path[len(ANALYSES_PATH) + 1 :]
+        if (
+            not self.path.startswith(f"{ANALYSES_PATH}/")
+            or analysis_name not in ANALYSIS_METHODS
+        ):
+            self._reply(404, {"error": f"Unknown analysis {self.path}"})
+            return
+        # Browsers only send JSON cross-origin after a CORS preflight
+        content_type = self.headers.get("Content-Type") or ""
+        if content_type.split(";")[0].strip().lower() != "application/json":
+            self._reply(415, {"error": "The request body must be application/json"})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("The request body must be a JSON object")
+            reply = self.server.service.run(analysis_name, request)
+        except ValueError as error:
+            self._reply(400, {"error": str(error)})
+        except Exception as error:
+            logger.exception(f"{analysis_name} request failed")
+            self._reply(500, {"error": str(error)})
+        else:
+            self._reply(200, reply)
+
+    def _reply(self, status, body):
+        payload = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+class AnalysisServer:
+    """Answer analysis requests from input tables kept cached in one
+    SparkSession"""
+
+    def __init__(
+        self, car_crash_analysis, server_config, output_file_paths, on_result=None
+    ):
+        """
+        :param car_crash_analysis: CarCrashAnalysis over all the analyses,
+            whose tables the requests share
+        :param server_config: SERVER section of config.yaml
+        :param output_file_paths: OUTPUT section of config.yaml
+        :param on_result: Optional function called with the analysis name
+            and result of every answered request
+        """
+        self.analysis = car_crash_analysis
+        self.spark = car_crash_analysis.spark
+        self.host = server_config.get("host", "127.0.0.1")
+        self.port = server_config.get("port", 8642)
+        self.socket_path = server_config.get("socket_path")
+        self.output_file_paths = output_file_paths
+        # Requested output paths must lie under the configured outputs' directory
+        self.output_root = os.path.realpath(
+            os.path.commonpath(
+                [
+                    os.path.dirname(os.path.abspath(path))
+                    for path in output_file_paths.values()
+                ]
+            )
+        )
+        self.on_result = on_result
+        # Output path -> lock held by the request overwriting it
+        self._output_locks = {}
+        self._output_locks_lock = threading.Lock()
+        self.analysis.cache_manager.pin()
+
+    def warm_up(self):
+        """Load and cache every input table before the first request.
+        :return: None
+        """
+        start_time = time.perf_counter()
+        for attribute in WARM_INPUTS:
+            getattr(self.analysis, attribute).count()
+        if self.analysis.validate_licensed_drivers:
+            self.analysis.license_index_use_df.count()
+        logger.info(f"Warmed up the inputs in {time.perf_counter() - start_time:.2f}s")
+
+    def defaults(self):
+        """Default parameters of every analysis.
+        :return: dictionary of analysis name -> parameters
+        """
+        return {
+            analysis_name: analysis_parameters(
+                self.analysis, self.output_file_paths, analysis_name
+            )
+            for analysis_name in ALL_ANALYSES
+        }
+
+    def _filters(self, filters):
+        """Check the filters of a request against the columns of the tables.
+        :param filters: dictionary of table -> column -> list of values
+        :return: The filters, without the tables given no columns
+        """
+        if not isinstance(filters, dict):
+            raise ValueError("filters must map tables to columns to values")
+        for table_name, columns in filters.items():
+            if table_name not in SCHEMAS or not isinstance(columns, dict):
+                raise ValueError(f"Cannot filter table {table_name}")
+            # Columns the pruned, cached table still holds
+            readable = (
+                scan_columns(table_name, self.analysis.analyses)
+                or get_schema(table_name).fieldNames()
+            )
+            for column_name, values in columns.items():
+                if column_name not in readable:
+                    raise ValueError(f"Cannot filter {table_name}.{column_name}")
+                if not isinstance(values, list) or not all(
+                    isinstance(value, (str, int, float)) for value in values
+                ):
+                    raise ValueError(
+                        f"{table_name}.{column_name} needs a list of values"
+                    )
+        return {
+            table_name: columns for table_name, columns in filters.items() if columns
+        }
+
+    def _output_path(self, output_path):
+        """Check a requested output path, which is overwritten by the analysis.
+        :param output_path: Output path of a request
+        :return: The path, resolved
+        """
+        if not isinstance(output_path, str) or not output_path:
+            raise ValueError("output_path must be a non-empty string")
+        resolved = os.path.realpath(output_path)
+        if os.path.commonpath([resolved, self.output_root]) != self.output_root or (
+            resolved == self.output_root
+        ):
+            raise ValueError(f"output_path must be inside {self.output_root}")
+        return resolved
+
+    def runner(self, analysis_name, request):
+        """CarCrashAnalysis answering one request: a shallow copy sharing the
+        cached tables, with the parameters of the request.
+        :param analysis_name: Name of the analysis, e.g. 'analysis_4'
+        :param request: dictionary of the request parameters
+        :return: (CarCrashAnalysis, OUTPUT section with the request's path)
+        """
+        request = dict(request)
+        runner = copy.copy(self.analysis)
+        output_path = request.pop("output_path", None)
+        output_file_paths = {
+            f"{analysis_name}_output": (
+                output_path_for(self.output_file_paths, analysis_name)
+                if output_path is None
+                else self._output_path(output_path)
+            )
+        }
+        runner.filters = self._filters(request.pop("filters", None) or {})
+        if "validate_licensed_drivers" in request:
+            if analysis_name != "analysis_8":
+                raise ValueError(f"{analysis_name} does not validate licences")
+            runner.validate_licensed_drivers = bool(
+                request.pop("validate_licensed_drivers")
+            )
+        ranking = {
+            name: request.pop(name) for name in RANKING_PARAMETERS if name in request
+        }
+        if request:
+            raise ValueError(f"Unknown parameters {sorted(request)}")
+        for name, value in ranking.items():
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError(f"{name} must be a non-negative integer")
+        if ranking:
+            runner.top_k = runner.top_k.with_parameters(analysis_name, ranking)
+        return runner, output_file_paths
+
+    def _output_lock(self, output_path):
+        """Lock serialising the requests that overwrite one output path"""
+        with self._output_locks_lock:
+            return self._output_locks.setdefault(output_path, threading.Lock())
+
+    def run(self, analysis_name, request):
+        """Answer one analysis request on the warm tables.
+        :param analysis_name: Name of the analysis, e.g. 'analysis_4'
+        :param request: dictionary of the request parameters
+        :return: dictionary with the analysis, its parameters, result and
+            the seconds it took
+        """
+        runner, output_file_paths = self.runner(analysis_name, request)
+        output_path = os.path.realpath(
+            output_path_for(output_file_paths, analysis_name)
+        )
+        start_time = time.perf_counter()
+        # Concurrent requests share the executors through FAIR scheduler pools
+        self.spark.sparkContext.setLocalProperty("spark.scheduler.pool", analysis_name)
+        try:
+            # An overwrite would delete the files of a concurrent write
+            with self._output_lock(output_path):
+                result = run_analysis(runner, analysis_name, output_file_paths)
+                try:
+                    runner.writer.wait(thread_only=True)
+                except Exception as error:
+                    # Reported as a server error, not as a bad request
+                    raise RuntimeError(f"Writing the output failed: {error}") from error
+        finally:
+            self.spark.sparkContext.setLocalProperty("spark.scheduler.pool", None)
+            if runner.profiler is not None:
+                runner.profiler.write_report(thread_only=True)
+        seconds = time.perf_counter() - start_time
+        logger.info(f"{analysis_name} request took {seconds:.2f}s")
+        if self.on_result is not None:
+            self.on_result(analysis_name, result)
+        return {
+            "analysis": analysis_name,
+            "parameters": analysis_parameters(runner, output_file_paths, analysis_name),
+            "result": _to_json(result),
+            "seconds": round(seconds, 3),
+        }
+
+    def serve(self):
+        """Warm up, then answer requests until interrupted.
+        :return: None
+        """
+        self.warm_up()
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            http_server = _UnixHTTPServer(self.socket_path, _RequestHandler)
+            address = self.socket_path
+        else:
+            http_server = ThreadingHTTPServer((self.host, self.port), _RequestHandler)
+            address = f"http://{self.host}:{self.port}"
+        http_server.service = self
+        logger.info(f"Serving analysis requests on {address}")
+        try:
+            http_server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopping the analysis server")
+        finally:
+            http_server.server_close()
+            if self.socket_path and os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
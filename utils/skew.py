@@ -0,0 +1,173 @@
+"""Skew-aware joins for the crash-keyed inputs.
+
+A few keys carry a large share of the rows (multi-unit crashes under one
+CRASH_ID, for instance). A plain shuffle join sends all rows of such a key
+to one task, which then dominates the stage. SkewHandler broadcasts the
+smaller side of a join when it fits under the broadcast threshold, and
+otherwise looks for heavy-hitter keys in a sample of the left side. Rows
+of those keys are spread over num_salts tasks: the left side gets a random
+salt, the right side is replicated once per salt. Sides already bucketed
+by the join key into the same number of buckets, like the INGEST.num_buckets
+copies, join without a shuffle and are never salted.
+
+Group-bys do not need salting: count and sum are combined per partition
+before the shuffle, so a hot key reaches the reducer as one row per map
+task.
+"""
+
+import logging
+import re
+
+from pyspark.sql import Window
+from pyspark.sql.functions import (
+    array,
+    broadcast,
+    col,
+    explode,
+    lit,
+    rand,
+    sequence,
+    sum as sum_,
+    when,
+)
+
+from utils.writer import estimate_size_in_bytes
+
+logger = logging.getLogger(__name__)
+
+SALT_COLUMN = "_SALT"
+SAMPLE_ROWS_COLUMN = "_SAMPLE_ROWS"
+
+
+def bucket_count(df, key):
+    """Number of buckets a DataFrame is hash partitioned into by a key
+    column without a shuffle, as a bucketed table read is.
+    :param df: Spark DataFrame.
+    :param key: Name of the key column
+    :return: Number of buckets, or None if it is not partitioned by the key
+    """
+    try:
+        partitioning = (
+            df._jdf.queryExecution().sparkPlan().outputPartitioning().toString()
+        )
+    except Exception:
+        return None
+    for column_name, num_buckets in re.findall(
+        r"hashpartitioning\(([^#(),]+)#\d+, (\d+)\)", partitioning
+    ):
+        if column_name == key:
+            return int(num_buckets)
+    return None
+
+
+class SkewHandler:
+    """Join DataFrames according to the SKEW section of config.yaml"""
+
+    def __init__(self, skew_config=None):
+        """
+        :param skew_config: SKEW section of config.yaml
+        """
+        skew_config = skew_config or {}
+        self.enabled = skew_config.get("enabled", True)
+        self.broadcast_threshold = skew_config.get("broadcast_threshold_mb", 64) * 2**20
+        self.sample_fraction = skew_config.get("sample_fraction", 0.1)
+        self.hot_key_fraction = skew_config.get("hot_key_fraction", 0.01)
+        self.max_hot_keys = skew_config.get("max_hot_keys", 100)
+        self.num_salts = skew_config.get("num_salts", 8)
+        self.seed = skew_config.get("seed", 42)
+        self._hot_keys = {}
+
+    def is_broadcastable(self, df):
+        """Whether Spark estimates the DataFrame below the broadcast threshold.
+        :param df: Spark DataFrame.
+        :return: True or False
+        """
+        size_in_bytes = estimate_size_in_bytes(df)
+        return size_in_bytes is not None and size_in_bytes <= self.broadcast_threshold
+
+    def hot_keys(self, df, key):
+        """Keys holding more than hot_key_fraction of a sample of the rows,
+        found by one job over the sample. Results are remembered per query
+        plan and key.
+        :param df: Spark DataFrame.
+        :param key: Name of the key column
+        :return: list of hot key values, most frequent first
+        """
+        cache_key = (df.semanticHash(), key)
+        if cache_key not in self._hot_keys:
+            hot_keys = [
+                row[key]
+                for row in df.select(key)
+                .sample(fraction=self.sample_fraction, seed=self.seed)
+                .groupBy(key)
+                .count()
+                .withColumn(
+                    SAMPLE_ROWS_COLUMN, sum_("count").over(Window.partitionBy())
+                )
+                .filter(col("count") > col(SAMPLE_ROWS_COLUMN) * self.hot_key_fraction)
+                .orderBy(col("count").desc())
+                .limit(self.max_hot_keys)
+                .collect()
+                if row[key] is not None
+            ]
+            if hot_keys:
+                logger.info(
+                    f"{len(hot_keys)} hot {key} values, e.g. {hot_keys[:5]}, "
+                    f"are salted over {self.num_salts} tasks"
+                )
+            self._hot_keys[cache_key] = hot_keys
+        return self._hot_keys[cache_key]
+
+    def salted_join(self, large, small, on, hot_keys, how="inner"):
+        """Join on one key column, spreading the rows of hot keys over
+        num_salts tasks.
+        :param large: Skewed side, each row gets one random salt
+        :param small: Other side, replicated once per salt for the hot keys
+        :param on: Name of the key column
+        :param hot_keys: Key values to salt
+        :param how: 'inner' or 'left', large being the left side
+        :return: Joined DataFrame without the salt column
+        """
+        is_hot = col(on).isin(hot_keys)
+        salted_large = large.withColumn(
+            SALT_COLUMN,
+            when(is_hot, (rand(self.seed) * self.num_salts).cast("int")).otherwise(
+                lit(0)
+            ),
+        )
+        salted_small = small.withColumn(
+            SALT_COLUMN,
+            explode(
+                when(is_hot, sequence(lit(0), lit(self.num_salts - 1))).otherwise(
+                    array(lit(0))
+                )
+            ),
+        )
+        return salted_large.join(salted_small, on=[on, SALT_COLUMN], how=how).drop(
+            SALT_COLUMN
+        )
+
+    def join(self, left, right, on, how="inner"):
+        """Join two DataFrames on one key column, broadcasting a small side
+        and salting the hot keys of the left side otherwise.
+        :param left: Left Spark DataFrame.
+        :param right: Right Spark DataFrame.
+        :param on: Name of the key column
+        :param how: 'inner' or 'left'
+        :return: Joined DataFrame
+        """
+        if not self.enabled:
+            return left.join(right, on=[on], how=how)
+        if self.is_broadcastable(right):
+            return left.join(broadcast(right), on=[on], how=how)
+        if how == "inner" and self.is_broadcastable(left):
+            return broadcast(left).join(right, on=[on], how=how)
+        # Salting would shuffle co-bucketed sides that otherwise join in place
+        num_buckets = bucket_count(left, on)
+        if num_buckets is not None and num_buckets == bucket_count(right, on):
+            return left.join(right, on=[on], how=how)
+
+        hot_keys = self.hot_keys(left, on)
+        if not hot_keys:
+            return left.join(right, on=[on], how=how)
+        return self.salted_join(left, right, on, hot_keys, how=how)
@@ -0,0 +1,430 @@
+"""Structured Streaming mode keeping analyses 1-8 up to date.
+
+Every input table has a sub-directory of STREAMING.source_root, named like
+the table, into which new CSV (or Parquet) files are dropped. Each table is
+read as a file stream whose rows carry the modification time of their file
+as arrival time, with a watermark on it. The crash-keyed joins behind
+analyses 5-8 are stream-stream joins on CRASH_ID between rows arriving
+within STREAMING.join_window of each other; Spark keeps the rows still
+waiting for a match in its state store until the watermark passes them.
+
+One query runs per aggregate of the incremental mode. Every micro-batch is
+aggregated, merged into a new version of that aggregate under
+STREAMING.state_dir, and the analyses reading the aggregate are answered
+again with their outputs rewritten. The row level outputs of analyses 1, 2
+and 7 are appended per micro-batch. One JSON line per micro-batch records
+its end-to-end latency, from the oldest file modification time to the
+refreshed outputs.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+from pyspark.sql.functions import (
+    col,
+    count,
+    expr,
+    lit,
+    max as max_,
+    min as min_,
+    sum as sum_,
+)
+
+from utils.fused import person_profile_df, person_units_profile_df, units_profile_df
+from utils.helper import load_data_to_csv
+from utils.incremental import STATE_AGGREGATES, IncrementalAnalysisPlan
+from utils.planner import PERSON_UNITS_PERSON_COLUMNS, PERSON_UNITS_UNITS_COLUMNS
+from utils.predicates import (
+    has_liability_insurance,
+    is_damage_above_4,
+    is_licensed_driver,
+    is_male,
+    is_no_damaged_property,
+    is_speeding_charge,
+    is_two_wheeler,
+)
+from utils.registry import ALL_ANALYSES, output_path_for
+from utils.schemas import get_schema
+
+logger = logging.getLogger(__name__)
+
+ARRIVAL_TIME = "_ARRIVAL_TIME"
+
+# Aggregates each analysis is answered from
+ANALYSIS_STATE = {
+    "analysis_1": ["person_profile"],
+    "analysis_2": ["units_profile"],
+    "analysis_3": ["person_profile"],
+    "analysis_4": ["units_profile"],
+    "analysis_5": ["person_units_profile"],
+    "analysis_6": ["person_units_profile"],
+    "analysis_7": ["insurance_crashes"],
+    "analysis_8": ["units_profile", "speeding_units"],
+}
+
+# Aggregate -> function aggregating the rows of one micro-batch of its stream
+MICRO_BATCH_AGGREGATES = {
+    "person_profile": lambda rows: person_profile_df(
+        SimpleNamespace(Primary_person_use_df=rows)
+    ),
+    "units_profile": lambda rows: units_profile_df(
+        SimpleNamespace(Units_use_df=rows, dictionaries=None)
+    ),
+    "person_units_profile": lambda rows: person_units_profile_df(
+        SimpleNamespace(person_units_use_df=rows, dictionaries=None)
+    ),
+    "insurance_crashes": lambda rows: rows.agg(count(lit(1)).alias("count")),
+    "speeding_units": lambda rows: rows.groupBy(
+        "VEH_MAKE_ID", "VEH_COLOR_ID", "VEH_LIC_STATE_ID"
+    ).count(),
+}
+
+# Row level outputs -> (aggregate whose stream holds the rows, row filter)
+STREAM_ROW_OUTPUTS = {
+    "analysis_1": ("person_profile", is_male),
+    "analysis_2": ("units_profile", is_two_wheeler),
+    "analysis_7": ("insurance_crashes", None),
+}
+
+
+class StreamingState:
+    """Aggregates of a streaming run, one version per merged micro-batch.
+    Exposes the same table() as IncrementalState, so IncrementalAnalysisPlan
+    answers the analyses from it."""
+
+    def __init__(self, spark, state_dir):
+        """
+        :param spark: Spark session object.
+        :param state_dir: Directory of the aggregate versions
+        """
+        self.spark = spark
+        self.state_dir = state_dir
+        # Held while a version is removed and while readers materialise the
+        # DataFrames of table(), which Spark reads lazily
+        self.lock = threading.Lock()
+
+    def _versions(self, table_name):
+        """Complete versions of an aggregate, oldest first"""
+        table_dir = os.path.join(self.state_dir, table_name)
+        if not os.path.isdir(table_dir):
+            return []
+        return sorted(
+            os.path.join(table_dir, version)
+            for version in os.listdir(table_dir)
+            if os.path.exists(os.path.join(table_dir, version, "_SUCCESS"))
+        )
+
+    def has(self, table_name):
+        return bool(self._versions(table_name))
+
+    def table(self, table_name):
+        """Latest version of an aggregate. Materialise it while holding lock,
+        or a merge may remove the version under it.
+        :param table_name: Key of STATE_AGGREGATES
+        :return: Spark DataFrame
+        """
+        return self.spark.read.parquet(self._versions(table_name)[-1])
+
+    def merge(self, table_name, epoch_id, aggregate):
+        """Merge the aggregate of a micro-batch into a new version. A batch
+        Spark replays after a failure finds its version already written and
+        is not counted twice.
+        :param table_name: Key of STATE_AGGREGATES
+        :param epoch_id: Micro-batch id of the stream feeding the aggregate
+        :param aggregate: DataFrame with the keys and measures of the aggregate
+        :return: True if the micro-batch was merged, False if it already was
+        """
+        version_path = os.path.join(self.state_dir, table_name, f"v{epoch_id:09d}")
+        if os.path.exists(os.path.join(version_path, "_SUCCESS")):
+            return False
+
+        _, keys, measures = STATE_AGGREGATES[table_name]
+        previous_versions = self._versions(table_name)
+        if previous_versions:
+            aggregate = (
+                self.spark.read.parquet(previous_versions[-1])
+                .unionByName(aggregate)
+                .groupBy(*keys)
+                .agg(*[sum_(col(measure)).alias(measure) for measure in measures])
+            )
+        load_data_to_csv(aggregate, version_path)
+        with self.lock:
+            for previous_version in previous_versions:
+                shutil.rmtree(previous_version, ignore_errors=True)
+        return True
+
+
+def stream_join(left, right, on, join_window):
+    """Inner stream-stream join of rows arriving within join_window of each
+    other. The time bound lets Spark drop buffered rows once the watermark
+    has passed them; the left arrival time is kept.
+    :param left: Streaming DataFrame with an arrival time
+    :param right: Streaming DataFrame with an arrival time
+    :param on: Name of the join key, e.g. 'CRASH_ID'
+    :param join_window: Interval, e.g. '1 hour'
+    :return: Streaming DataFrame with the key once
+    """
+    right = right.withColumnRenamed(on, f"_RIGHT_{on}").withColumnRenamed(
+        ARRIVAL_TIME, f"_RIGHT{ARRIVAL_TIME}"
+    )
+    window = expr(f"INTERVAL {join_window}")
+    return left.join(
+        right,
+        (col(on) == col(f"_RIGHT_{on}"))
+        & col(f"_RIGHT{ARRIVAL_TIME}").between(
+            col(ARRIVAL_TIME) - window, col(ARRIVAL_TIME) + window
+        ),
+    ).drop(f"_RIGHT_{on}", f"_RIGHT{ARRIVAL_TIME}")
+
+
+class StreamingAnalysis:
+    """Keep the analyses up to date from file streams of the input tables"""
+
+    def __init__(
+        self,
+        spark,
+        streaming_config,
+        writer,
+        analyses=None,
+        top_k=None,
+        on_results=None,
+        validate_licensed_drivers=False,
+    ):
+        """
+        :param spark: Spark session object.
+        :param streaming_config: STREAMING section of config.yaml
+        :param writer: OutputWriter for the outputs
+        :param analyses: Names of the analyses to keep up to date
+        :param top_k: Optional TopK holding the ranking parameters
+        :param on_results: Optional function called with every refreshed
+            dictionary of analysis name -> result
+        :param validate_licensed_drivers: LICENSES.validate_licensed_drivers.
+            Streams cannot be anti joined with the licence index, so analysis
+            8 is refused rather than answered differently from the other modes
+        """
+        analyses = list(analyses or ALL_ANALYSES)
+        if validate_licensed_drivers and "analysis_8" in analyses:
+            raise ValueError(
+                "Streaming cannot drop the units Endorse or Restrict record as "
+                "unlicensed: set LICENSES.validate_licensed_drivers to false or "
+                "leave analysis_8 out of EXECUTION.analyses"
+            )
+        self.spark = spark
+        self.source_root = streaming_config.get("source_root", "input/stream")
+        self.file_format = streaming_config.get("format", "csv")
+        self.checkpoint_dir = streaming_config.get(
+            "checkpoint_dir", "cache/streaming/checkpoints"
+        )
+        self.watermark = streaming_config.get("watermark", "1 hour")
+        self.join_window = streaming_config.get("join_window", "1 hour")
+        self.trigger_seconds = streaming_config.get("trigger_seconds", 10)
+        self.timeout_seconds = streaming_config.get("timeout_seconds")
+        self.metrics_path = streaming_config.get(
+            "metrics_path", "output/streaming_metrics.jsonl"
+        )
+        self.state = StreamingState(
+            spark, streaming_config.get("state_dir", "cache/streaming/state")
+        )
+        self.writer = writer
+        self.analyses = analyses
+        self.top_k = top_k
+        self.on_results = on_results
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def read_stream(self, table_name):
+        """File stream of a table's sub-directory of source_root, with the
+        file modification time as watermarked arrival time.
+        :param table_name: Name of the table in the INPUT section
+        :return: Streaming DataFrame
+        """
+        reader = self.spark.readStream.schema(get_schema(table_name))
+        if self.file_format == "csv":
+            reader = reader.option("header", True)
+        return (
+            reader.format(self.file_format)
+            .load(os.path.join(self.source_root, table_name))
+            .withColumn(ARRIVAL_TIME, col("_metadata.file_modification_time"))
+            .withWatermark(ARRIVAL_TIME, self.watermark)
+        )
+
+    def streams(self):
+        """Stream of the rows feeding every aggregate the analyses need.
+        :return: dictionary of aggregate -> streaming DataFrame
+        """
+        person = self.read_stream("Primary_Person")
+        units = self.read_stream("Units")
+        damages = self.read_stream("Damages")
+        charges = self.read_stream("Charges")
+        streams = {
+            "person_profile": lambda: person,
+            "units_profile": lambda: units,
+            "person_units_profile": lambda: stream_join(
+                person.select(*PERSON_UNITS_PERSON_COLUMNS, ARRIVAL_TIME),
+                units.select(*PERSON_UNITS_UNITS_COLUMNS, ARRIVAL_TIME),
+                "CRASH_ID",
+                self.join_window,
+            ),
+            "insurance_crashes": lambda: stream_join(
+                damages.filter(is_no_damaged_property()),
+                units.filter(is_damage_above_4() & has_liability_insurance()),
+                "CRASH_ID",
+                self.join_window,
+            ),
+            "speeding_units": lambda: stream_join(
+                stream_join(
+                    person.filter(is_licensed_driver()).select(
+                        "CRASH_ID", ARRIVAL_TIME
+                    ),
+                    charges.filter(is_speeding_charge()).select(
+                        "CRASH_ID", ARRIVAL_TIME
+                    ),
+                    "CRASH_ID",
+                    self.join_window,
+                ),
+                units.select(
+                    "CRASH_ID",
+                    "VEH_MAKE_ID",
+                    "VEH_COLOR_ID",
+                    "VEH_LIC_STATE_ID",
+                    ARRIVAL_TIME,
+                ),
+                "CRASH_ID",
+                self.join_window,
+            ),
+        }
+        needed = {
+            table_name
+            for analysis_name in self.analyses
+            for table_name in ANALYSIS_STATE[analysis_name]
+        }
+        return {
+            table_name: build()
+            for table_name, build in streams.items()
+            if table_name in needed
+        }
+
+    def process(self, table_name, rows, epoch_id, output_file_paths):
+        """Merge one micro-batch into its aggregate, append its row level
+        outputs and refresh the analyses reading the aggregate.
+        :param table_name: Aggregate fed by the stream
+        :param rows: DataFrame of the micro-batch
+        :param epoch_id: Micro-batch id
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: None
+        """
+        start_time = time.time()
+        rows = rows.persist()
+        stats = rows.agg(
+            count(lit(1)).alias("rows"),
+            min_(ARRIVAL_TIME).alias("oldest"),
+            max_(ARRIVAL_TIME).alias("newest"),
+        ).first()
+        if not stats["rows"]:
+            rows.unpersist()
+            return
+
+        for analysis_name, (source, row_filter) in STREAM_ROW_OUTPUTS.items():
+            if source != table_name or analysis_name not in self.analyses:
+                continue
+            output_rows = rows if row_filter is None else rows.filter(row_filter())
+            self.writer.save(
+                output_rows.drop(ARRIVAL_TIME),
+                os.path.join(
+                    output_path_for(output_file_paths, analysis_name),
+                    f"batch_id=stream-{epoch_id:09d}",
+                ),
+            )
+        if self.state.merge(
+            table_name, epoch_id, MICRO_BATCH_AGGREGATES[table_name](rows)
+        ):
+            self.publish(table_name, output_file_paths)
+        # Only the writes of this micro-batch, not those of the other queries
+        self.writer.wait(thread_only=True)
+        rows.unpersist()
+
+        end_time = time.time()
+        self.write_metrics(
+            {
+                "stream": table_name,
+                "epoch_id": epoch_id,
+                "rows": stats["rows"],
+                "processing_s": end_time - start_time,
+                "max_latency_s": end_time - stats["oldest"].timestamp(),
+                "min_latency_s": end_time - stats["newest"].timestamp(),
+            }
+        )
+
+    def publish(self, table_name, output_file_paths):
+        """Answer again the analyses reading an updated aggregate, once
+        every aggregate they read exists.
+        :param table_name: Updated aggregate
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: dictionary of analysis name -> result
+        """
+        analyses = [
+            analysis_name
+            for analysis_name in self.analyses
+            if table_name in ANALYSIS_STATE[analysis_name]
+            and all(self.state.has(name) for name in ANALYSIS_STATE[analysis_name])
+        ]
+        # Queries run their micro-batches concurrently and analysis 8 reads two
+        # aggregates, so outputs are rewritten one refresh at a time, reading
+        # versions no concurrent merge removes
+        with self._lock, self.state.lock:
+            results = IncrementalAnalysisPlan(
+                self.state, self.writer, analyses, top_k=self.top_k
+            ).run(output_file_paths)
+            self.results.update(results)
+        if self.on_results is not None:
+            self.on_results(results)
+        return results
+
+    def write_metrics(self, record):
+        """Append the metrics of a micro-batch to metrics_path"""
+        logger.info(
+            f"{record['stream']} batch {record['epoch_id']}: {record['rows']} rows "
+            f"published {record['max_latency_s']:.1f}s after the oldest arrived"
+        )
+        with self._lock:
+            os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+            with open(self.metrics_path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def run(self, output_file_paths):
+        """Start one query per needed aggregate and block until one of them
+        stops, or for timeout_seconds when set.
+        :param output_file_paths: OUTPUT section of config.yaml
+        :return: dictionary of analysis name -> latest result
+        """
+        queries = []
+        try:
+            for table_name, rows in self.streams().items():
+                queries.append(
+                    rows.writeStream.queryName(table_name)
+                    .foreachBatch(
+                        lambda df, epoch_id, table_name=table_name: self.process(
+                            table_name, df, epoch_id, output_file_paths
+                        )
+                    )
+                    .option(
+                        "checkpointLocation",
+                        os.path.join(self.checkpoint_dir, table_name),
+                    )
+                    .trigger(processingTime=f"{self.trigger_seconds} seconds")
+                    .start()
+                )
+                logger.info(f"Started streaming query {table_name}")
+            if self.timeout_seconds is None:
+                self.spark.streams.awaitAnyTermination()
+            else:
+                self.spark.streams.awaitAnyTermination(self.timeout_seconds)
+        finally:
+            for query in queries:
+                query.stop()
+        return self.results
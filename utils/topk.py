@@ -0,0 +1,220 @@
+"""Top-k of ranked group-by results without a global sort.
+
+An orderBy over a group-by result range-partitions and sorts every row only
+to keep a handful of them. An orderBy followed by limit(k + offset) is
+instead planned as TakeOrderedAndProject: each partition keeps its best
+rows and the driver merges them, all inside the JVM. With
+TOP_K.approximate, the value counts of a column are instead summarised per
+partition by a Space-Saving sketch of sketch_capacity counters, skipping the
+group-by shuffle. Merged counts over-estimate the true ones by at most the
+number of rows divided by sketch_capacity, and are exact as long as the
+column has no more distinct values than that.
+"""
+
+import copy
+import heapq
+import itertools
+import logging
+
+from pyspark.sql import Row
+from pyspark.sql.functions import asc_nulls_first, desc_nulls_last
+
+from utils.registry import ANALYSIS_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Analysis -> default ranking parameters: k rows after the first offset
+# ('colors' being analysis 8's number of top vehicle colours)
+DEFAULT_PARAMETERS = {
+    "analysis_4": {"k": 11, "offset": 4},
+    "analysis_6": {"k": 5, "offset": 0},
+    "analysis_8": {"k": 5, "offset": 0, "colors": 10},
+}
+
+# Analyses whose counts the Space-Saving sketch ranks when approximate is set
+APPROXIMATE_ANALYSES = ["analysis_6", "analysis_8"]
+
+
+def _descending(value):
+    """Sort key ranking values descending with nulls last, like orderBy(desc)"""
+    return (value is None, -(value or 0))
+
+
+def _ascending(value):
+    """Sort key ranking values ascending with nulls first, like orderBy(asc)"""
+    return (value is not None, value)
+
+
+def top_k(items, key, k=None, offset=0, tie_key=None):
+    """The k best items after the first offset, ranked descending by key
+    with nulls last, then ascending by tie_key with nulls first like
+    TopK.rank. Without tie_key, ties keep the order of items.
+    :param items: Iterable of items
+    :param key: Function returning the value an item is ranked by
+    :param k: Number of items, None for every item after offset
+    :param offset: Number of best items to skip
+    :param tie_key: Optional function returning the value ties are broken by,
+        typically the group-by key
+    :return: list of items
+    """
+
+    def sort_key(item):
+        if tie_key is None:
+            return _descending(key(item))
+        return _descending(key(item)), _ascending(tie_key(item))
+
+    if k is None:
+        return sorted(items, key=sort_key)[offset:]
+    return heapq.nsmallest(offset + k, items, key=sort_key)[offset:]
+
+
+def space_saving(capacity):
+    """Function summarising the values of a partition into a Space-Saving
+    sketch. The function is self-contained so Spark ships it to the Python
+    workers without importing this module.
+    :param capacity: Maximum number of counters
+    :return: Function iterator of values -> iterator of one sketch, a
+        dictionary of value -> [count, error]
+    """
+
+    def summarise(values):
+        counters, heap, sequence = {}, [], itertools.count()
+        for value in values:
+            counter = counters.get(value)
+            if counter is not None:
+                counter[0] += 1
+                continue
+            if len(counters) < capacity:
+                counters[value] = [1, 0]
+                heapq.heappush(heap, (1, next(sequence), value))
+                continue
+            # Heap entries are only refreshed when popped, so pop until one
+            # holds the current count of its value: that value is the minimum
+            while True:
+                count, _, victim = heapq.heappop(heap)
+                if counters[victim][0] == count:
+                    break
+                heapq.heappush(heap, (counters[victim][0], next(sequence), victim))
+            del counters[victim]
+            counters[value] = [count + 1, count]
+            heapq.heappush(heap, (count + 1, next(sequence), value))
+        yield counters
+
+    return summarise
+
+
+def merge_sketches(sketches, capacity):
+    """Merge Space-Saving sketches. A value missing from a full sketch may
+    have been counted there up to that sketch's smallest count, which is
+    added to its count and error.
+    :param sketches: Iterable of dictionaries of value -> [count, error]
+    :param capacity: Maximum number of counters of the merged sketch
+    :return: dictionary of value -> [count, error]
+    """
+    sketches = list(sketches)
+    floors = [
+        min(count for count, _ in counters.values()) if len(counters) >= capacity else 0
+        for counters in sketches
+    ]
+    total_floor = sum(floors)
+    merged = {}
+    for counters, floor in zip(sketches, floors):
+        for value, (count, error) in counters.items():
+            counter = merged.setdefault(value, [total_floor, total_floor])
+            counter[0] += count - floor
+            counter[1] += error - floor
+    return dict(heapq.nlargest(capacity, merged.items(), key=lambda item: item[1][0]))
+
+
+class TopK:
+    """Rank group-by results with a limited sort, or the value counts
+    of a column with Space-Saving sketches"""
+
+    def __init__(self, top_k_config=None):
+        """
+        :param top_k_config: TOP_K section of config.yaml
+        """
+        top_k_config = top_k_config or {}
+        self.approximate = top_k_config.get("approximate", False)
+        self.sketch_capacity = top_k_config.get("sketch_capacity", 1000)
+        self._parameters = {
+            analysis_name: {
+                **DEFAULT_PARAMETERS.get(analysis_name, {}),
+                **(top_k_config.get(analysis_name) or {}),
+            }
+            for analysis_name in ANALYSIS_METHODS
+        }
+
+    def parameters(self, analysis_name):
+        """Ranking parameters of an analysis, part of its result cache key.
+        :param analysis_name: Name of the analysis, e.g. 'analysis_6'
+        :return: dictionary, empty for analyses without a configurable ranking
+        """
+        parameters = dict(self._parameters[analysis_name])
+        if parameters and self.approximate and analysis_name in APPROXIMATE_ANALYSES:
+            parameters["sketch_capacity"] = self.sketch_capacity
+        return parameters
+
+    def with_parameters(self, analysis_name, parameters):
+        """Copy ranking an analysis with some of its parameters replaced.
+        :param analysis_name: Name of the analysis, e.g. 'analysis_6'
+        :param parameters: Dictionary of parameter -> value, e.g. {'k': 10}
+        :return: TopK
+        """
+        unknown = sorted(set(parameters) - set(self._parameters[analysis_name]))
+        if unknown:
+            raise ValueError(f"{analysis_name} has no ranking parameters {unknown}")
+        top_k = copy.copy(self)
+        top_k._parameters = {
+            **self._parameters,
+            analysis_name: {**self._parameters[analysis_name], **parameters},
+        }
+        return top_k
+
+    def rank(self, df, order_column, k=None, offset=0):
+        """The k best rows of a DataFrame after the first offset, ranked
+        descending by a column with nulls last, without a global sort
+        unless every row is wanted. Ties are ranked ascending by the other
+        columns with nulls first, so the ranking is deterministic.
+        :param df: Spark DataFrame, typically a group-by result
+        :param order_column: Name of the column rows are ranked by
+        :param k: Number of rows, None for every row after offset
+        :param offset: Number of best rows to skip
+        :return: list of Rows
+        """
+        ranked = df.orderBy(
+            desc_nulls_last(order_column),
+            *[asc_nulls_first(name) for name in df.columns if name != order_column],
+        )
+        if k is None:
+            return ranked.collect()[offset:]
+        return ranked.limit(offset + k).collect()[offset:]
+
+    def counts(self, df, column, k=None, offset=0):
+        """The k most frequent values of a column after the first offset,
+        with their counts.
+        :param df: Spark DataFrame
+        :param column: Name of the column counted
+        :param k: Number of values, None for every value after offset
+        :param offset: Number of most frequent values to skip
+        :return: list of Rows (column, count)
+        """
+        if not self.approximate or k is None:
+            return self.rank(df.groupBy(column).count(), "count", k, offset)
+
+        sketch = merge_sketches(
+            df.select(column)
+            .rdd.map(lambda row: row[0])
+            .mapPartitions(space_saving(self.sketch_capacity))
+            .collect(),
+            self.sketch_capacity,
+        )
+        ranked = top_k(
+            sketch.items(), lambda item: item[1][0], k, offset, lambda item: item[0]
+        )
+        if ranked:
+            logger.info(
+                f"Approximate top {k} of {column}: counts over-estimated by at "
+                f"most {max(error for _, (_, error) in ranked)}"
+            )
+        return [Row(**{column: value, "count": count}) for value, (count, _) in ranked]
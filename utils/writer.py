@@ -0,0 +1,179 @@
+"""Output writer: sizes, compresses and writes the analysis outputs in the
+background so the next analysis can start while the previous one is saved"""
+
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.helper import load_data_to_csv
+from utils.profiling import JOB_GROUP_PROPERTY
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size_in_bytes(df):
+    """Size of a DataFrame as estimated by the Spark optimizer. The estimate
+    is exact for cached DataFrames once they have been materialised.
+    :param df: Spark DataFrame.
+    :return: Estimated size in bytes, or None if Spark gives no estimate.
+    """
+    try:
+        stats = df._jdf.queryExecution().optimizedPlan().stats()
+        return int(stats.sizeInBytes().toString())
+    except Exception:
+        return None
+
+
+class OutputWriter:
+    """Write the analysis outputs according to the WRITER section of
+    config.yaml"""
+
+    def __init__(self, writer_config=None, output_file_paths=None):
+        """
+        :param writer_config: WRITER section of config.yaml
+        :param output_file_paths: OUTPUT section of config.yaml, used to find
+            the partition_by columns configured for an output path
+        """
+        writer_config = writer_config or {}
+        self.target_file_size = writer_config.get("target_file_size_mb", 128) * 2**20
+        self.max_partitions = writer_config.get("max_partitions", 200)
+        self.compression = writer_config.get("compression", "snappy")
+        self.partition_by = {
+            output_file_paths.get(output_name): columns
+            for output_name, columns in (
+                writer_config.get("partition_by") or {}
+            ).items()
+            if output_file_paths and output_name in output_file_paths
+        }
+        self.is_async = writer_config.get("async", True)
+        max_pending_writes = writer_config.get("max_pending_writes", 4)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_pending_writes, thread_name_prefix="output-writer"
+        )
+        # Held by every submitted write until it finishes, so save blocks
+        # rather than queueing more than max_pending_writes cached outputs
+        self._pending = threading.BoundedSemaphore(max_pending_writes)
+        self._futures = []
+        # Thread ident -> futures of the writes submitted from that thread
+        self._thread_futures = {}
+        self._lock = threading.Lock()
+
+    def num_partitions_for(self, df):
+        """Number of output files for a DataFrame, one per target_file_size_mb
+        of estimated output.
+        :param df: Spark DataFrame.
+        :return: Number of partitions, None to keep the DataFrame's own.
+        """
+        size_in_bytes = estimate_size_in_bytes(df)
+        if size_in_bytes is None:
+            return None
+        return max(
+            1,
+            min(self.max_partitions, math.ceil(size_in_bytes / self.target_file_size)),
+        )
+
+    def _write(self, df, output_path, unpersist, job_group):
+        """Write one output, releasing its cached DataFrame afterwards"""
+        # Attribute the write to the job group of the analysis that asked for
+        # it, which is not inherited by the writer threads. It is set even
+        # when None and restored afterwards, so a pooled thread never passes
+        # one write's job group on to the next
+        sc = df.sparkSession.sparkContext
+        previous_job_group = sc.getLocalProperty(JOB_GROUP_PROPERTY)
+        sc.setLocalProperty(JOB_GROUP_PROPERTY, job_group)
+        try:
+            load_data_to_csv(
+                df,
+                output_path,
+                num_partitions=self.num_partitions_for(df),
+                partition_by=self.partition_by.get(output_path),
+                compression=self.compression,
+            )
+            logger.info(f"Wrote {output_path}")
+        finally:
+            sc.setLocalProperty(JOB_GROUP_PROPERTY, previous_job_group)
+            if unpersist:
+                df.unpersist()
+
+    def save(self, df, output_path, result=None):
+        """Write a DataFrame to output_path and optionally compute a result
+        from it. When a result is requested the DataFrame is cached and the
+        result action materialises it, so the write reads the cached rows
+        instead of recomputing the DataFrame. Blocks while max_pending_writes
+        writes are pending.
+        :param df: DataFrame to write.
+        :param output_path: Output path to write DF.
+        :param result: Optional function DataFrame -> value, e.g. DataFrame.count
+        :return: Value returned by result, or None.
+        """
+        value = None
+        if result is not None:
+            df = df.cache()
+            value = result(df)
+
+        job_group = df.sparkSession.sparkContext.getLocalProperty(JOB_GROUP_PROPERTY)
+        if not self.is_async:
+            self._write(df, output_path, result is not None, job_group)
+            return value
+
+        self._pending.acquire()
+        try:
+            future = self._executor.submit(
+                self._write, df, output_path, result is not None, job_group
+            )
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        with self._lock:
+            self._futures.append(future)
+            self._thread_futures.setdefault(threading.get_ident(), []).append(future)
+        return value
+
+    def when_written(self, callback):
+        """Call a function once every write submitted so far has finished,
+        right away when none is pending.
+        :param callback: Function without arguments
+        :return: None
+        """
+        with self._lock:
+            futures = [future for future in self._futures if not future.done()]
+        if not futures:
+            callback()
+            return
+
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                is_last = remaining[0] == 0
+            if is_last:
+                callback()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def wait(self, thread_only=False):
+        """Block until every pending write has finished and raise the first
+        write error, if any.
+        :param thread_only: Only wait for the writes submitted from the
+            calling thread, e.g. by one server request or streaming query
+        :return: None
+        """
+        with self._lock:
+            if thread_only:
+                futures = self._thread_futures.pop(threading.get_ident(), [])
+                submitted = set(futures)
+                self._futures = [
+                    future for future in self._futures if future not in submitted
+                ]
+            else:
+                futures, self._futures = self._futures, []
+                self._thread_futures = {}
+        errors = [future.exception() for future in futures]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]